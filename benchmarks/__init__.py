@@ -0,0 +1 @@
+"""性能計測用のベンチマークスクリプト群。`python -m benchmarks.<name>` で実行する。"""
@@ -0,0 +1,128 @@
+"""アナリティクス取り込みの負荷テスト。
+`/common/analytics/events` にバッチサイズを変えて JSON 配列を送り、受理イベント数/秒と
+1リクエストあたりの処理時間を測る。続けてライタを意図的に遅くした過負荷状態で送り続け、
+キュー深さの最大値・503 の件数・RSS の増分（メモリ上限）を確認する。
+
+    python -m benchmarks.bench_analytics_ingest --batches 1,10,100,1000 --seconds 5
+    python -m benchmarks.bench_analytics_ingest --overload-seconds 5 --slow-writer-ms 50
+
+既定では一時ディレクトリの SQLite を使う（`APP_SQLITE_PATH`/`APP_DATABASE_URL` で変更可）。
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import tempfile
+import time
+
+os.environ.setdefault("APP_SQLITE_PATH", os.path.join(tempfile.mkdtemp(), "bench_analytics.db"))
+
+import httpx  # noqa: E402
+
+from server.common import analytics  # noqa: E402
+from server.core.database import SessionLocal, create_all  # noqa: E402
+from server.core.security import create_access_token  # noqa: E402
+from server.main import create_app  # noqa: E402
+from server.models.user import Role, User  # noqa: E402
+
+
+def analyst_token() -> str:
+    create_all()
+    with SessionLocal() as db:
+        user = db.query(User).filter(User.email == "bench-analyst@example.com").first()
+        if user is None:
+            role = db.query(Role).filter(Role.name == "analyst").first() or Role(name="analyst")
+            user = User(email="bench-analyst@example.com", hashed_password="x", roles=[role])
+            db.add(user)
+            db.commit()
+        return create_access_token(str(user.id))
+
+
+def payload(batch: int) -> bytes:
+    return json.dumps(
+        [{"name": "bench.view", "session_id": f"s{i % 97}", "properties": {"i": i, "path": "/x"}} for i in range(batch)]
+    ).encode()
+
+
+async def drive(app, token: str, body: bytes, seconds: float, concurrency: int) -> dict:
+    headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
+    stats = {"requests": 0, "accepted": 0, "rejected": 0, "max_depth": 0}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        deadline = time.perf_counter() + seconds
+
+        async def worker() -> None:
+            while time.perf_counter() < deadline:
+                r = await client.post("/common/analytics/events", content=body, headers=headers)
+                stats["requests"] += 1
+                if r.status_code == 202:
+                    stats["accepted"] += r.json()["accepted"]
+                elif r.status_code == 503:
+                    stats["rejected"] += 1
+                else:
+                    raise AssertionError(r.text)
+                stats["max_depth"] = max(stats["max_depth"], analytics._writer.qsize())
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        stats["elapsed"] = time.perf_counter() - start
+    return stats
+
+
+def rss_mib() -> float:
+    """Current resident set size (Linux); falls back to the peak elsewhere."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--batches", default="1,10,100,1000")
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--overload-seconds", type=float, default=5.0)
+    parser.add_argument("--overload-batch", type=int, default=1000)
+    parser.add_argument("--slow-writer-ms", type=float, default=50.0)
+    args = parser.parse_args()
+
+    app = create_app(middleware_order=[])
+    token = analyst_token()
+
+    for batch in (int(b) for b in args.batches.split(",")):
+        body = payload(batch)
+        written_before = analytics._writer.written
+        start = time.perf_counter()
+        s = asyncio.run(drive(app, token, body, args.seconds, args.concurrency))
+        analytics.flush_analytics()
+        sustained = (analytics._writer.written - written_before) / (time.perf_counter() - start)
+        print(
+            f"batch={batch:<5d} {s['requests'] / s['elapsed']:8.0f} req/s  "
+            f"{s['elapsed'] / s['requests'] * 1e6:8.0f} us/req  "
+            f"{s['accepted'] / s['elapsed']:9.0f} accepted ev/s  {sustained:9.0f} written ev/s"
+        )
+
+    # Overload: the writer is slowed down so producers outrun it and the queue fills up
+    write = analytics._writer._write
+
+    def slow_write(rows) -> None:
+        time.sleep(args.slow_writer_ms / 1000)
+        write(rows)
+
+    analytics._writer._write = slow_write
+    rss_before = rss_mib()
+    s = asyncio.run(drive(app, token, payload(args.overload_batch), args.overload_seconds, args.concurrency))
+    print(
+        f"overload: {s['accepted']} accepted, {s['rejected']} requests rejected (503), "
+        f"max queue depth {s['max_depth']} / {analytics._writer.max_queue}, "
+        f"RSS +{rss_mib() - rss_before:.0f} MiB with the queue full"
+    )
+    analytics._writer._write = write
+    analytics.flush_analytics()
+
+
+if __name__ == "__main__":
+    main()
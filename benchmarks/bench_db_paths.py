@@ -0,0 +1,92 @@
+"""同期/非同期DBパスの負荷テスト。
+同じクエリ（ユーザ1件取得）を `get_db`（スレッドプール上の同期セッション）と
+`get_async_db`（AsyncSession）の各エンドポイントで、同じ同時実行数で叩いてスループットを比較する。
+`APP_DATABASE_URL` を設定すれば Postgres（psycopg2 / asyncpg）でも計測できる。
+
+    python -m benchmarks.bench_db_paths --requests 5000 --concurrency 64
+
+同期パスでは、プールの上限（pool_size + max_overflow）が Starlette のスレッドプール（40）より小さいと、
+チェックアウト待ちのスレッドがレスポンス直列化用のスレッドを使い切って詰まるため、既定で上限を 45 にしている。
+"""
+import argparse
+import asyncio
+import os
+import time
+
+os.environ.setdefault("APP_DB_MAX_OVERFLOW", "40")
+
+import httpx  # noqa: E402
+from fastapi import Depends, FastAPI  # noqa: E402
+from sqlalchemy import select  # noqa: E402
+from sqlalchemy.ext.asyncio import AsyncSession  # noqa: E402
+from sqlalchemy.orm import Session  # noqa: E402
+
+from server.core.database import SessionLocal, create_all, get_async_db, get_db  # noqa: E402
+from server.models.user import User  # noqa: E402
+
+
+def build_app() -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/sync/{user_id}")
+    def sync_lookup(user_id: int, db: Session = Depends(get_db)) -> dict:
+        user = db.execute(select(User.id, User.email).where(User.id == user_id)).first()
+        return {"id": user.id, "email": user.email}
+
+    @app.get("/async/{user_id}")
+    async def async_lookup(user_id: int, db: AsyncSession = Depends(get_async_db)) -> dict:
+        user = (await db.execute(select(User.id, User.email).where(User.id == user_id))).first()
+        return {"id": user.id, "email": user.email}
+
+    return app
+
+
+def seed(n: int) -> list:
+    create_all()
+    with SessionLocal() as db:
+        existing = db.scalars(select(User.id).where(User.email.like("bench-db-%"))).all()
+        if len(existing) >= n:
+            return list(existing[:n])
+        db.add_all(User(email=f"bench-db-{i}@example.com", hashed_password="x") for i in range(len(existing), n))
+        db.commit()
+        return list(db.scalars(select(User.id).where(User.email.like("bench-db-%"))).all()[:n])
+
+
+async def drive(app: FastAPI, prefix: str, ids: list, total: int, concurrency: int) -> float:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        remaining = total
+
+        async def worker() -> None:
+            nonlocal remaining
+            while remaining > 0:
+                remaining -= 1
+                r = await client.get(f"{prefix}/{ids[remaining % len(ids)]}")
+                assert r.status_code == 200, r.text
+
+        await worker_warmup(client, prefix, ids)
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return total / (time.perf_counter() - start)
+
+
+async def worker_warmup(client: httpx.AsyncClient, prefix: str, ids: list) -> None:
+    for i in ids[:50]:
+        await client.get(f"{prefix}/{i}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--users", type=int, default=1000)
+    args = parser.parse_args()
+    ids = seed(args.users)
+    app = build_app()
+    for name, prefix in (("sync", "/sync"), ("async", "/async")):
+        rps = asyncio.run(drive(app, prefix, ids, args.requests, args.concurrency))
+        print(f"{name:6s} concurrency={args.concurrency:<4d} {rps:8.0f} req/s")
+
+
+if __name__ == "__main__":
+    main()
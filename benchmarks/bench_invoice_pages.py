@@ -0,0 +1,108 @@
+"""請求一覧のページ取得レイテンシ計測。
+1テナントに `--invoices` 件を投入し、指定した深さ（先頭から何件目か）のページを
+キーセット（カーソル）と OFFSET でそれぞれ取得して、1ページあたりの時間を比較する。
+あわせて NDJSON エクスポートで全件を流したときの件数/秒と RSS の増分を測る。
+
+    python -m benchmarks.bench_invoice_pages --invoices 200000 --depths 0,1000,10000,100000,190000
+
+既定では一時ディレクトリの SQLite を使う（`APP_SQLITE_PATH`/`APP_DATABASE_URL` で変更可）。
+"""
+import argparse
+import asyncio
+import os
+import resource
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+os.environ.setdefault("APP_SQLITE_PATH", os.path.join(tempfile.mkdtemp(), "bench_invoices.db"))
+
+from sqlalchemy import insert  # noqa: E402
+
+from server.common import payments  # noqa: E402
+from server.core.database import AsyncSessionLocal, SessionLocal, create_all  # noqa: E402
+from server.models.payments import Invoice  # noqa: E402
+
+TENANT = "bench"
+
+
+def seed(n: int) -> None:
+    create_all()
+    start = datetime(2020, 1, 1)
+    with SessionLocal() as db:
+        for offset in range(0, n, 10_000):
+            db.execute(
+                insert(Invoice),
+                [
+                    {
+                        "tenant_id": TENANT,
+                        "number": f"B-{i}",
+                        "customer_id": f"c{i % 500}",
+                        "status": ("open", "paid", "void")[i % 3],
+                        "currency": "JPY",
+                        "amount_cents": i,
+                        "refunded_cents": 0,
+                        "issued_at": start + timedelta(seconds=i * 37 // 10),
+                    }
+                    for i in range(offset, min(offset + 10_000, n))
+                ],
+            )
+        db.commit()
+
+
+async def cursor_at(depth: int, page: int) -> str | None:
+    """Cursor positioned after ``depth`` rows (setup, not timed)."""
+    if depth == 0:
+        return None
+    async with AsyncSessionLocal() as db:
+        row = (await db.execute(payments.invoice_stmt(TENANT).offset(depth - 1).limit(1))).one()
+    return payments.encode_cursor(row.issued_at, row.id)
+
+
+async def time_pages(depth: int, page: int, rounds: int) -> tuple[float, float]:
+    cursor = await cursor_at(depth, page)
+    async with AsyncSessionLocal() as db:
+        start = time.perf_counter()
+        for _ in range(rounds):
+            await payments.query_invoices(db, TENANT, limit=page, cursor=cursor)
+        keyset = (time.perf_counter() - start) / rounds
+        start = time.perf_counter()
+        for _ in range(rounds):
+            rows = (await db.execute(payments.invoice_stmt(TENANT).offset(depth).limit(page))).all()
+            [payments._invoice(dict(r._mapping)) for r in rows]
+        offset = (time.perf_counter() - start) / rounds
+    return keyset, offset
+
+
+async def export_all() -> tuple[int, float]:
+    count = 0
+    start = time.perf_counter()
+    async for chunk in payments._export(payments.invoice_stmt(TENANT), "ndjson"):
+        count += chunk.count(b"\n")
+    return count, time.perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--invoices", type=int, default=200_000)
+    parser.add_argument("--depths", default="0,1000,10000,100000,190000")
+    parser.add_argument("--page", type=int, default=100)
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    seed(args.invoices)
+    print(f"seeded {args.invoices} invoices in {time.perf_counter() - started:.1f}s")
+    for depth in (int(d) for d in args.depths.split(",")):
+        if depth >= args.invoices:
+            continue
+        keyset, offset = asyncio.run(time_pages(depth, args.page, args.rounds))
+        print(f"depth {depth:>8d}  keyset {keyset * 1e3:7.2f} ms/page  offset {offset * 1e3:8.2f} ms/page")
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    count, seconds = asyncio.run(export_all())
+    grown = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss
+    print(f"ndjson export {count} rows in {seconds:.2f}s ({count / seconds:,.0f} rows/s), max RSS +{grown / 1024:.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""JSON レスポンスのシリアライズ時間のベンチマーク。
+/common/metrics・/common/logs・/common/audit/events と同じ形のペイロードを `--sizes` 件ずつ作り、
+FastAPI 既定の経路（jsonable_encoder + JSONResponse.render）と、FastJSONResponse の各エンコーダ
+（インストール済みの orjson / msgspec と標準 json）で本文を作る時間を比較する。
+
+    python -m benchmarks.bench_json_responses --sizes 100,1000,10000
+"""
+import argparse
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from server.core.responses import select_encoder
+
+
+def metrics_payload(n: int) -> Dict[str, Any]:
+    paths = [f"/service1/items/{i}" for i in range(n)]
+    return {
+        "uptime_seconds": 12345,
+        "total_requests": 10 * n,
+        "requests_by_path": {p: 10 for p in paths},
+        "requests_by_method_status": {f"GET {p} 200": 10 for p in paths},
+        "latency_by_route": {f"GET {p}": {"count": 10, "sum": 0.0123} for p in paths},
+        "counters": {f"counter_{i}_total": i for i in range(50)},
+        "gauges": {f"gauge_{i}": i * 0.5 for i in range(20)},
+        "histograms": {},
+    }
+
+
+def logs_payload(n: int) -> Dict[str, Any]:
+    logs = [
+        {
+            "seq": i,
+            "ts": 1_700_000_000.0 + i,
+            "level": "INFO",
+            "name": "server.access",
+            "message": f"GET /service1/items/{i} 200 1.2ms",
+        }
+        for i in range(n)
+    ]
+    return {"logs": logs, "next_seq": n}
+
+
+def audit_payload(n: int) -> Dict[str, Any]:
+    start = datetime(2024, 1, 1)
+    events = [
+        {
+            "id": i,
+            "ts": start + timedelta(seconds=i),
+            "actor": f"user{i % 100}@example.com",
+            "action": "user.login",
+            "target": None,
+            "meta": {"ip": "10.0.0.1", "ua": "bench"},
+        }
+        for i in range(n)
+    ]
+    return {"events": events, "next_cursor": n}
+
+
+def default_render(content: Any) -> bytes:
+    return JSONResponse(jsonable_encoder(content)).body
+
+
+def timed(render: Callable[[Any], bytes], content: Any, min_time: float = 0.5) -> float:
+    render(content)
+    runs, start = 0, time.perf_counter()
+    while True:
+        render(content)
+        runs += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            return elapsed / runs
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", default="100,1000,10000")
+    args = parser.parse_args()
+
+    renders: Dict[str, Callable[[Any], bytes]] = {"default": default_render}
+    for name in ("orjson", "msgspec", "stdlib"):
+        chosen, dumps = select_encoder(name)
+        if chosen == name:
+            renders[f"fast/{name}"] = dumps
+    for kind, build in (("metrics", metrics_payload), ("logs", logs_payload), ("audit", audit_payload)):
+        for n in map(int, args.sizes.split(",")):
+            content = build(n)
+            size = len(default_render(content))
+            base = timed(default_render, content)
+            for name, render in renders.items():
+                t = base if name == "default" else timed(render, content)
+                print(f"{kind:8s} n={n:>7,d} ({size / 1024:8.1f} KiB) {name:14s} {t * 1e3:9.3f} ms  x{base / t:5.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""アクセスログのオーバーヘッド計測。
+`/common/ping` を、アクセスログ段なし/ありのパイプラインで叩き、1リクエストあたりの増分（µs）を
+ログパイプラインのモード（direct / queue）ごとに比較する。`--jsonl` で JSON Lines シンクも有効にできる。
+あわせて、アクセスログ1件の呼び出し側（イベントループ上）のコストだけを直接測る。
+
+    python -m benchmarks.bench_logging --requests 20000
+    python -m benchmarks.bench_logging --requests 20000 --jsonl /tmp/access.jsonl
+"""
+import argparse
+import asyncio
+import logging
+import os
+import time
+
+os.environ.setdefault("APP_RATE_LIMIT_MAX", str(10**9))
+
+import httpx  # noqa: E402
+
+from server.common.utils import logging_utils  # noqa: E402
+from server.main import create_app  # noqa: E402
+
+
+async def drive(app, total: int, concurrency: int) -> float:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for _ in range(200):  # warm-up
+            await client.get("/common/ping")
+        remaining = total
+
+        async def worker() -> None:
+            nonlocal remaining
+            while remaining > 0:
+                remaining -= 1
+                r = await client.get("/common/ping")
+                assert r.status_code == 200
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return (time.perf_counter() - start) / total
+
+
+def caller_cost(n: int) -> float:
+    """Seconds per access-log call on the calling thread (what the event loop pays)."""
+    logger = logging.getLogger("server.access")
+    start = time.perf_counter()
+    for _ in range(n):
+        logger.info('%s - "%s %s" %d %.1fms', "127.0.0.1", "GET", "/common/ping", 200, 0.3)
+    return (time.perf_counter() - start) / n
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--jsonl", default=None, help="also write records to this JSON-lines file")
+    parser.add_argument("--rounds", type=int, default=3, help="best of N per configuration")
+    args = parser.parse_args()
+
+    logging.getLogger("server.access").setLevel(logging.INFO)
+    without = create_app(middleware_order=("metrics", "rate_limit"))
+    with_log = create_app(middleware_order=("metrics", "rate_limit", "access_log"))
+    for pipeline in ("direct", "queue"):
+        logging_utils.shutdown_logging()
+        logging_utils.register_handler(pipeline=pipeline, jsonl_path=args.jsonl)
+        base = min(asyncio.run(drive(without, args.requests, args.concurrency)) for _ in range(args.rounds))
+        logged = min(asyncio.run(drive(with_log, args.requests, args.concurrency)) for _ in range(args.rounds))
+        caller = caller_cost(args.requests)
+        front = logging.getLogger().handlers[-1]
+        dropped = getattr(front, "dropped", 0)
+        print(
+            f"{pipeline:6s} no access log {base * 1e6:7.1f} us/req  with access log {logged * 1e6:7.1f} us/req  "
+            f"overhead {(logged - base) * 1e6:6.1f} us/req  caller-side {caller * 1e6:5.2f} us/record  dropped {dropped}"
+        )
+    logging_utils.shutdown_logging()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""Prometheus 出力（スクレイプ）のベンチマーク。
+系列数 10k/100k/1M で、毎回全系列を描画する旧方式と、変化した系列だけを再描画する増分方式の
+スクレイプ時間と割り当てメモリ（tracemalloc のピーク）を比較する。
+増分方式の時間は --churn 分の系列の再描画を含み、メモリは全系列が再利用される定常状態の値。
+
+    python -m benchmarks.bench_metrics_exposition --series 10000,100000,1000000 --churn 0.01
+"""
+import argparse
+import gc
+import random
+import time
+import tracemalloc
+from typing import Callable, Dict
+
+from server.common.metrics import Exposition, MetricsRegistry, _fmt, _label_str
+
+
+def full_render(snapshot: Dict[str, dict]) -> bytes:
+    # Re-renders every series on every scrape, as render_prometheus did before.
+    lines = []
+    for name, m in snapshot.items():
+        full = "takachan_" + name
+        lines.append(f"# HELP {full} {m['help']}")
+        lines.append(f"# TYPE {full} {m['type']}")
+        for labels, value in m["series"].items():
+            lines.append(f"{full}{_label_str(m['labelnames'], labels)} {_fmt(value)}")
+    return ("\n".join(lines) + "\n").encode()
+
+
+def measure(render: Callable[[Dict[str, dict]], bytes], snapshot: Dict[str, dict]) -> tuple:
+    gc.collect()
+    start = time.perf_counter()
+    render(snapshot)
+    elapsed = time.perf_counter() - start
+    gc.collect()
+    tracemalloc.start()
+    render(snapshot)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def bench(series: int, churn: float) -> None:
+    registry = MetricsRegistry(max_series=series)
+    counter = registry.counter("http_requests_by_method_status_total", "Requests", ("method", "path", "status"))
+    labels = [("GET", f"/service1/items/{{item_id}}/v{i}", "200") for i in range(series)]
+    for lb in labels:
+        counter.inc(lb)
+
+    exposition = Exposition()
+    exposition.render(registry.snapshot())  # warm the per-series cache
+    for lb in random.sample(labels, int(series * churn)):
+        counter.inc(lb)
+    snapshot = registry.snapshot()
+
+    for name, render in (("full", full_render), ("incremental", exposition.render)):
+        elapsed, peak = measure(render, snapshot)
+        print(f"series={series:>9,d} {name:12s} scrape={elapsed * 1e3:9.1f} ms  alloc_peak={peak / 2**20:8.1f} MiB")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--series", default="10000,100000,1000000")
+    parser.add_argument("--churn", type=float, default=0.01, help="fraction of series that change between scrapes")
+    args = parser.parse_args()
+    for n in args.series.split(","):
+        bench(int(n), args.churn)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""ミドルウェアスタックのベンチマーク。
+旧構成（`@app.middleware("http")` のレート制限 + メトリクスを重ねたもの）と、
+統合した純ASGIミドルウェアで `/common/ping` を叩き、リクエスト/秒と p50/p99 を比較する。
+サーバ/ネットワークを含まない、アプリ内（ASGI 直接呼び出し）での計測。
+
+    python -m benchmarks.bench_middleware --requests 20000 --concurrency 32
+"""
+import argparse
+import asyncio
+import os
+import time
+
+os.environ.setdefault("APP_RATE_LIMIT_MAX", str(10**9))
+
+import httpx  # noqa: E402
+
+from server.common.metrics import add_metrics_middleware  # noqa: E402
+from server.core.config import settings  # noqa: E402
+from server.core.rate_limit import RateLimiter, add_rate_limit_middleware  # noqa: E402
+from server.main import create_app  # noqa: E402
+
+
+def legacy_app():
+    app = create_app(middleware_order=())
+    add_rate_limit_middleware(app, RateLimiter(max_requests=settings.rate_limit_max))
+    add_metrics_middleware(app)
+    return app
+
+
+def fused_app():
+    return create_app(middleware_order=("metrics", "rate_limit"))
+
+
+async def drive(app, total: int, concurrency: int) -> tuple:
+    latencies = []
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for _ in range(200):  # warm-up
+            await client.get("/common/ping")
+
+        remaining = total
+
+        async def worker() -> None:
+            nonlocal remaining
+            while remaining > 0:
+                remaining -= 1
+                t0 = time.perf_counter()
+                r = await client.get("/common/ping")
+                latencies.append(time.perf_counter() - t0)
+                assert r.status_code == 200
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+    latencies.sort()
+    return len(latencies) / elapsed, latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.99)]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    args = parser.parse_args()
+    for name, factory in (("legacy", legacy_app), ("fused", fused_app)):
+        rps, p50, p99 = asyncio.run(drive(factory(), args.requests, args.concurrency))
+        print(f"{name:7s} {rps:9.0f} req/s  p50={p50 * 1e3:6.2f} ms  p99={p99 * 1e3:6.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""トークン検証コストのベンチマーク。
+同じアクセストークンを python-jose の `jwt.decode`、鍵リングによる検証（標準ライブラリ HMAC）、
+検証済みトークンキャッシュ経由（`decode_token`）で繰り返し検証し、1回あたりの時間を比較する。
+キャッシュ有りの場合も、異なるトークンが多数ある状態（`--tokens`）を再現する。
+
+    python -m benchmarks.bench_token_decode --iterations 100000 --tokens 1000
+"""
+import argparse
+import time
+
+from jose import jwt
+
+from server.core import security
+from server.core.config import settings
+
+
+def per_call(fn, tokens: list, iterations: int) -> float:
+    n = len(tokens)
+    start = time.perf_counter()
+    for i in range(iterations):
+        fn(tokens[i % n])
+    return (time.perf_counter() - start) / iterations
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--iterations", type=int, default=100_000)
+    parser.add_argument("--tokens", type=int, default=1000, help="distinct tokens cycled through")
+    args = parser.parse_args()
+
+    tokens = [security.create_access_token(str(i)) for i in range(args.tokens)]
+    security.clear_token_cache()
+    for t in tokens:  # warm the cache
+        security.decode_token(t)
+    results = [
+        ("python-jose", per_call(lambda t: jwt.decode(t, settings.secret_key, algorithms=["HS256"]), tokens, args.iterations)),
+        ("keyring (miss)", per_call(security._verify_jwt, tokens, args.iterations)),
+        ("cached (hit)", per_call(security.decode_token, tokens, args.iterations)),
+    ]
+    for name, seconds in results:
+        print(f"{name:16s} {seconds * 1e6:7.2f} us/decode")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,255 @@
 """/common/analytics 配下のアナリティクス共通API。
-イベントトラッキングなど、横断利用される分析系エンドポイントを提供する。"""
-from fastapi import APIRouter, Depends
+イベントトラッキングなど、横断利用される分析系エンドポイントを提供する。
+イベントは JSON（単体/配列）または NDJSON で受け取り、有界キューに積んで
+バックグラウンドのライタがまとめて一括 INSERT する。キューが溢れる場合は 503 で押し返す。
+書き込み時に分/時/日のロールアップも更新し、集計クエリはロールアップから返す。
+生イベントは pyarrow があれば Parquet でエクスポートできる。"""
+import json
+import os
+import tempfile
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Literal
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse
+from pydantic import ValidationError
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.background import BackgroundTask
 
 from server.common.deps import require_roles
-from server.models.user import User
+from server.common.metrics import REGISTRY, inc_counter
+from server.common.principal import Principal
+from server.common.utils.batch_writer import BatchWriter
+from server.core.config import settings
+from server.common.analytics_rollups import BUCKET_SECONDS, apply_rollups, query_rollups
+from server.core.database import SessionLocal, get_async_db
+from server.models.analytics import AnalyticsEvent
+from server.schemas.analytics import EventBatch, EventIn, IngestResult
+
+
+router = APIRouter(prefix="/common/analytics", tags=["analytics"])
+
+NDJSON_TYPES = {"application/x-ndjson", "application/ndjson", "application/jsonl"}
+# Parse bigger bodies off the event loop
+_THREADPOOL_PARSE_BYTES = 64 * 1024
+
+
+def _write_events(rows: List[Dict[str, object]]) -> None:
+    # One executemany; SQLAlchemy batches it into multi-row INSERTs (insertmanyvalues)
+    with SessionLocal() as db:
+        db.execute(insert(AnalyticsEvent), rows)
+        if settings.analytics_rollups_enabled:
+            apply_rollups(db, rows)
+        db.commit()
+    inc_counter("analytics_events_written_total", len(rows))
+
+
+_writer: BatchWriter[Dict[str, object]] = BatchWriter(
+    _write_events,
+    max_batch=settings.analytics_batch_size,
+    max_delay=settings.analytics_flush_interval,
+    max_queue=settings.analytics_queue_max,
+    name="analytics-writer",
+)
+REGISTRY.gauge("analytics_queue_depth", "Analytics events waiting to be written", fn=lambda: _writer.qsize())
+
+
+def flush_analytics() -> int:
+    """Write queued events now (tests, shutdown)."""
+    return _writer.flush()
+
+
+def shutdown_analytics() -> None:
+    _writer.stop()
+
+
+def _utc(ts: datetime | None, default: datetime) -> datetime:
+    if ts is None:
+        return default
+    return ts.astimezone(timezone.utc) if ts.tzinfo else ts
+
+
+def _parse(body: bytes, ndjson: bool) -> List[EventIn]:
+    if ndjson:
+        events = []
+        for lineno, line in enumerate(body.splitlines(), 1):
+            if line.strip():
+                try:
+                    events.append(EventIn.model_validate_json(line))
+                except ValidationError as exc:
+                    raise _invalid(exc, prefix=("line", lineno))
+        return events
+    stripped = body.lstrip()
+    if not stripped:
+        return []
+    try:
+        if stripped[:1] == b"[":
+            return EventBatch.validate_json(body)
+        return [EventIn.model_validate_json(body)]
+    except ValidationError as exc:
+        raise _invalid(exc)
+
+
+def _invalid(exc: ValidationError, prefix: tuple = ()) -> HTTPException:
+    errors = [
+        {"loc": [*prefix, *e["loc"]], "msg": e["msg"], "type": e["type"]}
+        for e in exc.errors(include_url=False, include_context=False, include_input=False)
+    ]
+    return HTTPException(status_code=422, detail=errors)
+
+
+@router.post("/events", status_code=status.HTTP_202_ACCEPTED, response_model=IngestResult)
+async def track_event(request: Request, principal: Principal = Depends(require_roles(["analyst", "admin"]))):
+    length = request.headers.get("content-length")
+    if length is not None:
+        try:
+            declared = int(length)
+        except ValueError:
+            declared = -1
+        if declared < 0:
+            raise HTTPException(status_code=400, detail="Invalid Content-Length")
+        if declared > settings.analytics_max_request_bytes:
+            raise HTTPException(status_code=413, detail="Request body too large")
+    body = await request.body()
+    if len(body) > settings.analytics_max_request_bytes:
+        raise HTTPException(status_code=413, detail="Request body too large")
+
+    ndjson = request.headers.get("content-type", "").split(";", 1)[0].strip().lower() in NDJSON_TYPES
+    if len(body) > _THREADPOOL_PARSE_BYTES:
+        events = await run_in_threadpool(_parse, body, ndjson)
+    else:
+        events = _parse(body, ndjson)
+    if len(events) > settings.analytics_max_events_per_request:
+        raise HTTPException(
+            status_code=413,
+            detail=f"At most {settings.analytics_max_events_per_request} events per request",
+        )
+
+    now = datetime.now(timezone.utc)
+    rows = [
+        {
+            "ts": _utc(e.ts, now),
+            "name": e.name,
+            "user_id": principal.id,
+            "session_id": e.session_id,
+            "properties": e.properties,
+        }
+        for e in events
+    ]
+    if not _writer.submit_many(rows):
+        inc_counter("analytics_events_rejected_total", len(rows))
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Analytics ingestion queue is full",
+            headers={"Retry-After": "1"},
+        )
+    inc_counter("analytics_events_accepted_total", len(rows))
+    return {"accepted": len(rows)}
+
+
+@router.get("/rollups")
+async def rollups(
+    granularity: Literal["minute", "hour", "day"] = "hour",
+    start: datetime | None = None,
+    end: datetime | None = None,
+    name: str | None = None,
+    db: AsyncSession = Depends(get_async_db),
+    _: Principal = Depends(require_roles(["analyst", "admin"])),
+):
+    """Counts and approximate uniques per bucket over [start, end), read from the rollup table."""
+    end = end or datetime.now(timezone.utc)
+    start = start or end - timedelta(days=1)
+    if start.tzinfo is None:
+        start = start.replace(tzinfo=timezone.utc)
+    if end.tzinfo is None:
+        end = end.replace(tzinfo=timezone.utc)
+    if end <= start:
+        raise HTTPException(status_code=400, detail="end must be after start")
+    if (end - start).total_seconds() / BUCKET_SECONDS[granularity] > settings.analytics_max_query_buckets:
+        raise HTTPException(status_code=400, detail="Range too large for this granularity")
+    series = await query_rollups(db, granularity, start, end, name)
+    return {"granularity": granularity, "start": start.isoformat(), "end": end.isoformat(), "series": series}
+
+
+_PARQUET_CHUNK = 50_000
 
 
-router = APIRouter()
+def _export_parquet(path: str, start: datetime | None, end: datetime | None, name: str | None) -> int:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
 
+    schema = pa.schema(
+        [
+            ("id", pa.int64()),
+            ("ts", pa.timestamp("us", tz="UTC")),
+            ("name", pa.string()),
+            ("user_id", pa.int64()),
+            ("session_id", pa.string()),
+            ("properties", pa.string()),
+        ]
+    )
+    stmt = select(
+        AnalyticsEvent.id,
+        AnalyticsEvent.ts,
+        AnalyticsEvent.name,
+        AnalyticsEvent.user_id,
+        AnalyticsEvent.session_id,
+        AnalyticsEvent.properties,
+    ).order_by(AnalyticsEvent.id)
+    if start is not None:
+        stmt = stmt.where(AnalyticsEvent.ts >= _utc(start, start))
+    if end is not None:
+        stmt = stmt.where(AnalyticsEvent.ts < _utc(end, end))
+    if name is not None:
+        stmt = stmt.where(AnalyticsEvent.name == name)
+    total = 0
+    with SessionLocal() as db, pq.ParquetWriter(path, schema, compression="zstd") as writer:
+        result = db.execute(stmt.execution_options(yield_per=_PARQUET_CHUNK))
+        for chunk in result.partitions():
+            ids, ts, names, users, sessions, props = zip(*chunk)
+            writer.write_batch(
+                pa.record_batch(
+                    [
+                        pa.array(ids, pa.int64()),
+                        pa.array([t if t.tzinfo else t.replace(tzinfo=timezone.utc) for t in ts], schema.field("ts").type),
+                        pa.array(names, pa.string()),
+                        pa.array(users, pa.int64()),
+                        pa.array(sessions, pa.string()),
+                        pa.array([json.dumps(p) if p is not None else None for p in props], pa.string()),
+                    ],
+                    schema=schema,
+                )
+            )
+            total += len(ids)
+    return total
 
-@router.post("/events")
-def track_event(_: User = Depends(require_roles(["analyst", "admin"]))):
-    return {"ok": True}
 
+@router.get("/export")
+def export_events(
+    start: datetime | None = None,
+    end: datetime | None = None,
+    name: str | None = None,
+    fmt: Literal["parquet"] = Query("parquet", alias="format"),
+    _: Principal = Depends(require_roles(["analyst", "admin"])),
+):
+    """Raw events as a Parquet file (requires the optional ``pyarrow`` package)."""
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        raise HTTPException(status_code=501, detail="Parquet export requires pyarrow")
+    fd, path = tempfile.mkstemp(suffix=".parquet")
+    os.close(fd)
+    try:
+        rows = _export_parquet(path, start, end, name)
+    except Exception:
+        os.unlink(path)
+        raise
+    return FileResponse(
+        path,
+        media_type="application/vnd.apache.parquet",
+        filename="analytics_events.parquet",
+        headers={"X-Row-Count": str(rows)},
+        background=BackgroundTask(os.unlink, path),
+    )
@@ -0,0 +1,152 @@
+"""アナリティクスの時間バケット集計（ロールアップ）。
+取り込みライタが生イベントを書いた同じトランザクションで、分/時/日ごとのイベント数と
+HyperLogLog によるユニーク数を加算し、範囲クエリは生イベントを読まずにバケット数ぶんだけ読む。"""
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Mapping, Optional, Tuple
+
+from sqlalchemy import bindparam, select, tuple_, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from server.common.utils.hll import HyperLogLog
+from server.core.config import settings
+from server.models.analytics import AnalyticsRollup
+
+
+_TRUNCATE = {
+    "minute": dict(second=0, microsecond=0),
+    "hour": dict(minute=0, second=0, microsecond=0),
+    "day": dict(hour=0, minute=0, second=0, microsecond=0),
+}
+
+BUCKET_SECONDS = {"minute": 60, "hour": 3600, "day": 86400}
+
+Key = Tuple[str, str, datetime]
+
+_KEYS_PER_SELECT = 1000
+
+
+def _naive_utc(ts: datetime) -> datetime:
+    return ts.astimezone(timezone.utc).replace(tzinfo=None) if ts.tzinfo is not None else ts
+
+
+def bucket_start(ts: datetime, granularity: str) -> datetime:
+    """Naive UTC start of the bucket containing ``ts``."""
+    return _naive_utc(ts).replace(**_TRUNCATE[granularity])
+
+
+def _distinct_id(row: Mapping[str, object]) -> object:
+    return row.get("session_id") or row.get("user_id")
+
+
+def aggregate(rows: Iterable[Mapping[str, object]]) -> Dict[Key, Tuple[int, HyperLogLog]]:
+    """Fold a batch of raw event rows into per-bucket (count, sketch) deltas."""
+    # Group by (name, minute) on epoch seconds first; hour/day buckets are derived per group, not per event
+    minutes: Dict[Tuple[str, int], List[Optional[int]]] = {}
+    for row in rows:
+        ts = row["ts"]
+        if ts.tzinfo is None:
+            ts = ts.replace(tzinfo=timezone.utc)
+        epoch = int(ts.timestamp())
+        distinct = _distinct_id(row)
+        minutes.setdefault((row["name"], epoch - epoch % 60), []).append(
+            HyperLogLog.hash(distinct) if distinct is not None else None
+        )
+    deltas: Dict[Key, Tuple[int, HyperLogLog]] = {}
+    for (name, minute), hashes in minutes.items():
+        for granularity, seconds in BUCKET_SECONDS.items():
+            bucket = datetime.fromtimestamp(minute - minute % seconds, timezone.utc).replace(tzinfo=None)
+            count, sketch = deltas.get((granularity, name, bucket)) or (0, HyperLogLog(settings.analytics_hll_precision))
+            for h in hashes:
+                if h is not None:
+                    sketch.add_hash(h)
+            deltas[(granularity, name, bucket)] = (count + len(hashes), sketch)
+    return deltas
+
+
+def apply_rollups(db: Session, rows: List[Mapping[str, object]]) -> None:
+    """Add a batch to the rollup tables inside the caller's transaction.
+
+    Missing buckets are created first (ON CONFLICT DO NOTHING), then the touched
+    rows are read with FOR UPDATE, merged in Python and written back, so
+    concurrent writers in other workers cannot lose each other's updates. On
+    SQLite the caller has already written in this transaction and therefore
+    holds the database write lock.
+    """
+    deltas = aggregate(rows)
+    if not deltas:
+        return
+    dialect = db.get_bind().dialect.name
+    insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+    db.execute(
+        insert(AnalyticsRollup).on_conflict_do_nothing(),
+        [{"granularity": g, "name": n, "bucket": b, "count": 0, "uniques": b""} for g, n, b in deltas],
+    )
+    key = tuple_(AnalyticsRollup.granularity, AnalyticsRollup.name, AnalyticsRollup.bucket)
+    keys = list(deltas)
+    params = []
+    # Chunked to stay under the bind-parameter limit (3 per key)
+    for i in range(0, len(keys), _KEYS_PER_SELECT):
+        existing = db.execute(
+            select(
+                AnalyticsRollup.granularity,
+                AnalyticsRollup.name,
+                AnalyticsRollup.bucket,
+                AnalyticsRollup.count,
+                AnalyticsRollup.uniques,
+            )
+            .where(key.in_(keys[i : i + _KEYS_PER_SELECT]))
+            .with_for_update()
+        )
+        for g, n, b, count, uniques in existing:
+            added, sketch = deltas[(g, n, b)]
+            merged = sketch.merge(HyperLogLog.from_bytes(uniques, sketch.p)) if uniques else sketch
+            params.append({"g": g, "n": n, "b": b, "count": count + added, "uniques": merged.to_bytes()})
+    db.connection().execute(
+        update(AnalyticsRollup.__table__)
+        .where(
+            AnalyticsRollup.granularity == bindparam("g"),
+            AnalyticsRollup.name == bindparam("n"),
+            AnalyticsRollup.bucket == bindparam("b"),
+        )
+        .values(count=bindparam("count"), uniques=bindparam("uniques")),
+        params,
+    )
+
+
+async def query_rollups(
+    db: AsyncSession,
+    granularity: str,
+    start: datetime,
+    end: datetime,
+    name: Optional[str] = None,
+) -> List[Dict[str, object]]:
+    """Per-name series over [start, end) plus totals; reads one row per bucket."""
+    stmt = (
+        select(AnalyticsRollup.name, AnalyticsRollup.bucket, AnalyticsRollup.count, AnalyticsRollup.uniques)
+        .where(
+            AnalyticsRollup.granularity == granularity,
+            AnalyticsRollup.bucket >= bucket_start(start, granularity),
+            AnalyticsRollup.bucket < _naive_utc(end),
+        )
+        .order_by(AnalyticsRollup.name, AnalyticsRollup.bucket)
+    )
+    if name is not None:
+        stmt = stmt.where(AnalyticsRollup.name == name)
+    series: Dict[str, Dict[str, object]] = {}
+    totals: Dict[str, HyperLogLog] = {}
+    for row_name, bucket, count, uniques in await db.execute(stmt):
+        sketch = HyperLogLog.from_bytes(uniques, settings.analytics_hll_precision)
+        entry = series.get(row_name)
+        if entry is None:
+            entry = series[row_name] = {"name": row_name, "buckets": [], "count": 0}
+            totals[row_name] = HyperLogLog(sketch.p)
+        entry["buckets"].append(
+            {"bucket": bucket.replace(tzinfo=timezone.utc).isoformat(), "count": count, "uniques": sketch.count()}
+        )
+        entry["count"] += count
+        totals[row_name].merge(sketch)
+    for row_name, entry in series.items():
+        entry["uniques"] = totals[row_name].count()
+    return list(series.values())
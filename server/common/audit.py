@@ -1,11 +1,20 @@
-from collections import deque
 from dataclasses import dataclass, asdict
 from datetime import datetime, timezone
-from typing import Deque, Dict, List
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from server.common.metrics import REGISTRY, inc_counter
+from server.common.utils.batch_writer import BatchWriter
+from server.core.config import settings
+from server.core.database import SessionLocal
+from server.models.audit import AuditLog
 
 
 @dataclass
 class AuditEvent:
+    id: int
     ts: str
     actor: str | None
     action: str
@@ -13,15 +22,71 @@ class AuditEvent:
     meta: Dict[str, object] | None
 
 
-_events: Deque[AuditEvent] = deque(maxlen=1000)
+def _write_batch(rows: List[Dict[str, object]]) -> None:
+    # executemany of one INSERT; no ORM unit of work per event
+    with SessionLocal() as db:
+        db.execute(insert(AuditLog), rows)
+        db.commit()
+    inc_counter("audit_events_written_total", len(rows))
+
+
+_writer: BatchWriter[Dict[str, object]] = BatchWriter(
+    _write_batch,
+    max_batch=settings.audit_batch_size,
+    max_delay=settings.audit_flush_interval,
+    max_queue=settings.audit_queue_max,
+    name="audit-writer",
+)
+REGISTRY.gauge("audit_queue_depth", "Audit events waiting to be written", fn=lambda: _writer.qsize())
 
 
 def record_event(action: str, actor: str | None = None, target: str | None = None, meta: Dict[str, object] | None = None) -> None:
-    ts = datetime.now(timezone.utc).isoformat()
-    _events.append(AuditEvent(ts=ts, actor=actor, action=action, target=target, meta=meta))
+    row = {"ts": datetime.now(timezone.utc), "actor": actor, "action": action, "target": target, "meta": meta}
+    if not _writer.submit(row):
+        inc_counter("audit_events_dropped_total")
+
+
+def flush_events() -> int:
+    """Write queued events now (tests, shutdown)."""
+    return _writer.flush()
+
+
+def shutdown_audit() -> None:
+    _writer.stop()
+
+
+def _event(row: AuditLog) -> Dict[str, object]:
+    ts = row.ts if row.ts.tzinfo else row.ts.replace(tzinfo=timezone.utc)
+    return asdict(AuditEvent(id=row.id, ts=ts.isoformat(), actor=row.actor, action=row.action, target=row.target, meta=row.meta))
+
 
+async def query_events(
+    db: AsyncSession,
+    limit: int = 100,
+    cursor: Optional[int] = None,
+    actor: Optional[str] = None,
+    action: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+) -> Tuple[List[Dict[str, object]], Optional[int]]:
+    """Newest first. Returns one page and the cursor for the next (older) page, if any.
 
-def recent_events(limit: int = 100) -> List[Dict[str, object]]:
-    items = list(_events)
-    return [asdict(e) for e in items[-limit:]]
-"""共通監査ログ（簡易インメモリ）。\nイベント記録と直近取得のヘルパーを提供する。"""
+    Keyset pagination on ``id`` keeps every page an index range scan regardless of depth.
+    """
+    stmt = select(AuditLog).order_by(AuditLog.id.desc()).limit(limit + 1)
+    if cursor is not None:
+        stmt = stmt.where(AuditLog.id < cursor)
+    if actor is not None:
+        stmt = stmt.where(AuditLog.actor == actor)
+    if action is not None:
+        stmt = stmt.where(AuditLog.action == action)
+    if since is not None:
+        stmt = stmt.where(AuditLog.ts >= since)
+    if until is not None:
+        stmt = stmt.where(AuditLog.ts < until)
+    rows = (await db.scalars(stmt)).all()
+    next_cursor = rows[limit - 1].id if len(rows) > limit else None
+    return [_event(r) for r in rows[:limit]], next_cursor
+"""共通監査ログ。
+イベントはメモリ上の有界キューに積み、バックグラウンドでまとめて DB（audit_logs）へ書き込む。
+一覧はカーソル（id）によるキーセットページングと actor/action/期間の絞り込みに対応する。"""
@@ -1,74 +1,258 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+import os
+import secrets
+from datetime import datetime, timezone
+from typing import List, Literal
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
 
 from server.core.config import settings
-from server.core.database import get_db
-from server.core.security import (
-    create_access_token,
-    create_refresh_token,
-    hash_password,
-    verify_password,
-    decode_token,
+from server.core.database import get_async_db
+from server.core.security import hash_password_async, verify_password_async, decode_token
+from server.core import security
+from server.models.user import Permission, User, Role
+from server.models.user_import import UserImportJob
+from server.schemas.auth import (
+    RoleOut,
+    RoleUpdate,
+    RolesUpdate,
+    TokenPair,
+    TokenRefresh,
+    UserCreate,
+    UserImportJobOut,
+    UserOut,
 )
-from server.models.user import User, Role
-from server.schemas.auth import UserCreate, UserOut, TokenPair, TokenRefresh
-from server.common.deps import get_current_user
+from server.common.deps import get_current_principal, require_roles
+from server.common.permissions import PermissionTable, compile_permissions_async, current_table, permission_names
+from server.common.principal import Principal, invalidate_principal
+from server.common.refresh_tokens import RefreshTokenError, issue_tokens, revoke_family, rotate
+from server.common.response_cache import etag_matches
+from server.common import user_import
 
 
-router = APIRouter()
+router = APIRouter(prefix="/common/auth", tags=["auth"])
 
 
-@router.post("/register", response_model=UserOut)
-def register(payload: UserCreate, db: Session = Depends(get_db)):
-    exists = db.query(User).filter(User.email == payload.email).first()
-    if exists:
-        raise HTTPException(status_code=400, detail="Email already registered")
-    user = User(email=payload.email, hashed_password=hash_password(payload.password))
-    # assign default roles
-    role_objs = (
-        db.query(Role).filter(Role.name.in_(settings.default_roles)).all()
-        if settings.default_roles
-        else []
-    )
+async def _resolve_roles(db: AsyncSession, names: List[str]) -> List[Role]:
+    role_objs = list((await db.scalars(select(Role).where(Role.name.in_(names)))).all()) if names else []
     # Ensure roles exist
     existing_names = {r.name for r in role_objs}
-    to_create = [name for name in settings.default_roles if name not in existing_names]
+    to_create = [name for name in names if name not in existing_names]
     for name in to_create:
         r = Role(name=name)
         db.add(r)
-        db.flush()
+        await db.flush()
         role_objs.append(r)
-    user.roles = role_objs
+    return role_objs
+
+
+@router.post("/register", response_model=UserOut)
+async def register(payload: UserCreate, db: AsyncSession = Depends(get_async_db)):
+    exists = await db.scalar(select(User.id).where(User.email == payload.email))
+    if exists:
+        raise HTTPException(status_code=400, detail="Email already registered")
+    user = User(email=payload.email, hashed_password=await hash_password_async(payload.password))
+    # assign default roles
+    user.roles = await _resolve_roles(db, settings.default_roles)
     db.add(user)
-    db.commit()
-    db.refresh(user)
+    await db.commit()
+    invalidate_principal(str(user.id))
     return UserOut(id=user.id, email=user.email, roles=[r.name for r in user.roles])
 
 
 @router.post("/login", response_model=TokenPair)
-def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.email == form_data.username).first()
-    if not user or not verify_password(form_data.password, user.hashed_password):
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_async_db)):
+    user = await db.scalar(select(User).where(User.email == form_data.username))
+    if not user or not await verify_password_async(form_data.password, user.hashed_password):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Incorrect credentials")
-    access = create_access_token(str(user.id))
-    refresh = create_refresh_token(str(user.id))
+    access, refresh = await issue_tokens(db, user.id)
     return TokenPair(access_token=access, refresh_token=refresh)
 
 
-@router.post("/refresh", response_model=TokenPair)
-def refresh_token(payload: TokenRefresh):
+def _refresh_claims(token: str) -> dict:
     try:
-        data = decode_token(payload.refresh_token)
+        data = decode_token(token)
     except ValueError:
         raise HTTPException(status_code=401, detail="Invalid refresh token")
     if data.get("type") != "refresh":
         raise HTTPException(status_code=401, detail="Invalid token type")
-    user_id = data.get("sub")
-    return TokenPair(access_token=create_access_token(user_id), refresh_token=create_refresh_token(user_id))
+    return data
+
+
+@router.post("/refresh", response_model=TokenPair)
+async def refresh_token(payload: TokenRefresh, db: AsyncSession = Depends(get_async_db)):
+    # Each refresh token is single-use: it is spent here and replaced by the next one of its family
+    try:
+        access, refresh = await rotate(db, _refresh_claims(payload.refresh_token))
+    except RefreshTokenError:
+        raise HTTPException(status_code=401, detail="Invalid refresh token")
+    return TokenPair(access_token=access, refresh_token=refresh)
+
+
+@router.post("/logout", status_code=204)
+async def logout(payload: TokenRefresh, db: AsyncSession = Depends(get_async_db)) -> Response:
+    # Revokes the whole family: its refresh tokens and the access tokens issued with them
+    family = _refresh_claims(payload.refresh_token).get("fam")
+    if family:
+        await revoke_family(db, family)
+    return Response(status_code=204)
 
 
 @router.get("/me", response_model=UserOut)
-def me(user: User = Depends(get_current_user)):
+def me(user: Principal = Depends(get_current_principal)):
+    return UserOut(id=user.id, email=user.email, roles=sorted(user.roles))
+
+
+@router.put("/users/{user_id}/roles", response_model=UserOut)
+async def set_user_roles(
+    user_id: int,
+    payload: RolesUpdate,
+    db: AsyncSession = Depends(get_async_db),
+    _: Principal = Depends(require_roles(["admin"])),
+):
+    user = await db.scalar(select(User).options(selectinload(User.roles)).where(User.id == user_id))
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    user.roles = await _resolve_roles(db, payload.roles)
+    await db.commit()
+    # cached principals carry role names, so drop the stale entry
+    invalidate_principal(str(user.id))
     return UserOut(id=user.id, email=user.email, roles=[r.name for r in user.roles])
-"""/common/auth 配下の認証API。\nユーザ登録・ログイン・トークン更新・ユーザ情報取得を提供する。"""
+
+
+async def _resolve_permissions(db: AsyncSession, names: List[str]) -> List[Permission]:
+    found = list((await db.scalars(select(Permission).where(Permission.name.in_(names)))).all()) if names else []
+    known = {p.name for p in found}
+    missing = [Permission(name=name) for name in dict.fromkeys(names) if name not in known]
+    db.add_all(missing)
+    return found + missing
+
+
+def _role_out(role: Role, table: PermissionTable) -> RoleOut:
+    return RoleOut(
+        name=role.name,
+        permissions=sorted(p.name for p in role.permissions),
+        inherits=sorted(r.name for r in role.parents),
+        effective_permissions=permission_names(table.role_masks.get(role.name, 0)),
+    )
+
+
+@router.get("/roles", response_model=List[RoleOut])
+async def list_roles(db: AsyncSession = Depends(get_async_db), _: Principal = Depends(require_roles(["admin"]))):
+    roles = await db.scalars(
+        select(Role).options(selectinload(Role.permissions), selectinload(Role.parents)).order_by(Role.name)
+    )
+    table = current_table()
+    return [_role_out(role, table) for role in roles]
+
+
+@router.put("/roles/{name}", response_model=RoleOut)
+async def update_role(
+    name: str,
+    payload: RoleUpdate,
+    db: AsyncSession = Depends(get_async_db),
+    _: Principal = Depends(require_roles(["admin"])),
+):
+    """Create or replace a role's own permissions and parent roles, then recompile the graph."""
+    role = await db.scalar(
+        select(Role).options(selectinload(Role.permissions), selectinload(Role.parents)).where(Role.name == name)
+    )
+    if role is None:
+        role = Role(name=name, permissions=[], parents=[])
+        db.add(role)
+    role.permissions = await _resolve_permissions(db, payload.permissions)
+    role.parents = await _resolve_roles(db, [n for n in payload.inherits if n != name])
+    await db.commit()
+    table = await compile_permissions_async(db)
+    return _role_out(role, table)
+
+
+def _job_out(job: UserImportJob) -> UserImportJobOut:
+    return UserImportJobOut(
+        id=job.id,
+        status=job.status,
+        processed=job.processed,
+        created=job.created,
+        failed=job.failed,
+        errors=job.errors or [],
+        message=job.message,
+    )
+
+
+@router.post("/users/import", response_model=UserImportJobOut, status_code=202)
+async def import_users(
+    request: Request,
+    fmt: Literal["csv", "ndjson"] | None = Query(None, alias="format"),
+    db: AsyncSession = Depends(get_async_db),
+    admin: Principal = Depends(require_roles(["admin"])),
+):
+    """Start a bulk import: CSV (``email,password,roles`` with ``;``-separated roles) or NDJSON rows."""
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    fmt = fmt or ("csv" if content_type in ("text/csv", "application/csv") else "ndjson" if "json" in content_type else None)
+    if fmt is None:
+        raise HTTPException(status_code=415, detail="Send text/csv or application/x-ndjson, or pass ?format=")
+    job_id = secrets.token_hex(16)
+    path = user_import.spool_path(job_id, fmt)
+    # Stream the upload to disk; the job re-reads it (and can resume from it) in the background
+    size = 0
+    f = await run_in_threadpool(user_import.open_spool, path)
+    try:
+        async for chunk in request.stream():
+            size += len(chunk)
+            if size > settings.user_import_max_bytes:
+                raise HTTPException(status_code=413, detail=f"Upload exceeds {settings.user_import_max_bytes} bytes")
+            await run_in_threadpool(f.write, chunk)
+        await run_in_threadpool(f.close)
+    except BaseException:
+        await run_in_threadpool(f.close)
+        await run_in_threadpool(user_import.remove_spool, path)
+        raise
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    job = UserImportJob(
+        id=job_id, status="queued", format=fmt, path=path, created_by=admin.id, created_at=now, updated_at=now
+    )
+    db.add(job)
+    await db.commit()
+    user_import.start_job(job_id)
+    return _job_out(job)
+
+
+@router.get("/users/import/{job_id}", response_model=UserImportJobOut)
+async def import_status(
+    job_id: str, db: AsyncSession = Depends(get_async_db), _: Principal = Depends(require_roles(["admin"]))
+):
+    job = await db.get(UserImportJob, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Import job not found")
+    return _job_out(job)
+
+
+@router.post("/users/import/{job_id}/resume", response_model=UserImportJobOut, status_code=202)
+async def resume_import(
+    job_id: str, db: AsyncSession = Depends(get_async_db), _: Principal = Depends(require_roles(["admin"]))
+):
+    """Continue a failed/interrupted job (or one orphaned by a restart) from its last committed batch."""
+    job = await db.get(UserImportJob, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Import job not found")
+    if job.status == "completed" or user_import.is_active(job_id):
+        raise HTTPException(status_code=409, detail=f"Import job is {job.status}")
+    if not await run_in_threadpool(os.path.exists, job.path):
+        raise HTTPException(status_code=410, detail="Upload has expired; start a new import")
+    user_import.start_job(job_id)
+    return _job_out(job)
+
+
+@router.get("/.well-known/jwks.json")
+def jwks(request: Request) -> Response:
+    # Serialized once per key set; verifiers revalidate with If-None-Match
+    body, etag = security.keyring.jwks_document()
+    headers = {"Cache-Control": f"public, max-age={settings.jwks_max_age_seconds}", "ETag": etag}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/jwk-set+json", headers=headers)
+"""/common/auth 配下の認証API。\nユーザ登録・ログイン・トークン更新（ローテーション）・ログアウト・ユーザ情報取得・ロール変更・ロールの権限/継承管理・ユーザ一括登録ジョブと、検証用公開鍵の JWKS を提供する。"""
@@ -2,18 +2,20 @@ from typing import List, Optional
 
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from server.core.database import get_db
+from server.common.permissions import permission_mask
+from server.common.principal import Principal, load_principal_async
+from server.common.refresh_tokens import is_family_revoked
+from server.core.database import get_async_db
 from server.core.security import decode_token
-from server.models.user import User
 
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/common/auth/login")
 oauth2_scheme_optional = OAuth2PasswordBearer(tokenUrl="/common/auth/login", auto_error=False)
 
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> User:
+def _access_token_subject(token: str) -> str:
     try:
         payload = decode_token(token)
     except ValueError:
@@ -21,39 +23,61 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
 
     if payload.get("type") != "access":
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token type")
+    # In-memory lookup; logout/reuse revokes the family's access tokens too
+    if is_family_revoked(payload.get("fam")):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token revoked")
 
     user_id = payload.get("sub")
     if user_id is None:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token payload")
+    return str(user_id)
 
-    user = db.query(User).filter(User.id == int(user_id)).first()
-    if not user:
+
+async def get_current_principal(
+    token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)
+) -> Principal:
+    principal = await load_principal_async(db, _access_token_subject(token))
+    if not principal:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
-    return user
+    return principal
 
 
 def require_roles(required: List[str]):
-    def checker(user: User = Depends(get_current_user)) -> User:
-        user_roles = {r.name for r in user.roles}
-        if not (user_roles.intersection(set(required)) or ("admin" in user_roles)):
+    required_set = frozenset(required)
+
+    def checker(principal: Principal = Depends(get_current_principal)) -> Principal:
+        if not principal.has_any_role(required_set):
             raise HTTPException(status_code=403, detail="Insufficient role")
-        return user
+        return principal
+
+    return checker
+
+
+def require_permissions(required: List[str]):
+    # Bits are resolved once here; each request is a single AND against the principal's mask
+    mask = permission_mask(required)
+
+    def checker(principal: Principal = Depends(get_current_principal)) -> Principal:
+        if not principal.has_permissions(mask):
+            raise HTTPException(status_code=403, detail="Missing permission")
+        return principal
 
     return checker
 
 
-def get_optional_user(token: Optional[str] = Depends(oauth2_scheme_optional), db: Session = Depends(get_db)) -> Optional[User]:
+async def get_optional_principal(
+    token: Optional[str] = Depends(oauth2_scheme_optional), db: AsyncSession = Depends(get_async_db)
+) -> Optional[Principal]:
     if not token:
         return None
     try:
         payload = decode_token(token)
-        if payload.get("type") != "access":
+        if payload.get("type") != "access" or is_family_revoked(payload.get("fam")):
             return None
         user_id = payload.get("sub")
         if not user_id:
             return None
-        user = db.query(User).filter(User.id == int(user_id)).first()
-        return user
+        return await load_principal_async(db, str(user_id))
     except Exception:
         return None
-"""共通依存関数。\n現在ユーザ取得・RBACチェック・任意認証ユーザ取得を提供する。"""
+"""共通依存関数。\n現在のプリンシパル取得・RBAC（ロール/権限）チェック・任意認証のプリンシパル取得を提供する。"""
@@ -0,0 +1,159 @@
+"""冪等キー（Idempotency-Key）ストア。
+(scope, key) ごとに最初のリクエストのレスポンスを DB に保存し、同じキーの再送には処理を再実行せず保存済みのレスポンスを返す。
+完了済みのレスポンスはシリアライズ済みバイト列としてプロセス内 LRU にも置き、再送は DB を読まずに返す。
+同時に届いた重複は原子的な UPSERT によるキーの確保で直列化し、後着側は 409 を受け取る。"""
+import hashlib
+import json
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Mapping, Optional
+
+from fastapi import HTTPException
+from fastapi.responses import Response
+from sqlalchemy import and_, delete, or_, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from server.common.metrics import inc_counter
+from server.common.utils.cache import TTLCache
+from server.core.config import settings
+from server.models.idempotency import IdempotencyKey
+
+
+REPLAY_HEADER = "Idempotent-Replayed"
+
+
+@dataclass(frozen=True)
+class StoredResponse:
+    request_hash: str
+    status_code: int
+    body: bytes
+
+
+_cache: TTLCache[StoredResponse] = TTLCache(
+    maxsize=settings.idempotency_cache_max_entries, ttl=settings.idempotency_ttl_seconds
+)
+
+# Expired keys are deleted by whichever claim comes first after this much time
+_PURGE_EVERY = timedelta(hours=1)
+_next_purge = datetime.min
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def request_hash(payload: Mapping[str, Any]) -> str:
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str).encode()).hexdigest()
+
+
+def _replay(stored: StoredResponse, req_hash: str) -> Response:
+    if stored.request_hash != req_hash:
+        raise HTTPException(status_code=422, detail="Idempotency-Key was already used with a different request")
+    inc_counter("idempotency_replays_total")
+    return Response(stored.body, status_code=stored.status_code, media_type="application/json", headers={REPLAY_HEADER: "true"})
+
+
+def replay_cached(scope: str, key: str, req_hash: str) -> Optional[Response]:
+    """The stored response from memory, if this process has it; no I/O."""
+    stored = _cache.get((scope, key))
+    return _replay(stored, req_hash) if stored is not None else None
+
+
+async def claim(db: AsyncSession, scope: str, key: str, req_hash: str) -> Optional[Response]:
+    """Take the key for execution (committed), or return the stored response to replay instead.
+
+    The claim is one INSERT .. ON CONFLICT DO UPDATE that only overwrites an
+    expired key or a "pending" claim older than ``idempotency_pending_timeout``
+    (its owner died), so exactly one concurrent request wins. A request that
+    finds the key still pending gets 409.
+    """
+    now = _utcnow()
+    values = {
+        "request_hash": req_hash,
+        "status": "pending",
+        "response_status": None,
+        "response_body": None,
+        "created_at": now,
+        "expires_at": now + timedelta(seconds=settings.idempotency_ttl_seconds),
+    }
+    insert_ = postgresql.insert if db.get_bind().dialect.name == "postgresql" else sqlite.insert
+    stmt = (
+        insert_(IdempotencyKey)
+        .values(scope=scope, key=key, **values)
+        .on_conflict_do_update(
+            index_elements=["scope", "key"],
+            set_=values,
+            where=or_(
+                IdempotencyKey.expires_at <= now,
+                and_(
+                    IdempotencyKey.status == "pending",
+                    IdempotencyKey.created_at <= now - timedelta(seconds=settings.idempotency_pending_timeout),
+                ),
+            ),
+        )
+    )
+    claimed = (await db.execute(stmt)).rowcount == 1
+    if now >= _next_purge:
+        await _purge_expired(db, now)
+    await db.commit()
+    if claimed:
+        return None
+    row = (
+        await db.execute(
+            select(
+                IdempotencyKey.request_hash,
+                IdempotencyKey.status,
+                IdempotencyKey.response_status,
+                IdempotencyKey.response_body,
+            ).where(IdempotencyKey.scope == scope, IdempotencyKey.key == key)
+        )
+    ).one()
+    if row.status == "pending":
+        if row.request_hash != req_hash:
+            raise HTTPException(status_code=422, detail="Idempotency-Key was already used with a different request")
+        inc_counter("idempotency_conflicts_total")
+        raise HTTPException(
+            status_code=409, detail="A request with this Idempotency-Key is in progress", headers={"Retry-After": "1"}
+        )
+    stored = StoredResponse(row.request_hash, row.response_status, json.dumps(row.response_body).encode())
+    _cache.set((scope, key), stored)
+    return _replay(stored, req_hash)
+
+
+async def complete(
+    db: AsyncSession, scope: str, key: str, req_hash: str, status_code: int, body: Dict[str, Any]
+) -> bytes:
+    """Store the response and commit it together with the caller's work; returns the encoded body."""
+    await db.execute(
+        update(IdempotencyKey)
+        .where(IdempotencyKey.scope == scope, IdempotencyKey.key == key)
+        .values(status="done", response_status=status_code, response_body=body)
+    )
+    await db.commit()
+    encoded = json.dumps(body).encode()
+    _cache.set((scope, key), StoredResponse(req_hash, status_code, encoded))
+    return encoded
+
+
+async def release(db: AsyncSession, scope: str, key: str) -> None:
+    """Drop a claim whose request failed, so a retry executes again."""
+    await db.rollback()
+    await db.execute(
+        delete(IdempotencyKey).where(
+            IdempotencyKey.scope == scope, IdempotencyKey.key == key, IdempotencyKey.status == "pending"
+        )
+    )
+    await db.commit()
+
+
+async def _purge_expired(db: AsyncSession, now: datetime) -> None:
+    global _next_purge
+    _next_purge = now + _PURGE_EVERY
+    deleted = (await db.execute(delete(IdempotencyKey).where(IdempotencyKey.expires_at <= now))).rowcount
+    if deleted:
+        inc_counter("idempotency_keys_purged_total", deleted)
+
+
+def clear_idempotency_cache() -> None:
+    _cache.clear()
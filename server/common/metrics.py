@@ -1,64 +1,508 @@
+"""共通メトリクス機能。
+カウンタ/ゲージ/固定バケットのヒストグラムを持つレジストリと、リクエスト統計を収集するミドルウェアを提供し、
+JSON/Prometheus(OpenMetrics)形式で出力する。ラベルはルートテンプレート単位で、系列数には上限がある。
+Prometheus 出力は系列ごとの描画結果をキャッシュし、値が変わった系列だけを再描画する。
+複数ワーカー時のゲージは生存中のワーカーの値だけを、ゲージごとのモード（合計/ワーカー別/最大/最小）で集約する。"""
+import bisect
+import gzip
+import json
+import os
+import threading
 import time
-from collections import defaultdict
-from typing import Dict, Tuple
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
 
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, Request, Response
 
+from server.core.config import settings
+
+
+PREFIX = "takachan_"
+OVERFLOW_LABEL = "__overflow__"
+UNMATCHED_ROUTE = "__unmatched__"
+DEFAULT_BUCKETS: Tuple[float, ...] = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+Labels = Tuple[str, ...]
+
+
+class Metric:
+    """Base for registry metrics.
+
+    Writes go to a dict owned by the calling thread, so the hot path takes no
+    lock; ``collect`` sums the per-thread dicts. A metric keeps at most
+    ``max_series`` label combinations, later ones are folded into a single
+    ``__overflow__`` series.
+    """
+
+    type = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), max_series: int = 1000) -> None:
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.max_series = max_series
+        self._overflow: Labels = (OVERFLOW_LABEL,) * len(self.labelnames)
+        self._series: set = set()
+        self._local = threading.local()
+        self._shards: List[dict] = []
+        self._lock = threading.Lock()
+
+    def _shard(self) -> dict:
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = self._local.shard = {}
+            with self._lock:
+                self._shards.append(shard)
+        return shard
+
+    def _admit(self, labels: Labels) -> Labels:
+        # Slow path: first time this thread sees the label set.
+        with self._lock:
+            if labels in self._series:
+                return labels
+            if len(self._series) < self.max_series:
+                self._series.add(labels)
+                return labels
+            self._series.add(self._overflow)
+            return self._overflow
+
+    def series_count(self) -> int:
+        return len(self._series)
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, labels: Labels = (), amount: float = 1) -> None:
+        shard = self._shard()
+        if labels not in shard:
+            labels = self._admit(labels)
+        shard[labels] = shard.get(labels, 0) + amount
+
+    def collect(self) -> Dict[Labels, float]:
+        out: Dict[Labels, float] = {}
+        for shard in list(self._shards):
+            for labels, value in shard.copy().items():
+                out[labels] = out.get(labels, 0) + value
+        return out
+
+
+GAUGE_MODES = ("livesum", "liveall", "max", "min")
+
+
+class Gauge(Metric):
+    """Last-write-wins gauge, optionally computed at collection time by ``fn``.
+
+    ``multiprocess_mode`` picks how workers' values combine in multiprocess mode:
+    ``livesum`` adds them up, ``liveall`` keeps one series per worker (extra
+    ``pid`` label), ``max``/``min`` keep the extreme. Only live workers count.
+    """
+
+    type = "gauge"
+
+    def __init__(
+        self, *args, fn: Optional[Callable[[], float]] = None, multiprocess_mode: str = "livesum", **kwargs
+    ) -> None:
+        if multiprocess_mode not in GAUGE_MODES:
+            raise ValueError(f"multiprocess_mode must be one of {', '.join(GAUGE_MODES)}")
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Labels, float] = {}
+        self.fn = fn
+        self.multiprocess_mode = multiprocess_mode
+
+    def set(self, value: float, labels: Labels = ()) -> None:
+        if labels not in self._values:
+            labels = self._admit(labels)
+        self._values[labels] = value
+
+    def collect(self) -> Dict[Labels, float]:
+        if self.fn is not None:
+            # A labelled gauge's fn returns {labels: value}
+            return dict(self.fn()) if self.labelnames else {(): self.fn()}
+        return self._values.copy()
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, *args, buckets: Sequence[float] = DEFAULT_BUCKETS, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, labels: Labels = ()) -> None:
+        shard = self._shard()
+        cell = shard.get(labels)
+        if cell is None:
+            labels = self._admit(labels)
+            cell = shard.get(labels)
+            if cell is None:
+                # per-bucket counts (+Inf last), then sum and count
+                cell = shard[labels] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+        cell[bisect.bisect_left(self.buckets, value)] += 1
+        cell[-2] += value
+        cell[-1] += 1
+
+    def collect(self) -> Dict[Labels, List[float]]:
+        out: Dict[Labels, List[float]] = {}
+        for shard in list(self._shards):
+            for labels, cell in shard.copy().items():
+                acc = out.get(labels)
+                if acc is None:
+                    out[labels] = list(cell)
+                else:
+                    for i, v in enumerate(cell):
+                        acc[i] += v
+        return out
+
+
+class MetricsRegistry:
+    def __init__(self, max_series: int = 1000, multiproc_dir: Optional[str] = None) -> None:
+        self.max_series = max_series
+        self.multiproc_dir = multiproc_dir
+        self._metrics: Dict[str, Metric] = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name: str, help: str, labelnames: Sequence[str], **kwargs) -> Metric:
+        metric = self._metrics.get(name)
+        if metric is None:
+            with self._lock:
+                metric = self._metrics.get(name)
+                if metric is None:
+                    metric = cls(name, help or name, labelnames, max_series=self.max_series, **kwargs)
+                    self._metrics[name] = metric
+        return metric
+
+    def counter(self, name: str, help: str = "", labelnames: Sequence[str] = ()) -> Counter:
+        return self._get_or_create(Counter, name, help, labelnames)  # type: ignore[return-value]
+
+    def gauge(
+        self,
+        name: str,
+        help: str = "",
+        labelnames: Sequence[str] = (),
+        fn: Optional[Callable[[], float]] = None,
+        multiprocess_mode: str = "livesum",
+    ) -> Gauge:
+        return self._get_or_create(  # type: ignore[return-value]
+            Gauge, name, help, labelnames, fn=fn, multiprocess_mode=multiprocess_mode
+        )
+
+    def histogram(
+        self, name: str, help: str = "", labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self._get_or_create(Histogram, name, help, labelnames, buckets=buckets)  # type: ignore[return-value]
+
+    def metrics(self) -> Iterable[Metric]:
+        return list(self._metrics.values())
+
+    def _local_snapshot(self) -> Dict[str, dict]:
+        return {
+            m.name: {
+                "type": m.type,
+                "help": m.help,
+                "labelnames": list(m.labelnames),
+                "buckets": list(getattr(m, "buckets", ())),
+                "mode": getattr(m, "multiprocess_mode", None),
+                "series": m.collect(),
+            }
+            for m in self.metrics()
+        }
+
+    def snapshot(self) -> Dict[str, dict]:
+        """Collected values of every metric, merged with other workers' snapshots in multiprocess mode."""
+        local = self._local_snapshot()
+        if not self.multiproc_dir:
+            return local
+        self.write_snapshot(local)
+        return self._merge_worker_snapshots()
+
+    # -- multiprocess mode: every worker dumps its totals to <dir>/<pid>.json --
+
+    def write_snapshot(self, local: Optional[Dict[str, dict]] = None) -> None:
+        if not self.multiproc_dir:
+            return
+        local = local if local is not None else self._local_snapshot()
+        data = {
+            name: {**{k: v for k, v in m.items() if k != "series"}, "series": [[list(k), v] for k, v in m["series"].items()]}
+            for name, m in local.items()
+        }
+        os.makedirs(self.multiproc_dir, exist_ok=True)
+        path = os.path.join(self.multiproc_dir, f"{os.getpid()}.json")
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp, path)
+
+    def _merge_worker_snapshots(self) -> Dict[str, dict]:
+        # Counters and histograms keep an exited worker's totals; gauges only count live workers
+        merged: Dict[str, dict] = {}
+        for entry in os.scandir(self.multiproc_dir):
+            if not entry.name.endswith(".json"):
+                continue
+            try:
+                pid = int(entry.name[: -len(".json")])
+                with open(entry.path, encoding="utf-8") as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            alive = _pid_alive(pid)
+            for name, m in data.items():
+                mode = m.get("mode")
+                if mode is not None and not alive:
+                    continue
+                target = merged.get(name)
+                if target is None:
+                    target = merged[name] = {**{k: v for k, v in m.items() if k != "series"}, "series": {}}
+                    if mode == "liveall":
+                        target["labelnames"] = [*m["labelnames"], "pid"]
+                series = target["series"]
+                for labels, value in m["series"]:
+                    key = tuple(labels)
+                    if mode == "liveall":
+                        series[(*key, str(pid))] = value
+                    elif mode in ("max", "min"):
+                        acc = series.get(key)
+                        series[key] = value if acc is None else (max if mode == "max" else min)(acc, value)
+                    elif isinstance(value, list):
+                        acc = series.get(key)
+                        series[key] = value if acc is None else [a + b for a, b in zip(acc, value)]
+                    else:
+                        series[key] = series.get(key, 0) + value
+        return merged
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+REGISTRY = MetricsRegistry(max_series=settings.metrics_max_series, multiproc_dir=settings.metrics_multiproc_dir)
 
 _start_time = time.time()
-_total_requests = 0
-_path_counters: Dict[str, int] = defaultdict(int)
-_method_status_counters: Dict[Tuple[str, str, int], int] = defaultdict(int)
+http_requests_total = REGISTRY.counter("http_requests_total", "Total HTTP requests")
+http_requests_path_total = REGISTRY.counter(
+    "http_requests_path_total", "Total HTTP requests by route", ("path",)
+)
+http_requests_by_method_status_total = REGISTRY.counter(
+    "http_requests_by_method_status_total", "Total HTTP requests by method, route and status", ("method", "path", "status")
+)
+http_request_duration_seconds = REGISTRY.histogram(
+    "http_request_duration_seconds", "HTTP request latency by method and route", ("method", "path")
+)
+
+
+def inc_counter(name: str, amount: int = 1) -> None:
+    """Increment a named application counter (exported as ``takachan_<name>``)."""
+    REGISTRY.counter(name).inc(amount=amount)
+
+
+def set_gauge(name: str, value: float) -> None:
+    REGISTRY.gauge(name).set(value)
+
+
+def observe(name: str, value: float) -> None:
+    """Record one observation into a latency histogram with the default buckets."""
+    REGISTRY.histogram(name).observe(value)
+
+
+def route_template(scope: dict) -> str:
+    """Matched route template (e.g. ``/common/auth/users/{user_id}/roles``) for a request scope."""
+    # Every router declares its full prefix (server.main), so path_format is already the whole template
+    template = getattr(scope.get("route"), "path_format", None)
+    return template if template is not None else UNMATCHED_ROUTE
+
+
+def _flush_loop(interval: float) -> None:
+    while True:
+        time.sleep(interval)
+        try:
+            REGISTRY.write_snapshot()
+        except OSError:  # pragma: no cover
+            pass
+
+
+_flusher: Optional[threading.Thread] = None
+
+
+def start_metrics_flusher() -> None:
+    """In multiprocess mode, periodically write this worker's snapshot."""
+    global _flusher
+    if REGISTRY.multiproc_dir and _flusher is None:
+        _flusher = threading.Thread(
+            target=_flush_loop, args=(settings.metrics_flush_interval,), name="metrics-flush", daemon=True
+        )
+        _flusher.start()
+
+
+def record_request(method: str, path: str, status: int, elapsed: float) -> None:
+    http_requests_total.inc()
+    http_requests_path_total.inc((path,))
+    http_requests_by_method_status_total.inc((method, path, str(status)))
+    http_request_duration_seconds.observe(elapsed, (method, path))
 
 
 def add_metrics_middleware(app: FastAPI) -> None:
+    """Standalone ``@app.middleware("http")`` form; ``create_app`` uses the fused pipeline instead."""
+    start_metrics_flusher()
+
     @app.middleware("http")
     async def metrics_middleware(request: Request, call_next):  # type: ignore[override]
-        global _total_requests
-        _total_requests += 1
-        path = request.url.path
-        method = request.method
+        start = time.perf_counter()
         response = await call_next(request)
-        status = getattr(response, "status_code", 0)
-        _path_counters[path] += 1
-        _method_status_counters[(method, path, status)] += 1
+        record_request(
+            request.method,
+            route_template(request.scope),
+            getattr(response, "status_code", 0),
+            time.perf_counter() - start,
+        )
         return response
 
 
+def _scalar(snapshot: Dict[str, dict], name: str) -> float:
+    return snapshot.get(name, {}).get("series", {}).get((), 0)
+
+
 def get_metrics() -> Dict[str, object]:
-    uptime = time.time() - _start_time
+    snap = REGISTRY.snapshot()
+    http_names = {
+        "http_requests_total",
+        "http_requests_path_total",
+        "http_requests_by_method_status_total",
+        "http_request_duration_seconds",
+    }
+    latency = {
+        f"{m} {p}": {"count": cell[-1], "sum": cell[-2]}
+        for (m, p), cell in snap.get("http_request_duration_seconds", {}).get("series", {}).items()
+    }
+    extra = {name: m for name, m in snap.items() if name not in http_names}
     return {
-        "uptime_seconds": int(uptime),
-        "total_requests": _total_requests,
-        "requests_by_path": dict(_path_counters),
+        "uptime_seconds": int(time.time() - _start_time),
+        "total_requests": _scalar(snap, "http_requests_total"),
+        "requests_by_path": {p: c for (p,), c in snap.get("http_requests_path_total", {}).get("series", {}).items()},
         "requests_by_method_status": {
-            f"{m} {p} {s}": c for (m, p, s), c in _method_status_counters.items()
+            f"{m} {p} {s}": c
+            for (m, p, s), c in snap.get("http_requests_by_method_status_total", {}).get("series", {}).items()
+        },
+        "latency_by_route": latency,
+        "counters": {n: _scalar(snap, n) for n, m in extra.items() if m["type"] == "counter" and not m["labelnames"]},
+        "gauges": {n: _scalar(snap, n) for n, m in extra.items() if m["type"] == "gauge" and not m["labelnames"]},
+        "histograms": {
+            n: {"count": cell[-1], "sum": cell[-2]}
+            for n, m in extra.items()
+            if m["type"] == "histogram" and not m["labelnames"]
+            for cell in [m["series"].get((), [0.0, 0])]
         },
     }
 
 
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _label_str(labelnames: Sequence[str], labels: Labels, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(labelnames, labels)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _fmt(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+OPENMETRICS_CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+
+class Exposition:
+    """Text exposition that keeps the rendered bytes of every series between scrapes.
+
+    A series is only re-formatted when its collected value differs from the
+    one it was last rendered with; everything else is reused as-is and the
+    scrape is a single ``b"".join``.
+    """
+
+    def __init__(self, openmetrics: bool = False) -> None:
+        self.openmetrics = openmetrics
+        self._headers: Dict[str, bytes] = {}
+        self._series: Dict[Tuple[str, Labels], Tuple[object, bytes]] = {}
+        self._lock = threading.Lock()
+        self.rendered_series = 0
+
+    def _header(self, name: str, m: dict) -> bytes:
+        header = self._headers.get(name)
+        if header is None:
+            family = PREFIX + name
+            if self.openmetrics and m["type"] == "counter":
+                family = family[: -len("_total")] if family.endswith("_total") else family
+            header = self._headers[name] = f"# HELP {family} {m['help']}\n# TYPE {family} {m['type']}\n".encode()
+        return header
+
+    def _render_series(self, name: str, m: dict, labels: Labels, value) -> bytes:
+        full = PREFIX + name
+        names = m["labelnames"]
+        if m["type"] == "counter" and self.openmetrics and not full.endswith("_total"):
+            full += "_total"
+        if m["type"] != "histogram":
+            return f"{full}{_label_str(names, labels)} {_fmt(value)}\n".encode()
+        lines = []
+        cumulative = 0
+        for bound, count in zip([_fmt(b) for b in m["buckets"]] + ["+Inf"], value):
+            cumulative += count
+            le = 'le="' + bound + '"'
+            lines.append(f"{full}_bucket{_label_str(names, labels, le)} {_fmt(cumulative)}\n")
+        lines.append(f"{full}_sum{_label_str(names, labels)} {_fmt(value[-2])}\n")
+        lines.append(f"{full}_count{_label_str(names, labels)} {_fmt(value[-1])}\n")
+        return "".join(lines).encode()
+
+    def render(self, snapshot: Dict[str, dict]) -> bytes:
+        with self._lock:
+            # Per process, so it is not part of the (possibly multi-worker) registry
+            parts = [
+                self._header("uptime_seconds", {"type": "gauge", "help": "Uptime of the server in seconds"}),
+                f"{PREFIX}uptime_seconds {int(time.time() - _start_time)}\n".encode(),
+            ]
+            cache = self._series
+            seen = 0
+            for name, m in snapshot.items():
+                parts.append(self._header(name, m))
+                for labels, value in m["series"].items():
+                    key = (name, labels)
+                    cached = cache.get(key)
+                    if cached is None or cached[0] != value:
+                        cached = cache[key] = (value, self._render_series(name, m, labels, value))
+                        self.rendered_series += 1
+                    parts.append(cached[1])
+                    seen += 1
+            if len(cache) != seen:
+                # Series disappeared (e.g. a worker snapshot was removed); drop them
+                live = {(name, labels) for name, m in snapshot.items() for labels in m["series"]}
+                self._series = {k: v for k, v in cache.items() if k in live}
+            if self.openmetrics:
+                parts.append(b"# EOF\n")
+            return b"".join(parts)
+
+
+_prometheus = Exposition()
+_openmetrics = Exposition(openmetrics=True)
+
+
 def render_prometheus() -> str:
-    lines = []
-    uptime = int(time.time() - _start_time)
-    lines.append("# HELP takachan_uptime_seconds Uptime of the server in seconds")
-    lines.append("# TYPE takachan_uptime_seconds gauge")
-    lines.append(f"takachan_uptime_seconds {uptime}")
-
-    lines.append("# HELP takachan_http_requests_total Total HTTP requests")
-    lines.append("# TYPE takachan_http_requests_total counter")
-    lines.append(f"takachan_http_requests_total {_total_requests}")
-
-    lines.append("# HELP takachan_http_requests_path_total Total HTTP requests by path")
-    lines.append("# TYPE takachan_http_requests_path_total counter")
-    for path, count in _path_counters.items():
-        lines.append(f'takachan_http_requests_path_total{{path="{path}"}} {count}')
-
-    lines.append("# HELP takachan_http_requests_by_method_status_total Total HTTP requests by method, path and status")
-    lines.append("# TYPE takachan_http_requests_by_method_status_total counter")
-    for (method, path, status), count in _method_status_counters.items():
-        lines.append(
-            f'takachan_http_requests_by_method_status_total{{method="{method}",path="{path}",status="{status}"}} {count}'
-        )
+    return _prometheus.render(REGISTRY.snapshot()).decode()
+
 
-    return "\n".join(lines) + "\n"
-"""共通メトリクス機能。\nミドルウェアでリクエスト統計を収集し、JSON/Prometheus形式で提供する。"""
+def exposition_response(accept: str = "", accept_encoding: str = "") -> Response:
+    """Negotiate OpenMetrics vs. Prometheus text and optional gzip for a scrape."""
+    if "application/openmetrics-text" in accept:
+        body, media_type = _openmetrics.render(REGISTRY.snapshot()), OPENMETRICS_CONTENT_TYPE
+    else:
+        body, media_type = _prometheus.render(REGISTRY.snapshot()), PROMETHEUS_CONTENT_TYPE
+    headers = {"Vary": "Accept, Accept-Encoding"}
+    if "gzip" in accept_encoding:
+        body = gzip.compress(body, compresslevel=5)
+        headers["Content-Encoding"] = "gzip"
+    return Response(content=body, media_type=media_type, headers=headers)
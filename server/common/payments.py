@@ -1,20 +1,224 @@
 """/common/payments 配下の決済共通API。
-請求一覧や返金作成など、サービス横断で利用する支払い系エンドポイントを提供する。"""
-from fastapi import APIRouter, Depends
+請求一覧や返金作成など、サービス横断で利用する支払い系エンドポイントを提供する。
+請求一覧はテナント単位の (issued_at, id) 降順キーセットページングで、深いページでも1回のインデックス範囲走査で返す。
+format=ndjson/csv ではサーバサイドカーソルを一定件数ずつ読みながらストリーミングで全件を出力する。
+返金は条件付き UPDATE で返金可能額を超えないようにし、Idempotency-Key 付きの再送は最初のレスポンスを再生する。"""
+import base64
+import csv
+import io
+import json
+from datetime import datetime, timezone
+from typing import AsyncIterator, Dict, List, Literal, Optional, Tuple
 
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from fastapi.responses import Response, StreamingResponse
+from sqlalchemy import Select, case, select, tuple_, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from server.common import idempotency
 from server.common.deps import require_roles
-from server.models.user import User
+from server.common.principal import Principal
+from server.core.database import AsyncSessionLocal, get_async_db
+from server.models.payments import Invoice, Refund
+from server.schemas.payments import InvoiceIn, InvoiceStatus, RefundIn
+
+
+router = APIRouter(prefix="/common/payments", tags=["payments"])
+
+INVOICE_COLUMNS = (
+    Invoice.id,
+    Invoice.tenant_id,
+    Invoice.number,
+    Invoice.customer_id,
+    Invoice.status,
+    Invoice.currency,
+    Invoice.amount_cents,
+    Invoice.refunded_cents,
+    Invoice.issued_at,
+)
+_FIELDS = [c.key for c in INVOICE_COLUMNS]
+# Rows fetched per round trip while streaming an export
+_EXPORT_CHUNK = 1000
+
+
+def _naive_utc(ts: datetime) -> datetime:
+    return ts.astimezone(timezone.utc).replace(tzinfo=None) if ts.tzinfo is not None else ts
+
+
+def encode_cursor(issued_at: datetime, invoice_id: int) -> str:
+    return base64.urlsafe_b64encode(f"{issued_at.isoformat()}|{invoice_id}".encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        ts, _, invoice_id = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode().partition("|")
+        return datetime.fromisoformat(ts), int(invoice_id)
+    except ValueError as e:
+        raise ValueError("Invalid cursor") from e
 
 
-router = APIRouter()
+def _invoice(data: Dict[str, object]) -> Dict[str, object]:
+    data["issued_at"] = data["issued_at"].replace(tzinfo=timezone.utc).isoformat()
+    return data
+
+
+def invoice_stmt(
+    tenant: str,
+    cursor: Optional[str] = None,
+    status: Optional[str] = None,
+    customer: Optional[str] = None,
+) -> Select:
+    """Newest first within a tenant; rows after ``cursor`` only."""
+    stmt = (
+        select(*INVOICE_COLUMNS)
+        .where(Invoice.tenant_id == tenant)
+        .order_by(Invoice.issued_at.desc(), Invoice.id.desc())
+    )
+    if status is not None:
+        stmt = stmt.where(Invoice.status == status)
+    if customer is not None:
+        stmt = stmt.where(Invoice.customer_id == customer)
+    if cursor is not None:
+        # Row-value comparison: stays an index range scan at any depth, unlike OFFSET
+        stmt = stmt.where(tuple_(Invoice.issued_at, Invoice.id) < tuple_(*decode_cursor(cursor)))
+    return stmt
+
+
+async def query_invoices(
+    db: AsyncSession,
+    tenant: str,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    status: Optional[str] = None,
+    customer: Optional[str] = None,
+) -> Tuple[List[Dict[str, object]], Optional[str]]:
+    """One page and the cursor of the next (older) page, if any."""
+    rows = (await db.execute(invoice_stmt(tenant, cursor, status, customer).limit(limit + 1))).all()
+    next_cursor = encode_cursor(rows[limit - 1].issued_at, rows[limit - 1].id) if len(rows) > limit else None
+    return [_invoice(dict(r._mapping)) for r in rows[:limit]], next_cursor
+
+
+async def _export(stmt: Select, fmt: str) -> AsyncIterator[bytes]:
+    # Own session: the response body outlives the request's dependencies
+    async with AsyncSessionLocal() as db:
+        result = await db.stream(stmt.execution_options(yield_per=_EXPORT_CHUNK))
+        if fmt == "csv":
+            yield (",".join(_FIELDS) + "\r\n").encode()
+        async for rows in result.partitions():
+            if fmt == "csv":
+                out = io.StringIO()
+                writer = csv.writer(out)
+                writer.writerows(tuple(_invoice(dict(r._mapping)).values()) for r in rows)
+                yield out.getvalue().encode()
+            else:
+                yield "".join(json.dumps(_invoice(dict(r._mapping)), ensure_ascii=False) + "\n" for r in rows).encode()
 
 
 @router.get("/invoices")
-def list_invoices(_: User = Depends(require_roles(["billing", "admin"]))):
-    return {"invoices": []}
+async def list_invoices(
+    tenant: str = Query(..., min_length=1, max_length=64),
+    status: InvoiceStatus | None = None,
+    customer: str | None = Query(None, max_length=64),
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: str | None = None,
+    fmt: Literal["json", "ndjson", "csv"] = Query("json", alias="format"),
+    db: AsyncSession = Depends(get_async_db),
+    _: Principal = Depends(require_roles(["billing", "admin"])),
+):
+    """A page of ``limit`` invoices, or with ``format=ndjson|csv`` every matching invoice streamed."""
+    try:
+        if fmt != "json":
+            media_type = "text/csv" if fmt == "csv" else "application/x-ndjson"
+            return StreamingResponse(_export(invoice_stmt(tenant, cursor, status, customer), fmt), media_type=media_type)
+        invoices, next_cursor = await query_invoices(db, tenant, limit, cursor, status, customer)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return {"invoices": invoices, "next_cursor": next_cursor}
+
+
+@router.post("/invoices", status_code=201)
+async def create_invoice(
+    payload: InvoiceIn,
+    db: AsyncSession = Depends(get_async_db),
+    _: Principal = Depends(require_roles(["billing", "admin"])),
+):
+    invoice = Invoice(
+        **payload.model_dump(exclude={"issued_at"}),
+        refunded_cents=0,
+        issued_at=_naive_utc(payload.issued_at or datetime.now(timezone.utc)),
+    )
+    db.add(invoice)
+    try:
+        await db.commit()
+    except IntegrityError:
+        raise HTTPException(status_code=409, detail="Invoice number already exists for this tenant")
+    return _invoice({key: getattr(invoice, key) for key in _FIELDS})
+
 
+async def _refund(db: AsyncSession, payload: RefundIn) -> Dict[str, object]:
+    """Apply the refund inside the caller's transaction (not committed)."""
+    amount = payload.amount_cents
+    refunded = Invoice.refunded_cents + amount
+    # One conditional UPDATE: concurrent refunds of the same invoice can never exceed its amount,
+    # and the one that brings it to the full amount marks it refunded
+    tenant = await db.scalar(
+        update(Invoice)
+        .where(Invoice.id == payload.invoice_id, Invoice.status == "paid", refunded <= Invoice.amount_cents)
+        .values(
+            refunded_cents=refunded,
+            status=case((refunded == Invoice.amount_cents, "refunded"), else_=Invoice.status),
+        )
+        .returning(Invoice.tenant_id)
+    )
+    if tenant is None:
+        if await db.scalar(select(Invoice.id).where(Invoice.id == payload.invoice_id)) is None:
+            raise HTTPException(status_code=404, detail="Invoice not found")
+        raise HTTPException(status_code=422, detail="Invoice is not paid or the amount exceeds what is refundable")
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    refund = Refund(
+        invoice_id=payload.invoice_id,
+        tenant_id=tenant,
+        amount_cents=amount,
+        reason=payload.reason,
+        status="succeeded",
+        created_at=now,
+    )
+    db.add(refund)
+    await db.flush()
+    return {
+        "id": refund.id,
+        "invoice_id": refund.invoice_id,
+        "tenant_id": tenant,
+        "amount_cents": amount,
+        "reason": refund.reason,
+        "status": refund.status,
+        "created_at": now.replace(tzinfo=timezone.utc).isoformat(),
+    }
 
-@router.post("/refund")
-def create_refund(_: User = Depends(require_roles(["billing", "admin"]))):
-    return {"status": "refunded", "id": "demo"}
 
+@router.post("/refund", status_code=201)
+async def create_refund(
+    payload: RefundIn,
+    idempotency_key: str | None = Header(default=None, max_length=255),
+    db: AsyncSession = Depends(get_async_db),
+    principal: Principal = Depends(require_roles(["billing", "admin"])),
+):
+    """Refund part or all of a paid invoice. With ``Idempotency-Key``, retries replay the first response."""
+    if idempotency_key is None:
+        refund = await _refund(db, payload)
+        await db.commit()
+        return refund
+    scope, req_hash = f"refund:{principal.id}", idempotency.request_hash(payload.model_dump())
+    replayed = idempotency.replay_cached(scope, idempotency_key, req_hash)
+    if replayed is None:
+        replayed = await idempotency.claim(db, scope, idempotency_key, req_hash)
+    if replayed is not None:
+        return replayed
+    try:
+        refund = await _refund(db, payload)
+    except Exception:
+        await idempotency.release(db, scope, idempotency_key)
+        raise
+    body = await idempotency.complete(db, scope, idempotency_key, req_hash, 201, refund)
+    return Response(body, status_code=201, media_type="application/json")
@@ -0,0 +1,143 @@
+"""権限の解決（ロール継承をビットマスクにコンパイル）。
+権限名ごとにプロセス内で固定のビットを割り当て、ロールごとに継承を展開した権限マスクを事前計算する。
+プリンシパルはロール集合のマスクを持ち、require_permissions は AND 1回で判定する。
+コンパイルは起動時とロール/権限の変更時に行う。"""
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, FrozenSet, Iterable, List, Mapping, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from server.common.metrics import inc_counter
+from server.core.config import settings
+from server.models.user import Permission, Role, RoleInheritance, RolePermission
+
+
+# Every bit set: superuser roles pass any check (mask & required == required)
+ALL_PERMISSIONS = -1
+
+_bits: Dict[str, int] = {}
+_bits_lock = threading.Lock()
+
+
+def permission_bit(name: str) -> int:
+    """The permission's bit; assigned on first use and stable for the life of the process."""
+    bit = _bits.get(name)
+    if bit is None:
+        with _bits_lock:
+            bit = _bits.setdefault(name, 1 << len(_bits))
+    return bit
+
+
+def permission_mask(names: Iterable[str]) -> int:
+    mask = 0
+    for name in names:
+        mask |= permission_bit(name)
+    return mask
+
+
+def permission_names(mask: int) -> List[str]:
+    if mask == ALL_PERMISSIONS:
+        return ["*"]
+    return sorted(name for name, bit in _bits.items() if mask & bit)
+
+
+@dataclass
+class PermissionTable:
+    """Compiled role graph: role name -> mask of its own and inherited permissions."""
+
+    role_masks: Dict[str, int]
+    _by_roles: Dict[FrozenSet[str], int] = field(default_factory=dict)
+
+    def mask_for(self, roles: FrozenSet[str]) -> int:
+        # Principals share a handful of role sets; fold each set once
+        mask = self._by_roles.get(roles)
+        if mask is None:
+            mask = 0
+            for role in roles:
+                mask |= self.role_masks.get(role, 0)
+            self._by_roles[roles] = mask
+        return mask
+
+
+def compile_graph(grants: Mapping[str, Iterable[str]], parents: Mapping[str, Iterable[str]]) -> PermissionTable:
+    """Expand inheritance into one mask per role; a cycle simply shares its members' permissions."""
+    own = {role: permission_mask(names) for role, names in grants.items()}
+    graph = {role: list(ps) for role, ps in parents.items()}
+    masks: Dict[str, int] = {}
+    # One walk over the ancestors per role; role graphs are small and this runs only on change
+    for role in own.keys() | graph.keys():
+        mask, seen, stack = 0, {role}, [role]
+        while stack:
+            current = stack.pop()
+            mask |= own.get(current, 0)
+            for parent in graph.get(current, ()):
+                if parent not in seen:
+                    seen.add(parent)
+                    stack.append(parent)
+        masks[role] = mask
+    for role in settings.superuser_roles:
+        masks[role] = ALL_PERMISSIONS
+    return PermissionTable(masks)
+
+
+_grants_stmt = (
+    select(Role.name, Permission.name)
+    .select_from(Role)
+    .outerjoin(RolePermission, RolePermission.c.role_id == Role.id)
+    .outerjoin(Permission, Permission.id == RolePermission.c.permission_id)
+)
+_parents_stmt = select(RoleInheritance.c.role_id, RoleInheritance.c.parent_id)
+_role_names_stmt = select(Role.id, Role.name)
+
+
+def _build(grant_rows: Iterable[Tuple], parent_rows: Iterable[Tuple], role_rows: Iterable[Tuple]) -> PermissionTable:
+    grants: Dict[str, List[str]] = {}
+    for role, perm in grant_rows:
+        grants.setdefault(role, [])
+        if perm is not None:
+            grants[role].append(perm)
+    names = dict(role_rows)
+    parents: Dict[str, List[str]] = {}
+    for role_id, parent_id in parent_rows:
+        parents.setdefault(names[role_id], []).append(names[parent_id])
+    return compile_graph(grants, parents)
+
+
+_table = compile_graph({}, {})
+
+
+def current_table() -> PermissionTable:
+    return _table
+
+
+def _install(table: PermissionTable) -> None:
+    global _table
+    _table = table
+    inc_counter("permission_graph_compiles_total")
+    # Cached principals carry masks from the previous graph
+    from server.common.principal import clear_principal_cache
+
+    clear_principal_cache()
+
+
+def compile_permissions(db: Session) -> PermissionTable:
+    """Load the role graph and swap in the compiled table (startup)."""
+    table = _build(
+        db.execute(_grants_stmt).all(), db.execute(_parents_stmt).all(), db.execute(_role_names_stmt).all()
+    )
+    _install(table)
+    return table
+
+
+async def compile_permissions_async(db: AsyncSession) -> PermissionTable:
+    """Same as ``compile_permissions``; call after committing a role/permission change."""
+    table = _build(
+        (await db.execute(_grants_stmt)).all(),
+        (await db.execute(_parents_stmt)).all(),
+        (await db.execute(_role_names_stmt)).all(),
+    )
+    _install(table)
+    return table
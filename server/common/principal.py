@@ -0,0 +1,54 @@
+"""認証済みプリンシパル（ユーザID・メール・ロール名・権限マスク）とそのキャッシュ。
+トークンの sub をキーにプロセス内でキャッシュし、保護ルートごとのDB参照を省く。"""
+from dataclasses import dataclass
+from typing import FrozenSet, Iterable, Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from server.common.metrics import inc_counter
+from server.common.permissions import current_table
+from server.common.utils.cache import TTLCache
+from server.core.config import settings
+from server.models.repository import load_principal_row_async
+
+
+@dataclass(frozen=True)
+class Principal:
+    id: int
+    email: str
+    roles: FrozenSet[str]
+    # Compiled from the roles (and their parents) when the principal is loaded
+    permissions: int = 0
+
+    def has_any_role(self, required: Iterable[str]) -> bool:
+        return "admin" in self.roles or not self.roles.isdisjoint(required)
+
+    def has_permissions(self, mask: int) -> bool:
+        return self.permissions & mask == mask
+
+
+_cache: TTLCache[Principal] = TTLCache(
+    maxsize=settings.principal_cache_max_entries, ttl=settings.principal_cache_ttl_seconds
+)
+
+
+async def load_principal_async(db: AsyncSession, subject: str) -> Optional[Principal]:
+    principal = _cache.get(subject)
+    if principal is not None:
+        inc_counter("principal_cache_hits_total")
+        return principal
+    inc_counter("principal_cache_misses_total")
+    row = await load_principal_row_async(db, int(subject))
+    if row is None:
+        return None
+    principal = Principal(id=row.id, email=row.email, roles=row.roles, permissions=current_table().mask_for(row.roles))
+    _cache.set(subject, principal)
+    return principal
+
+
+def invalidate_principal(subject: str) -> None:
+    _cache.pop(subject)
+
+
+def clear_principal_cache() -> None:
+    _cache.clear()
@@ -0,0 +1,183 @@
+"""リフレッシュトークンのローテーションと失効。
+発行した jti を DB に記録し、リフレッシュのたびに使用済みにして同じファミリーで再発行する。
+使用済み jti の再提示（盗用の兆候）はファミリー全体を失効させる。
+失効ファミリーはプロセス内の集合で引くため、失効していない通常の検証では DB を読まない。
+他ワーカーでの失効の取り込みと期限切れ行の削除はバックグラウンドスレッドが定期的に行う。"""
+import logging
+import secrets
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Mapping, Optional, Tuple
+
+from sqlalchemy import delete, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from server.common.metrics import REGISTRY, inc_counter
+from server.core.config import settings
+from server.core.database import SessionLocal
+from server.core.security import create_access_token, create_refresh_token
+from server.models.token import RefreshToken
+
+
+logger = logging.getLogger(__name__)
+
+
+class RefreshTokenError(ValueError):
+    """The refresh token is unknown, already used, revoked or expired."""
+
+
+# family id -> epoch seconds after which no token of the family can verify anyway
+_revoked: Dict[str, float] = {}
+_revoked_lock = threading.Lock()
+_synced_until: Optional[datetime] = None
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _family_horizon() -> float:
+    return time.time() + max(settings.refresh_token_expires_minutes, settings.access_token_expires_minutes) * 60
+
+
+def is_family_revoked(family: Optional[str]) -> bool:
+    # One dict probe; no lock needed for a read
+    return family is not None and family in _revoked
+
+
+def _mark_revoked(family: str) -> None:
+    with _revoked_lock:
+        _revoked[family] = _family_horizon()
+
+
+async def issue_tokens(db: AsyncSession, user_id: int, family: Optional[str] = None) -> Tuple[str, str]:
+    """New (access, refresh) pair; a new family unless rotating within ``family``. Commits."""
+    family = family or secrets.token_hex(16)
+    jti = secrets.token_hex(16)
+    db.add(
+        RefreshToken(
+            jti=jti,
+            family_id=family,
+            user_id=user_id,
+            expires_at=_utcnow() + timedelta(minutes=settings.refresh_token_expires_minutes),
+        )
+    )
+    await db.commit()
+    subject = str(user_id)
+    return create_access_token(subject, family), create_refresh_token(subject, jti, family)
+
+
+async def rotate(db: AsyncSession, claims: Mapping[str, Any]) -> Tuple[str, str]:
+    """Spend the refresh token in ``claims`` and issue the next pair of its family.
+
+    The spend is a single conditional UPDATE, so two concurrent refreshes with
+    the same token cannot both succeed. Presenting a token that was already
+    spent revokes its family.
+    """
+    jti, family = claims.get("jti"), claims.get("fam")
+    if not jti or not family or is_family_revoked(family):
+        raise RefreshTokenError("Invalid refresh token")
+    now = _utcnow()
+    spent = await db.execute(
+        update(RefreshToken)
+        .where(
+            RefreshToken.jti == jti,
+            RefreshToken.family_id == family,
+            RefreshToken.used_at.is_(None),
+            RefreshToken.revoked_at.is_(None),
+            RefreshToken.expires_at > now,
+        )
+        .values(used_at=now)
+    )
+    if spent.rowcount != 1:
+        used_at = await db.scalar(select(RefreshToken.used_at).where(RefreshToken.jti == jti))
+        if used_at is not None:
+            inc_counter("refresh_token_reuse_total")
+            logger.warning("Refresh token reuse detected; revoking family %s", family)
+            await revoke_family(db, family)
+        else:
+            await db.rollback()
+        raise RefreshTokenError("Invalid refresh token")
+    return await issue_tokens(db, int(claims["sub"]), family)
+
+
+async def revoke_family(db: AsyncSession, family: str) -> None:
+    await db.execute(
+        update(RefreshToken)
+        .where(RefreshToken.family_id == family, RefreshToken.revoked_at.is_(None))
+        .values(revoked_at=_utcnow())
+    )
+    await db.commit()
+    _mark_revoked(family)
+    inc_counter("refresh_token_families_revoked_total")
+
+
+def sync_revocations() -> int:
+    """Pick up families revoked since the last sync (other workers), prune and delete expired state.
+
+    Returns the number of expired rows deleted.
+    """
+    global _synced_until
+    now = _utcnow()
+    with SessionLocal() as db:
+        stmt = select(RefreshToken.family_id).where(RefreshToken.revoked_at.is_not(None)).distinct()
+        if _synced_until is not None:
+            # Small overlap so a revocation committed during the previous sync is not missed
+            stmt = stmt.where(RefreshToken.revoked_at >= _synced_until - timedelta(seconds=5))
+        else:
+            stmt = stmt.where(RefreshToken.expires_at > now)
+        families = db.scalars(stmt).all()
+        deleted = db.execute(delete(RefreshToken).where(RefreshToken.expires_at <= now)).rowcount
+        db.commit()
+    horizon = _family_horizon()
+    cutoff = time.time()
+    with _revoked_lock:
+        for family in families:
+            _revoked.setdefault(family, horizon)
+        for family in [f for f, until in _revoked.items() if until <= cutoff]:
+            del _revoked[family]
+    _synced_until = now
+    return deleted
+
+
+_sweeper: Optional[threading.Thread] = None
+_stop = threading.Event()
+
+
+def _sweep_loop(interval: float) -> None:
+    while not _stop.wait(interval):
+        try:
+            deleted = sync_revocations()
+            if deleted:
+                inc_counter("refresh_tokens_expired_deleted_total", deleted)
+        except Exception:
+            logger.exception("Refresh token sweep failed")
+
+
+def start_refresh_token_sweeper() -> None:
+    """Load current revocations, then keep syncing/cleaning every ``refresh_token_sweep_interval`` seconds."""
+    global _sweeper
+    if _sweeper is not None:
+        return
+    sync_revocations()
+    _stop.clear()
+    _sweeper = threading.Thread(
+        target=_sweep_loop, args=(settings.refresh_token_sweep_interval,), name="refresh-token-sweep", daemon=True
+    )
+    _sweeper.start()
+
+
+def stop_refresh_token_sweeper() -> None:
+    global _sweeper
+    _stop.set()
+    if _sweeper is not None:
+        _sweeper.join(timeout=5)
+        _sweeper = None
+
+
+# Every worker holds the same set, so summing would multiply it by the worker count
+REGISTRY.gauge(
+    "refresh_token_revoked_families", "Revoked refresh-token families held in memory", fn=lambda: len(_revoked),
+    multiprocess_mode="max",
+)
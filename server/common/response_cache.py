@@ -0,0 +1,122 @@
+"""レスポンスキャッシュ（ETag / 条件付き GET）。
+ルートごとに、クエリ文字列と任意の vary キー（例: プリンシパル）を鍵として、シリアライズ済みの JSON バイト列を
+TTL + LRU で保持する。強い ETag を付け、If-None-Match が一致すればハンドラを実行せず 304 を返す。
+書き込み側は invalidate() で名前空間ごと破棄できる（プロセス内。他ワーカーは TTL で追従する）。"""
+import functools
+import hashlib
+import inspect
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Hashable, Mapping, Optional
+
+from fastapi import Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response
+
+from server.common.metrics import inc_counter
+from server.common.principal import Principal
+from server.common.utils.cache import TTLCache
+from server.core.config import settings
+from server.core.responses import dumps
+
+
+@dataclass(frozen=True)
+class CachedResponse:
+    body: bytes
+    etag: str
+
+
+Vary = Callable[[Request, Mapping[str, Any]], Hashable]
+
+_caches: Dict[str, TTLCache[CachedResponse]] = {}
+
+
+def by_principal(_: Request, kwargs: Mapping[str, Any]) -> Hashable:
+    """Vary on the authenticated principal found among the handler's dependencies."""
+    for value in kwargs.values():
+        if isinstance(value, Principal):
+            return value.id
+    return None
+
+
+def _etag(body: bytes) -> str:
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """If-None-Match check: ``*`` or any listed tag equal to ``etag`` (weak comparison, ``W/`` ignored)."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    etag = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == etag for tag in header.split(","))
+
+
+def _respond(request: Request, entry: CachedResponse, cache_control: str) -> Response:
+    headers = {"ETag": entry.etag, "Cache-Control": cache_control}
+    if etag_matches(request, entry.etag):
+        inc_counter("response_cache_not_modified_total")
+        return Response(status_code=304, headers=headers)
+    return Response(entry.body, media_type="application/json", headers=headers)
+
+
+def cached_response(
+    namespace: str, ttl: float = 60.0, maxsize: int | None = None, vary: Optional[Vary] = None
+) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+    """Cache a JSON route's serialized body; put it below ``@router.get``.
+
+    The cache key is the query string plus ``vary(request, kwargs)``. Auth
+    dependencies still run on every request; only the handler and the
+    serialization are skipped. The handler's return value is encoded like
+    ``FastJSONResponse`` (no jsonable_encoder), so ``response_model`` is not
+    applied: use it on routes that return plain data.
+    """
+    cache = _caches.setdefault(namespace, TTLCache(maxsize=maxsize or settings.response_cache_max_entries, ttl=ttl))
+    cache_control = "private, no-cache" if vary is not None else "no-cache"
+
+    def decorate(fn: Callable[..., Any]) -> Callable[..., Any]:
+        signature = inspect.signature(fn)
+        request_param = next((p.name for p in signature.parameters.values() if p.annotation is Request), None)
+        params = list(signature.parameters.values())
+        if request_param is None:
+            request_param = "_cache_request"
+            params.append(inspect.Parameter(request_param, inspect.Parameter.KEYWORD_ONLY, annotation=Request))
+        is_async = inspect.iscoroutinefunction(fn)
+
+        @functools.wraps(fn)
+        async def wrapper(*args: Any, **kwargs: Any) -> Response:
+            request: Request = kwargs[request_param]
+            if request_param == "_cache_request":
+                del kwargs[request_param]
+            key = (request.url.query, vary(request, kwargs) if vary is not None else None)
+            entry = cache.get(key)
+            if entry is not None:
+                inc_counter("response_cache_hits_total")
+                return _respond(request, entry, cache_control)
+            inc_counter("response_cache_misses_total")
+            result = await fn(*args, **kwargs) if is_async else await run_in_threadpool(fn, *args, **kwargs)
+            if isinstance(result, Response):
+                return result
+            body = dumps(result)
+            entry = CachedResponse(body, _etag(body))
+            cache.set(key, entry)
+            return _respond(request, entry, cache_control)
+
+        wrapper.__signature__ = signature.replace(parameters=params)  # type: ignore[attr-defined]
+        return wrapper
+
+    return decorate
+
+
+def invalidate(namespace: str) -> None:
+    """Drop every cached response of ``namespace`` (call after writes that change it)."""
+    cache = _caches.get(namespace)
+    if cache is not None:
+        cache.clear()
+        inc_counter("response_cache_invalidations_total")
+
+
+def invalidate_all() -> None:
+    for namespace in list(_caches):
+        invalidate(namespace)
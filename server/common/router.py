@@ -1,24 +1,31 @@
+import asyncio
 import base64
+import json
 import os
+import time
 import uuid
 from datetime import datetime, timezone
+from typing import Literal
 
-from fastapi import APIRouter, Depends, Request, Response
-from pydantic import BaseModel
+from fastapi import APIRouter, Depends, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
 
-from server.common.deps import require_roles, get_optional_user
-from server.common.metrics import get_metrics, render_prometheus
-from server.common.audit import record_event, recent_events
-from server.models.user import User
+from server.common.deps import require_roles, get_optional_principal
+from server.common.metrics import exposition_response, get_metrics
+from server.common.audit import query_events, record_event
+from server.common.principal import Principal
+from server.common.response_cache import by_principal, cached_response
 from server.core.config import settings
-from server.core.database import get_db
-from server.core.security import hash_password, verify_password
+from server.core.database import get_async_db
+from server.core.responses import FastJSONResponse
+from server.core.security import hash_password_async, verify_password_async
 from sqlalchemy import text
-from sqlalchemy.orm import Session
-from server.common.utils.logging_utils import get_logs, set_log_level
+from sqlalchemy.ext.asyncio import AsyncSession
+from server.common.utils.logging_utils import get_logs, latest_seq, set_log_level
 
 
-router = APIRouter()
+router = APIRouter(prefix="/common", tags=["common"])
 
 
 @router.get("/health")
@@ -26,29 +33,50 @@ def health() -> dict:
     return {"status": "ok"}
 
 
-@router.get("/metrics")
+@router.get("/metrics", response_class=FastJSONResponse)
+@cached_response("common.metrics", ttl=1.0)
 def metrics() -> dict:
     return get_metrics()
 
 
 class AuditIn(BaseModel):
-    action: str
-    target: str | None = None
+    # Same limits as the audit_logs columns, so one oversized event cannot fail a whole batch insert
+    action: str = Field(min_length=1, max_length=64)
+    target: str | None = Field(None, max_length=255)
     meta: dict | None = None
 
 
 @router.post("/audit/events")
-def audit_event(payload: AuditIn, user: User = Depends(require_roles(["admin"]))):
+def audit_event(payload: AuditIn, user: Principal = Depends(require_roles(["admin"]))):
     record_event(action=payload.action, actor=user.email, target=payload.target, meta=payload.meta)
     return {"ok": True}
 
 
-@router.get("/audit/events")
-def audit_events(_: User = Depends(require_roles(["admin"]))):
-    return {"events": recent_events()}
+def _utc(value: datetime | None) -> datetime | None:
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc)
+
+
+@router.get("/audit/events", response_class=FastJSONResponse)
+async def audit_events(
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: int | None = None,
+    actor: str | None = None,
+    action: str | None = None,
+    since: datetime | None = None,
+    until: datetime | None = None,
+    db: AsyncSession = Depends(get_async_db),
+    _: Principal = Depends(require_roles(["admin"])),
+):
+    events, next_cursor = await query_events(
+        db, limit=limit, cursor=cursor, actor=actor, action=action, since=_utc(since), until=_utc(until)
+    )
+    return FastJSONResponse({"events": events, "next_cursor": next_cursor})
 
 
 @router.get("/version")
+@cached_response("common.version", ttl=300.0)
 def version() -> dict:
     return {
         "name": "takachanman unified server",
@@ -59,7 +87,8 @@ def version() -> dict:
 
 
 @router.get("/config")
-def config(_: User = Depends(require_roles(["admin"]))):
+@cached_response("common.config", ttl=300.0, vary=by_principal)
+def config(_: Principal = Depends(require_roles(["admin"]))):
     # sanitize secrets
     return {
         "env": settings.env,
@@ -67,6 +96,8 @@ def config(_: User = Depends(require_roles(["admin"]))):
         "cors_origins": settings.cors_origins,
         "rate_limit_max": settings.rate_limit_max,
         "rate_limit_window": settings.rate_limit_window,
+        "rate_limit_routes": settings.rate_limit_routes,
+        "rate_limit_principal": settings.rate_limit_principal,
         "database_url": settings.database_url or f"sqlite:///{settings.sqlite_path}",
         "access_token_expires_minutes": settings.access_token_expires_minutes,
         "refresh_token_expires_minutes": settings.refresh_token_expires_minutes,
@@ -117,8 +148,8 @@ class HashIn(BaseModel):
 
 
 @router.post("/crypto/hash")
-def crypto_hash(payload: HashIn, _: User = Depends(require_roles(["admin"]))):
-    return {"hash": hash_password(payload.text)}
+async def crypto_hash(payload: HashIn, _: Principal = Depends(require_roles(["admin"]))):
+    return {"hash": await hash_password_async(payload.text)}
 
 
 class VerifyIn(BaseModel):
@@ -127,8 +158,8 @@ class VerifyIn(BaseModel):
 
 
 @router.post("/crypto/verify")
-def crypto_verify(payload: VerifyIn, _: User = Depends(require_roles(["admin"]))):
-    return {"valid": verify_password(payload.text, payload.hashed)}
+async def crypto_verify(payload: VerifyIn, _: Principal = Depends(require_roles(["admin"]))):
+    return {"valid": await verify_password_async(payload.text, payload.hashed)}
 
 
 class B64In(BaseModel):
@@ -149,24 +180,24 @@ def b64_decode(payload: B64In) -> dict:
 
 
 @router.get("/env")
-def env_vars(_: User = Depends(require_roles(["admin"]))):
+def env_vars(_: Principal = Depends(require_roles(["admin"]))):
     env = {k: v for k, v in os.environ.items() if k.startswith("APP_")}
     return {"env": env}
 
 
 @router.get("/health/deep")
-def health_deep(db: Session = Depends(get_db)) -> dict:
+async def health_deep(db: AsyncSession = Depends(get_async_db)) -> dict:
     try:
-        db.execute(text("SELECT 1"))
+        await db.execute(text("SELECT 1"))
         return {"status": "ok", "db": True}
     except Exception:
         return {"status": "degraded", "db": False}
 
 
 @router.get("/readiness")
-def readiness(db: Session = Depends(get_db)) -> dict:
+async def readiness(db: AsyncSession = Depends(get_async_db)) -> dict:
     try:
-        db.execute(text("SELECT 1"))
+        await db.execute(text("SELECT 1"))
         return {"ready": True}
     except Exception:
         return {"ready": False}
@@ -178,24 +209,75 @@ def liveness() -> dict:
 
 
 @router.get("/whoami")
-def whoami(user: User | None = Depends(get_optional_user)) -> dict:
+def whoami(user: Principal | None = Depends(get_optional_principal)) -> dict:
     if not user:
         return {"authenticated": False, "user": None}
     return {
         "authenticated": True,
-        "user": {"id": user.id, "email": user.email, "roles": [r.name for r in user.roles]},
+        "user": {"id": user.id, "email": user.email, "roles": sorted(user.roles)},
     }
 
 
 @router.get("/metrics/prometheus")
-def metrics_prometheus() -> Response:
-    text = render_prometheus()
-    return Response(content=text, media_type="text/plain; version=0.0.4; charset=utf-8")
-
-
-@router.get("/logs")
-def logs(limit: int = 200, level: str | None = None, _: User = Depends(require_roles(["admin"]))):
-    return {"logs": get_logs(limit=limit, level=level)}
+def metrics_prometheus(request: Request) -> Response:
+    return exposition_response(request.headers.get("accept", ""), request.headers.get("accept-encoding", ""))
+
+
+_LOG_POLL_SECONDS = 0.5
+_LOG_KEEPALIVE_SECONDS = 15.0
+_LOG_STREAM_BATCH = 500
+
+
+@router.get("/logs", response_class=FastJSONResponse)
+async def logs(
+    request: Request,
+    limit: int = Query(200, ge=1, le=5000),
+    level: str | None = None,
+    since: int | None = Query(None, ge=0),
+    name: str | None = None,
+    follow: bool = False,
+    fmt: Literal["sse", "ndjson"] = Query("ndjson", alias="format"),
+    timeout: float = Query(300, gt=0, le=3600),
+    _: Principal = Depends(require_roles(["admin"])),
+):
+    """Recent logs, or those after ``since``; ``follow=true`` tails as SSE/NDJSON for ``timeout`` seconds."""
+    if not follow:
+        items = get_logs(limit=limit, level=level, since=since, name=name)
+        next_seq = items[-1]["seq"] if items else (since if since is not None else latest_seq())
+        return FastJSONResponse({"logs": items, "next_seq": next_seq})
+
+    last_event_id = request.headers.get("last-event-id", "")
+    if since is None:
+        since = int(last_event_id) if last_event_id.isdigit() else latest_seq()
+    sse = fmt == "sse"
+
+    async def tail():
+        cursor = since
+        deadline = time.monotonic() + timeout
+        keepalive = time.monotonic() + _LOG_KEEPALIVE_SECONDS
+        while time.monotonic() < deadline:
+            head = latest_seq()
+            if head <= cursor:
+                if sse and time.monotonic() >= keepalive:
+                    keepalive = time.monotonic() + _LOG_KEEPALIVE_SECONDS
+                    yield ": keepalive\n\n"
+                await asyncio.sleep(_LOG_POLL_SECONDS)
+                continue
+            items = get_logs(limit=_LOG_STREAM_BATCH, level=level, since=cursor, name=name)
+            for item in items:
+                data = json.dumps(item)
+                yield f"id: {item['seq']}\nevent: log\ndata: {data}\n\n" if sse else data + "\n"
+            if len(items) == _LOG_STREAM_BATCH:
+                cursor = items[-1]["seq"]
+            else:
+                # Everything matching up to ``head`` was sent; filtered-out records need not be scanned again
+                cursor = max(head, items[-1]["seq"]) if items else head
+
+    return StreamingResponse(
+        tail(),
+        media_type="text/event-stream" if sse else "application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 class LogLevelIn(BaseModel):
@@ -204,7 +286,7 @@ class LogLevelIn(BaseModel):
 
 
 @router.post("/logs/level")
-def logs_level(payload: LogLevelIn, _: User = Depends(require_roles(["admin"]))):
+def logs_level(payload: LogLevelIn, _: Principal = Depends(require_roles(["admin"]))):
     set_log_level(payload.name, payload.level)
     return {"ok": True}
 """/common 配下の共通APIルータ集。\nヘルス・メトリクス・監査・ユーティリティ・ログ関連エンドポイントを提供する。"""
@@ -0,0 +1,280 @@
+"""ユーザの一括登録（CSV / NDJSON）。
+アップロードをファイルに退避してジョブを作り、バックグラウンドで一定行数ずつ処理する。
+各バッチでは既存メールの確認とロール解決を1回ずつ行い、パスワードはログイン用とは別のスレッドで並列にハッシュし、
+users / user_roles を一括 INSERT して進捗（処理済み行数・行ごとのエラー）と同じトランザクションでコミットする。
+中断したジョブは処理済み行数の位置から再開できる。
+退避ファイルは平文のパスワードを含むため所有者だけが読める権限で作り、完了時に削除する。
+失敗/中断したジョブのファイルは再開用に `user_import_spool_ttl_seconds` の間だけ残す。"""
+import csv
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Set, Tuple
+
+from pydantic import ValidationError
+from sqlalchemy import insert, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from server.common.metrics import inc_counter
+from server.core.config import settings
+from server.core.database import SessionLocal
+from server.core.security import hash_password
+from server.models.user import Role, User, UserRole
+from server.models.user_import import UserImportJob
+from server.schemas.auth import UserImportRow
+
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ("csv", "ndjson")
+
+# One job at a time; the password pool is shared with logins
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="user-import")
+_active: Set[str] = set()
+_active_lock = threading.Lock()
+_stopping = threading.Event()
+# Hashing gets its own threads (bcrypt releases the GIL): a batch never queues in front of logins on the
+# password pool, and leaving CPUs to that pool keeps login latency bounded while an import runs
+_hash_pool = ThreadPoolExecutor(
+    max_workers=settings.user_import_hash_workers or max(1, (os.cpu_count() or 1) // 2),
+    thread_name_prefix="user-import-hash",
+)
+
+
+def hash_passwords(passwords: List[str]) -> List[str]:
+    return list(_hash_pool.map(hash_password, passwords))
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _read_rows(path: str, fmt: str) -> Iterator[Dict[str, Any]]:
+    """Raw rows in upload order; blank NDJSON lines are not rows."""
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        if fmt == "csv":
+            for row in csv.DictReader(f):
+                roles = (row.get("roles") or "").strip()
+                yield {
+                    "email": (row.get("email") or "").strip(),
+                    "password": row.get("password") or "",
+                    "roles": [r.strip() for r in roles.split(";") if r.strip()] if roles else None,
+                }
+            return
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                raw = json.loads(line)
+            except ValueError:
+                raw = None
+            yield raw if isinstance(raw, dict) else {"_error": "Invalid JSON object"}
+
+
+def _validate(raw: Dict[str, Any]) -> UserImportRow | str:
+    if "_error" in raw:
+        return raw["_error"]
+    try:
+        return UserImportRow.model_validate(raw)
+    except ValidationError as e:
+        return "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors())
+
+
+def _role_ids(db: Session, names: Set[str], known: Dict[str, int]) -> None:
+    """Fill ``known`` for ``names``, creating missing roles; one SELECT (+ one INSERT) per batch."""
+    missing = names - known.keys()
+    if not missing:
+        return
+    found = dict(db.execute(select(Role.name, Role.id).where(Role.name.in_(missing))).all())
+    if len(found) < len(missing):
+        insert_ = postgresql.insert if db.get_bind().dialect.name == "postgresql" else sqlite.insert
+        db.execute(insert_(Role).on_conflict_do_nothing(), [{"name": n} for n in missing - found.keys()])
+        found = dict(db.execute(select(Role.name, Role.id).where(Role.name.in_(missing))).all())
+    known.update(found)
+
+
+def _write_batch(
+    db: Session, rows: List[Tuple[int, UserImportRow, str]], role_ids: Dict[str, int]
+) -> Tuple[int, List[Dict[str, Any]]]:
+    """Insert the rows whose email is still free; returns (created, errors). Does not commit."""
+    errors: List[Dict[str, Any]] = []
+    taken = set(db.scalars(select(User.email).where(User.email.in_([r.email for _, r, _ in rows]))))
+    fresh = []
+    for rownum, row, hashed in rows:
+        if row.email in taken:
+            errors.append({"row": rownum, "email": row.email, "error": "Email already registered"})
+        else:
+            fresh.append((rownum, row, hashed))
+    if not fresh:
+        return 0, errors
+    _role_ids(db, {name for _, row, _ in fresh for name in (row.roles or settings.default_roles)}, role_ids)
+    ids = db.scalars(
+        insert(User).returning(User.id, sort_by_parameter_order=True),
+        [{"email": row.email, "hashed_password": hashed} for _, row, hashed in fresh],
+    ).all()
+    links = [
+        {"user_id": user_id, "role_id": role_ids[name]}
+        for user_id, (_, row, _) in zip(ids, fresh)
+        for name in dict.fromkeys(row.roles or settings.default_roles)
+    ]
+    if links:
+        db.execute(insert(UserRole), links)
+    return len(fresh), errors
+
+
+def _process_batch(db: Session, job: UserImportJob, batch: List[Tuple[int, Dict[str, Any]]], role_ids: Dict[str, int]) -> None:
+    errors: List[Dict[str, Any]] = []
+    valid: List[Tuple[int, UserImportRow]] = []
+    seen: Set[str] = set()
+    for rownum, raw in batch:
+        row = _validate(raw)
+        if isinstance(row, str):
+            errors.append({"row": rownum, "email": raw.get("email"), "error": row})
+        elif row.email in seen:
+            errors.append({"row": rownum, "email": row.email, "error": "Duplicate email in upload"})
+        else:
+            seen.add(row.email)
+            valid.append((rownum, row))
+    # Hash outside any transaction: this is the expensive part
+    hashed = hash_passwords([row.password for _, row in valid]) if valid else []
+    prepared = [(rownum, row, h) for (rownum, row), h in zip(valid, hashed)]
+    try:
+        created, write_errors = _write_batch(db, prepared, role_ids)
+    except IntegrityError:
+        # An email was registered concurrently; the retry sees it as taken
+        db.rollback()
+        role_ids.clear()  # roles created in the rolled-back transaction are gone too
+        created, write_errors = _write_batch(db, prepared, role_ids)
+    errors.extend(write_errors)
+    errors.sort(key=lambda e: e["row"])
+    # Progress commits with the rows, so ``processed`` is always a valid resume point
+    stored = job.errors or []
+    job.errors = stored + errors[: max(settings.user_import_max_errors - len(stored), 0)]
+    job.processed += len(batch)
+    job.created += created
+    job.failed += len(errors)
+    job.updated_at = _utcnow()
+    db.commit()
+    inc_counter("user_import_rows_total", len(batch))
+    inc_counter("user_import_users_created_total", created)
+
+
+def _run(job_id: str) -> None:
+    try:
+        with SessionLocal() as db:
+            job = db.get(UserImportJob, job_id)
+            if job is None or job.status == "completed":
+                return
+            job.status, job.message, job.updated_at = "running", None, _utcnow()
+            db.commit()
+            role_ids: Dict[str, int] = {}
+            try:
+                batch: List[Tuple[int, Dict[str, Any]]] = []
+                for rownum, raw in enumerate(_read_rows(job.path, job.format), start=1):
+                    if rownum <= job.processed:
+                        continue
+                    batch.append((rownum, raw))
+                    if len(batch) >= settings.user_import_batch_size:
+                        _process_batch(db, job, batch, role_ids)
+                        batch = []
+                        if _stopping.is_set():
+                            job.status, job.updated_at = "interrupted", _utcnow()
+                            db.commit()
+                            return
+                if batch:
+                    _process_batch(db, job, batch, role_ids)
+                job.status, job.updated_at = "completed", _utcnow()
+                db.commit()
+                remove_spool(job.path)
+            except Exception as e:
+                logger.exception("User import %s failed", job_id)
+                db.rollback()
+                job = db.get(UserImportJob, job_id)
+                job.status, job.message, job.updated_at = "failed", str(e)[:1024], _utcnow()
+                db.commit()
+                _expire_later(job.path)
+    finally:
+        with _active_lock:
+            _active.discard(job_id)
+
+
+def start_job(job_id: str) -> bool:
+    """Queue the job (new or resumed); False if it is already queued or running in this process."""
+    with _active_lock:
+        if job_id in _active:
+            return False
+        _active.add(job_id)
+    _executor.submit(_run, job_id)
+    return True
+
+
+def is_active(job_id: str) -> bool:
+    return job_id in _active
+
+
+def spool_path(job_id: str, fmt: str) -> str:
+    os.makedirs(settings.user_import_dir, mode=0o700, exist_ok=True)
+    return os.path.join(settings.user_import_dir, f"{job_id}.{fmt}")
+
+
+def open_spool(path: str) -> BinaryIO:
+    """Create the upload file readable by this user only; it holds plaintext passwords."""
+    return os.fdopen(os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600), "wb")
+
+
+def remove_spool(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def purge_expired_spools() -> int:
+    """Delete uploads older than ``user_import_spool_ttl_seconds`` unless their job is queued or running."""
+    try:
+        names = os.listdir(settings.user_import_dir)
+    except FileNotFoundError:
+        return 0
+    horizon, removed = time.time() - settings.user_import_spool_ttl_seconds, 0
+    for name in names:
+        if name.split(".", 1)[0] in _active:
+            continue
+        path = os.path.join(settings.user_import_dir, name)
+        try:
+            if os.path.getmtime(path) < horizon:
+                os.remove(path)
+                removed += 1
+        except FileNotFoundError:
+            continue
+    if removed:
+        inc_counter("user_import_spools_expired_total", removed)
+    return removed
+
+
+def _expire_later(path: str) -> None:
+    # A failed job keeps its upload for /resume only until the TTL runs out
+    try:
+        delay = os.path.getmtime(path) + settings.user_import_spool_ttl_seconds - time.time()
+    except FileNotFoundError:
+        return
+    timer = threading.Timer(max(0.0, delay) + 1, purge_expired_spools)
+    timer.daemon = True
+    timer.start()
+
+
+def wait_idle(timeout: Optional[float] = None) -> None:
+    """Block until queued jobs have run (tests, shutdown)."""
+    _executor.submit(lambda: None).result(timeout=timeout)
+
+
+def shutdown_user_import() -> None:
+    # The running job stops after its current batch and is left "interrupted" for /resume
+    _stopping.set()
+    _executor.shutdown(wait=False, cancel_futures=True)
+    _hash_pool.shutdown(wait=False, cancel_futures=True)
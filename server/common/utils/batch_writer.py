@@ -0,0 +1,143 @@
+"""バッチ書き込みキュー。
+呼び出し側は有界キューに積むだけで戻り、バックグラウンドスレッドが件数上限または
+待ち時間上限のどちらか早い方でまとめて書き出す（監査ログ・分析イベントの取り込み用）。"""
+import logging
+import threading
+import time
+from collections import deque
+from typing import Callable, Deque, Generic, List, Optional, Sequence, TypeVar
+
+
+T = TypeVar("T")
+
+logger = logging.getLogger(__name__)
+
+
+class BatchWriter(Generic[T]):
+    """Bounded queue drained in batches of up to ``max_batch`` items or every ``max_delay`` seconds.
+
+    ``write`` receives a list and runs on the writer thread (or the caller of
+    ``flush``); batches are written one at a time, in submission order. When a
+    batch fails, its items are retried one by one so a single bad item only
+    drops itself; items that still fail are logged, counted in ``failed`` and
+    dropped so they do not wedge the queue. ``submit``/``submit_many`` never block: when the items do not fit
+    they are rejected as a whole, counted in ``dropped`` and False is
+    returned. The thread starts on the first submit unless ``autostart`` is
+    False.
+    """
+
+    def __init__(
+        self,
+        write: Callable[[List[T]], None],
+        max_batch: int = 500,
+        max_delay: float = 1.0,
+        max_queue: int = 100_000,
+        name: str = "batch-writer",
+        autostart: bool = True,
+    ) -> None:
+        self._write = write
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.max_queue = max_queue
+        self.name = name
+        self.autostart = autostart
+        self._items: Deque[T] = deque()
+        self._cond = threading.Condition()
+        # Held while a batch is popped and written, so batches land in order
+        self._write_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = False
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+
+    def submit(self, item: T) -> bool:
+        return self.submit_many((item,))
+
+    def submit_many(self, items: Sequence[T]) -> bool:
+        """Enqueue all of ``items`` or none of them (one lock acquisition per call)."""
+        with self._cond:
+            if len(self._items) + len(items) > self.max_queue:
+                self.dropped += len(items)
+                return False
+            self._items.extend(items)
+            if len(self._items) >= self.max_batch:
+                self._cond.notify()
+        if self._thread is None and self.autostart:
+            self.start()
+        return True
+
+    def qsize(self) -> int:
+        return len(self._items)
+
+    def start(self) -> None:
+        with self._cond:
+            if self._thread is None:
+                self._stopping = False
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Stop the writer thread and write whatever is still queued."""
+        with self._cond:
+            thread, self._thread = self._thread, None
+            self._stopping = True
+            self._cond.notify_all()
+        if thread is not None:
+            thread.join(timeout)
+        self.flush()
+
+    def flush(self) -> int:
+        """Synchronously write everything queued so far; returns the number of items written."""
+        total = 0
+        while True:
+            written = self._write_next()
+            if written is None:
+                return total
+            total += written
+
+    def _write_next(self) -> Optional[int]:
+        with self._write_lock:
+            with self._cond:
+                if not self._items:
+                    return None
+                n = min(len(self._items), self.max_batch)
+                batch = [self._items.popleft() for _ in range(n)]
+            try:
+                self._write(batch)
+            except Exception:
+                if n == 1:
+                    self.failed += 1
+                    logger.exception("%s: dropping 1 item", self.name)
+                    return 0
+                logger.warning("%s: batch of %d failed; writing its items one by one", self.name, n, exc_info=True)
+                n = self._write_each(batch)
+        self.written += n
+        return n
+
+    def _write_each(self, batch: List[T]) -> int:
+        written = 0
+        for item in batch:
+            try:
+                self._write([item])
+                written += 1
+            except Exception:
+                self.failed += 1
+                logger.exception("%s: dropping 1 item", self.name)
+        return written
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._items and not self._stopping:
+                    self._cond.wait()
+                if self._stopping:
+                    return
+                # Let a partial batch fill up for at most max_delay
+                deadline = time.monotonic() + self.max_delay
+                while len(self._items) < self.max_batch and not self._stopping:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+            self._write_next()
@@ -0,0 +1,89 @@
+"""HyperLogLog（近似ユニーク数）。
+固定サイズのレジスタ列で重複を除いた件数を推定し、レジスタごとの max でマージできる（精度が違えば低い方へ畳み込む）。
+保存用に先頭1バイトの精度 + zlib 圧縮したレジスタ列へシリアライズする。"""
+import hashlib
+import math
+import zlib
+from typing import Hashable, Iterable, Optional
+
+
+class HyperLogLog:
+    """HyperLogLog with ``2**p`` one-byte registers (standard error ~1.04/sqrt(2**p))."""
+
+    __slots__ = ("p", "m", "registers")
+
+    def __init__(self, p: int = 12, registers: Optional[bytearray] = None) -> None:
+        if not 4 <= p <= 18:
+            raise ValueError("precision must be between 4 and 18")
+        self.p = p
+        self.m = 1 << p
+        self.registers = registers if registers is not None else bytearray(self.m)
+
+    @staticmethod
+    def hash(value: Hashable) -> int:
+        return int.from_bytes(hashlib.blake2b(str(value).encode(), digest_size=8).digest(), "big")
+
+    def add(self, value: Hashable) -> None:
+        self.add_hash(self.hash(value))
+
+    def add_hash(self, h: int) -> None:
+        """Add a precomputed 64-bit ``hash()``; lets one value feed several sketches cheaply."""
+        idx = h >> (64 - self.p)
+        rest = h & ((1 << (64 - self.p)) - 1)
+        rank = (64 - self.p) - rest.bit_length() + 1
+        if rank > self.registers[idx]:
+            self.registers[idx] = rank
+
+    def update(self, values: Iterable[Hashable]) -> None:
+        for value in values:
+            self.add(value)
+
+    def merge(self, other: "HyperLogLog") -> "HyperLogLog":
+        """Register-wise max; a sketch of different precision is folded to the lower ``p`` first."""
+        if other.p > self.p:
+            other = other.fold(self.p)
+        elif other.p < self.p:
+            folded = self.fold(other.p)
+            self.p, self.m, self.registers = folded.p, folded.m, folded.registers
+        self.registers = bytearray(map(max, self.registers, other.registers))
+        return self
+
+    def fold(self, p: int) -> "HyperLogLog":
+        """The same sketch at a lower precision ``p``, as if every value had been added to it directly."""
+        if p > self.p:
+            raise ValueError("can only fold to a lower precision")
+        shift = self.p - p
+        registers = bytearray(1 << p)
+        for idx, rank in enumerate(self.registers):
+            if not rank:
+                continue
+            # The dropped index bits become the leading bits of the remaining hash
+            dropped = idx & ((1 << shift) - 1)
+            rank = shift - dropped.bit_length() + 1 if dropped else rank + shift
+            target = idx >> shift
+            if rank > registers[target]:
+                registers[target] = rank
+        return HyperLogLog(p, registers)
+
+    def count(self) -> int:
+        m = self.m
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            # Small-range correction (linear counting)
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+    def __len__(self) -> int:
+        return self.count()
+
+    def to_bytes(self) -> bytes:
+        # Mostly-empty sketches (small buckets) compress to a few bytes
+        return bytes([self.p]) + zlib.compress(bytes(self.registers), 1)
+
+    @classmethod
+    def from_bytes(cls, data: bytes | None, p: int = 12) -> "HyperLogLog":
+        if not data:
+            return cls(p)
+        return cls(data[0], bytearray(zlib.decompress(data[1:])))
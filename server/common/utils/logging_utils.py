@@ -1,11 +1,19 @@
+import bisect
+import json
 import logging
-from collections import deque
-from dataclasses import dataclass, asdict
-from typing import Deque, Dict, List, Optional
+import logging.handlers
+import queue
+from array import array
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from server.common.metrics import REGISTRY, inc_counter
+from server.core.config import settings
 
 
 @dataclass
 class LogRecord:
+    seq: int
     name: str
     level: str
     message: str
@@ -13,46 +21,224 @@ class LogRecord:
 
 
 class RingBufferHandler(logging.Handler):
+    """Fixed-capacity ring of the most recent records, addressed by sequence number.
+
+    Record ``seq`` lives in slot ``seq % capacity``; anything older than
+    ``latest_seq - capacity`` has been overwritten. Each level keeps a sorted
+    array of its sequence numbers so a level-filtered read starts with a
+    bisect. ``emit`` keeps only ``(name, levelname, created, message)``, so a
+    slot never holds on to the record's args, exception or traceback frames.
+    With ``log_pipeline="queue"`` that formatting happens on the listener
+    thread; in the default ``direct`` mode it runs inline on the logging thread.
+    """
+
     def __init__(self, capacity: int = 1000) -> None:
         super().__init__()
-        self.buffer: Deque[LogRecord] = deque(maxlen=capacity)
+        self.capacity = capacity
+        self._slots: List[Optional[Tuple[str, str, float, str]]] = [None] * capacity
+        self._seqs = array("q", [0]) * capacity
+        self._by_level: Dict[str, array] = {}
+        self.latest_seq = 0
+
+    @property
+    def oldest_seq(self) -> int:
+        return max(self.latest_seq - self.capacity + 1, 1)
 
     def emit(self, record: logging.LogRecord) -> None:  # type: ignore[override]
         try:
-            msg = self.format(record)
+            message = self.format(record)
         except Exception:  # pragma: no cover
-            msg = record.getMessage()
-        self.buffer.append(
-            LogRecord(name=record.name, level=record.levelname, message=msg, created=record.created)
-        )
+            message = record.getMessage()
+        # Called under self.lock (Handler.handle)
+        seq = self.latest_seq + 1
+        slot = seq % self.capacity
+        self._slots[slot] = (record.name, record.levelname, record.created, message)
+        self._seqs[slot] = seq
+        index = self._by_level.get(record.levelname)
+        if index is None:
+            index = self._by_level[record.levelname] = array("q")
+        index.append(seq)
+        if len(index) > 2 * self.capacity:
+            del index[: bisect.bisect_left(index, seq - self.capacity + 1)]
+        self.latest_seq = seq
+
+    def read(
+        self,
+        limit: int = 200,
+        level: Optional[str] = None,
+        since: Optional[int] = None,
+        name_prefix: Optional[str] = None,
+    ) -> List[LogRecord]:
+        """Up to ``limit`` records, oldest first: the newest ones, or the first ones after ``since``.
+
+        Only the slots that are returned (plus those skipped by ``name_prefix``) are touched.
+        """
+        picked = []
+        with self.lock:
+            first = self.oldest_seq if since is None else max(since + 1, self.oldest_seq)
+            index = None
+            if level is None:
+                positions = range(first, self.latest_seq + 1)
+            else:
+                index = self._by_level.get(level, array("q"))
+                positions = range(bisect.bisect_left(index, first), len(index))
+            for pos in positions if since is not None else reversed(positions):
+                if len(picked) >= limit:
+                    break
+                seq = pos if index is None else index[pos]
+                slot = seq % self.capacity
+                entry = self._slots[slot]
+                if entry is None or self._seqs[slot] != seq:
+                    continue
+                if name_prefix and not entry[0].startswith(name_prefix):
+                    continue
+                picked.append((seq, entry))
+        if since is None:
+            picked.reverse()
+        return [LogRecord(seq, name, level, message, created) for seq, (name, level, created, message) in picked]
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Enqueue-only handler for the request path; past ``maxsize`` queued records it drops and counts.
+
+    Backed by a ``queue.SimpleQueue`` (a C-level put, no Condition round trip);
+    the bound is checked against its O(1) ``qsize``.
+    """
+
+    def __init__(self, records: "queue.SimpleQueue[logging.LogRecord]", maxsize: int) -> None:
+        super().__init__(records)
+        self.maxsize = maxsize
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The listener thread formats; the stock prepare() would format here on the caller
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        if self.queue.qsize() >= self.maxsize:
+            self.dropped += 1
+            inc_counter("log_records_dropped_total")
+            return
+        self.queue.put_nowait(record)
+
+
+class JsonLinesFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": record.created,
+            "level": record.levelname,
+            "name": record.name,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
 
 
 _handler: Optional[RingBufferHandler] = None
+_attached: List[logging.Handler] = []
+_listener: Optional[logging.handlers.QueueListener] = None
+
+_TARGET_LOGGERS = ("", "uvicorn", "uvicorn.access", "uvicorn.error")
+
+
+def _sinks(file_path: Optional[str], jsonl_path: Optional[str]) -> List[logging.Handler]:
+    sinks: List[logging.Handler] = []
+    if file_path:
+        text = logging.FileHandler(file_path, encoding="utf-8")
+        text.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+        sinks.append(text)
+    if jsonl_path:
+        lines = logging.FileHandler(jsonl_path, encoding="utf-8")
+        lines.setFormatter(JsonLinesFormatter())
+        sinks.append(lines)
+    return sinks
 
 
-def register_handler(capacity: int = 1000) -> None:
-    global _handler
+def register_handler(
+    capacity: Optional[int] = None,
+    pipeline: Optional[str] = None,
+    file_path: Optional[str] = None,
+    jsonl_path: Optional[str] = None,
+    queue_max: Optional[int] = None,
+) -> None:
+    """Attach the ring buffer (and optional file / JSON-lines sinks) to the root and uvicorn loggers.
+
+    ``pipeline="direct"`` attaches them as-is. ``pipeline="queue"`` attaches a
+    single bounded ``DroppingQueueHandler`` instead, and a ``QueueListener``
+    thread fans records out to the ring and sinks. Arguments default to the
+    ``log_*`` settings.
+    """
+    global _handler, _listener
     if _handler is not None:
         return
-    _handler = RingBufferHandler(capacity=capacity)
-    _handler.setLevel(logging.INFO)
+    pipeline = pipeline or settings.log_pipeline
+    if pipeline not in ("direct", "queue"):
+        raise ValueError(f"Unknown log pipeline: {pipeline}")
+    _handler = RingBufferHandler(capacity=capacity or settings.log_buffer_capacity)
+    handlers = [_handler, *_sinks(file_path or settings.log_file_path, jsonl_path or settings.log_jsonl_path)]
+    for h in handlers:
+        h.setLevel(logging.INFO)
+    if pipeline == "queue":
+        records: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+        front = DroppingQueueHandler(records, queue_max or settings.log_queue_max)
+        front.setLevel(logging.INFO)
+        _listener = logging.handlers.QueueListener(records, *handlers, respect_handler_level=True)
+        _listener.start()
+        _attached[:] = [front]
+    else:
+        _attached[:] = handlers
     # Attach to root and uvicorn loggers
-    root = logging.getLogger()
-    root.addHandler(_handler)
-    for name in ("uvicorn", "uvicorn.access", "uvicorn.error"):
-        logging.getLogger(name).addHandler(_handler)
+    for name in _TARGET_LOGGERS:
+        for h in _attached:
+            logging.getLogger(name).addHandler(h)
+
+
+def shutdown_logging() -> None:
+    """Detach the handlers, drain the queue (if any) and close the sinks; ``register_handler`` may be called again."""
+    global _handler, _listener
+    for name in _TARGET_LOGGERS:
+        for h in _attached:
+            logging.getLogger(name).removeHandler(h)
+    if _listener is not None:
+        _listener.stop()
+        for h in _listener.handlers:
+            h.close()
+        _listener = None
+    else:
+        for h in _attached:
+            h.close()
+    _attached.clear()
+    _handler = None
 
 
-def get_logs(limit: int = 200, level: Optional[str] = None) -> List[Dict[str, object]]:
+def log_queue_depth() -> int:
+    return _listener.queue.qsize() if _listener is not None else 0
+
+
+def latest_seq() -> int:
+    return _handler.latest_seq if _handler is not None else 0
+
+
+def get_logs(
+    limit: int = 200,
+    level: Optional[str] = None,
+    since: Optional[int] = None,
+    name: Optional[str] = None,
+) -> List[Dict[str, object]]:
     if _handler is None:
         return []
-    items = list(_handler.buffer)
-    if level:
-        level = level.upper()
-        items = [r for r in items if r.level == level]
-    return [asdict(r) for r in items[-limit:]]
+    # Fresh objects per call, so their __dict__ can be handed out without asdict's deep copy
+    return [vars(r) for r in _handler.read(limit, level.upper() if level else None, since, name)]
+
+
+REGISTRY.gauge("log_queue_depth", "Log records waiting for the queue listener", fn=log_queue_depth)
 
 
 def set_log_level(name: str, level: str) -> None:
     logging.getLogger(name).setLevel(level.upper())
-"""ログユーティリティ。\nリングバッファハンドラによる最近ログの収集・取得と、ログレベル変更を提供する。"""
+"""ログユーティリティ。
+固定長リングバッファハンドラ（連番付き・レベル別インデックス）による最近ログの収集・取得と、ログレベル変更を提供する。
+取得は連番カーソル（since）・レベル・ロガー名接頭辞で絞り込め、バッファ全体はコピーしない。
+queue モードではリクエスト経路はキューに積むだけで、バックグラウンドのリスナがリングバッファと
+ファイル/JSON Lines シンクへ振り分ける（キューが満杯なら破棄して件数を数える）。"""
@@ -1,29 +1,137 @@
-from typing import List
+from typing import Dict, List
 
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
+# Placeholder shipped in the code; anything keyed on it is forgeable
+DEFAULT_SECRET_KEY = "changeme-secret"
+
+
 class Settings(BaseSettings):
     model_config = SettingsConfigDict(env_file=".env", env_prefix="APP_", case_sensitive=False)
 
     # App
     env: str = "local"
     debug: bool = True
-    secret_key: str = "changeme-secret"
+    secret_key: str = DEFAULT_SECRET_KEY
     access_token_expires_minutes: int = 30
     refresh_token_expires_minutes: int = 60 * 24 * 7  # 7 days
 
+    # Password hashing worker pool ("process" or "thread"; 0 workers = CPU count)
+    password_pool_kind: str = "process"
+    password_pool_workers: int = 0
+    password_pool_max_queue: int = 64
+
     # CORS & rate limit
     cors_origins: List[str] = ["*"]
     rate_limit_max: int = 60
     rate_limit_window: int = 60
+    # Per-route overrides {"<path prefix>": "<limit>/<window seconds>"} and an optional per-principal limit
+    rate_limit_routes: Dict[str, str] = {}
+    rate_limit_principal: str | None = None
+    # "memory" (per process) or "sqlite" (shared by all workers using the same file)
+    rate_limit_backend: str = "memory"
+    rate_limit_sqlite_path: str = "./ratelimit.db"
+    # Shared (sqlite) backend: a decision slower than this fails open (also the SQLite busy timeout)
+    rate_limit_backend_timeout: float = 0.05
+
+    # Request pipeline stages, outermost first: "metrics", "rate_limit", "access_log"
+    middleware_order: List[str] = ["metrics", "rate_limit"]
+
+    # Logging: "direct" handlers on the calling thread, or "queue" (bounded queue + background listener)
+    log_pipeline: str = "direct"
+    log_queue_max: int = 10_000
+    log_buffer_capacity: int = 1000
+    log_file_path: str | None = None
+    log_jsonl_path: str | None = None
+
+    # Metrics: per-metric label-set cap; set multiproc_dir to aggregate across workers
+    metrics_max_series: int = 1000
+    metrics_multiproc_dir: str | None = None
+    metrics_flush_interval: float = 5.0
 
     # DB
     sqlite_path: str = "./app.db"
     database_url: str | None = None
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    db_pool_timeout: float = 30.0
+    db_pool_recycle: int = 1800
+    db_pool_pre_ping: bool = True
+    sqlite_journal_mode: str = "WAL"
+    sqlite_synchronous: str = "NORMAL"
+    sqlite_busy_timeout_ms: int = 5000
 
     # RBAC
     default_roles: List[str] = ["user"]
+    # Roles that hold every permission
+    superuser_roles: List[str] = ["admin"]
+
+    # Bulk user import: uploads are spooled to user_import_dir and committed user_import_batch_size rows at a time
+    user_import_dir: str = "./imports"
+    user_import_batch_size: int = 500
+    user_import_max_bytes: int = 64 * 1024 * 1024
+    user_import_max_errors: int = 1000
+    # Uploads of failed/interrupted jobs are kept this long for /resume, then deleted
+    user_import_spool_ttl_seconds: int = 86400
+    # Import hashing threads, separate from the login password pool; 0 = half the CPUs (at least 1)
+    user_import_hash_workers: int = 0
+
+    # Audit log: events are queued and written in batches of up to audit_batch_size or every audit_flush_interval seconds
+    audit_batch_size: int = 500
+    audit_flush_interval: float = 1.0
+    audit_queue_max: int = 100_000
+
+    # Analytics ingestion: bounded in-process queue drained by a bulk-insert writer
+    analytics_queue_max: int = 200_000
+    analytics_batch_size: int = 2000
+    analytics_flush_interval: float = 0.5
+    analytics_max_events_per_request: int = 10_000
+    analytics_max_request_bytes: int = 8 * 1024 * 1024
+    # Per-minute/hour/day rollups maintained by the writer; HyperLogLog precision for uniques (2**p bytes per bucket)
+    analytics_rollups_enabled: bool = True
+    analytics_hll_precision: int = 12
+    analytics_max_query_buckets: int = 10_000
+
+    # Idempotency-Key store: responses kept this long; a "pending" claim older than the timeout may be taken over
+    idempotency_ttl_seconds: int = 24 * 3600
+    idempotency_pending_timeout: int = 60
+    idempotency_cache_max_entries: int = 10000
+
+    # JWT signing keys [{"kid", "alg": "HS256"|"ES256"|"EdDSA", "secret"|"private_key[_file]"|"public_key[_file]"}];
+    # empty = one key of jwt_algorithm (HS256 from secret_key, or an ephemeral keypair for ES256/EdDSA)
+    jwt_algorithm: str = "HS256"
+    jwt_keys: List[Dict[str, str]] = []
+    jwt_active_kid: str | None = None
+    # Accept tokens without a kid (issued before key ids) against secret_key (HS256).
+    # None = only when jwt_algorithm is HS256; never with the built-in default secret_key
+    jwt_accept_unkeyed: bool | None = None
+    # Verify-only nodes: fetch unknown kids from this JWKS URL
+    jwt_jwks_url: str | None = None
+    jwks_max_age_seconds: int = 300
+
+    # Refresh-token store: revocations from other workers are picked up (and expired rows deleted) this often
+    refresh_token_sweep_interval: float = 60.0
+
+    # Verified access/refresh token cache (keyed by token digest, bounded by each token's exp)
+    token_cache_ttl_seconds: int = 300
+    token_cache_max_entries: int = 10000
+
+    # Auth principal cache (keyed by token sub)
+    principal_cache_ttl_seconds: int = 60
+    principal_cache_max_entries: int = 10000
+
+    # JSON encoder for FastJSONResponse: auto | orjson | msgspec | stdlib (missing packages fall back to stdlib)
+    json_encoder: str = "auto"
+    # Use FastJSONResponse as every route's default response class
+    fast_json_default: bool = False
+
+    # service1 item read-through cache (by id); 0 disables it
+    item_cache_ttl_seconds: float = 30.0
+    item_cache_max_entries: int = 10000
+
+    # Response cache (serialized bodies + ETag), per cached route
+    response_cache_max_entries: int = 1024
 
     @property
     def sqlalch_db_url(self) -> str:
@@ -1,12 +1,139 @@
-from sqlalchemy import create_engine
+import threading
+import time
+
+from typing import AsyncIterator, Dict, Tuple
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, Pool, QueuePool, StaticPool
 from sqlalchemy.orm import sessionmaker, declarative_base, Session
 
+from server.common.metrics import REGISTRY
 from server.core.config import settings
 
 
-connect_args = {"check_same_thread": False} if settings.sqlalch_db_url.startswith("sqlite") else {}
-engine = create_engine(settings.sqlalch_db_url, connect_args=connect_args, future=True)
+# Every pool metric carries engine="sync" (get_db/SessionLocal) or engine="async" (get_async_db)
+_checkout_seconds = REGISTRY.histogram(
+    "db_pool_checkout_seconds",
+    "Time spent waiting for a pooled DB connection",
+    ("engine",),
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0),
+)
+_in_use = REGISTRY.gauge("db_pool_in_use", "DB connections currently checked out", ("engine",))
+_in_use_counts: Dict[str, int] = {}
+_in_use_lock = threading.Lock()
+
+
+class _TimedCheckout:
+    """Pool mixin that records how long each checkout waited."""
+
+    # A class attribute, so pools recreated by engine.dispose() keep their label
+    engine_label = "sync"
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()  # type: ignore[misc]
+        finally:
+            _checkout_seconds.observe(time.perf_counter() - start, (self.engine_label,))
+
+
+class InstrumentedQueuePool(_TimedCheckout, QueuePool):
+    pass
+
+
+class InstrumentedStaticPool(_TimedCheckout, StaticPool):
+    pass
+
+
+class InstrumentedAsyncQueuePool(_TimedCheckout, AsyncAdaptedQueuePool):
+    engine_label = "async"
+
+
+class InstrumentedAsyncStaticPool(_TimedCheckout, StaticPool):
+    engine_label = "async"
+
+
+def _engine_options(url: str, is_async: bool = False) -> dict:
+    queue_pool = InstrumentedAsyncQueuePool if is_async else InstrumentedQueuePool
+    if url.startswith("sqlite"):
+        connect_args: dict = {"timeout": settings.sqlite_busy_timeout_ms / 1000}
+        if not is_async:
+            connect_args["check_same_thread"] = False
+        options: dict = {"connect_args": connect_args}
+        if ":memory:" in url or url.rstrip("/") == "sqlite:":
+            # One shared connection, otherwise every checkout sees a fresh empty database
+            options["poolclass"] = InstrumentedAsyncStaticPool if is_async else InstrumentedStaticPool
+        else:
+            options.update(
+                poolclass=queue_pool,
+                pool_size=settings.db_pool_size,
+                max_overflow=settings.db_max_overflow,
+                pool_timeout=settings.db_pool_timeout,
+            )
+        return options
+    return {
+        "poolclass": queue_pool,
+        "pool_size": settings.db_pool_size,
+        "max_overflow": settings.db_max_overflow,
+        "pool_timeout": settings.db_pool_timeout,
+        "pool_recycle": settings.db_pool_recycle,
+        "pool_pre_ping": settings.db_pool_pre_ping,
+    }
+
+
+def _set_sqlite_pragmas(dbapi_conn, _record) -> None:
+    cursor = dbapi_conn.cursor()
+    cursor.execute(f"PRAGMA journal_mode={settings.sqlite_journal_mode}")
+    cursor.execute(f"PRAGMA synchronous={settings.sqlite_synchronous}")
+    cursor.execute(f"PRAGMA busy_timeout={int(settings.sqlite_busy_timeout_ms)}")
+    cursor.close()
+
+
+def _track_in_use(target, label: str) -> None:
+    # Registered on the engine, so the listeners carry over to pools recreated by dispose()
+    def adjust(delta: int) -> None:
+        with _in_use_lock:
+            count = _in_use_counts[label] = _in_use_counts.get(label, 0) + delta
+            _in_use.set(count, (label,))
+
+    event.listen(target, "checkout", lambda *_args: adjust(1))
+    event.listen(target, "checkin", lambda *_args: adjust(-1))
+    adjust(0)
+
+
+def _overflow(pool: Pool) -> float:
+    return max(pool.overflow(), 0) if isinstance(pool, QueuePool) else 0
+
+
+def _pool_overflow() -> Dict[Tuple[str, ...], float]:
+    return {("sync",): _overflow(engine.pool), ("async",): _overflow(async_engine.sync_engine.pool)}
+
+
+def async_db_url(url: str) -> str:
+    """Map a sync SQLAlchemy URL to its asyncio driver (aiosqlite / asyncpg)."""
+    scheme, sep, rest = url.partition("://")
+    driver = {
+        "sqlite": "sqlite+aiosqlite",
+        "postgresql": "postgresql+asyncpg",
+        "postgresql+psycopg2": "postgresql+asyncpg",
+        "postgres": "postgresql+asyncpg",
+    }.get(scheme, scheme)
+    return f"{driver}{sep}{rest}"
+
+
+engine = create_engine(settings.sqlalch_db_url, future=True, **_engine_options(settings.sqlalch_db_url))
+async_engine = create_async_engine(
+    async_db_url(settings.sqlalch_db_url), **_engine_options(settings.sqlalch_db_url, is_async=True)
+)
+if settings.sqlalch_db_url.startswith("sqlite"):
+    event.listen(engine, "connect", _set_sqlite_pragmas)
+    event.listen(async_engine.sync_engine, "connect", _set_sqlite_pragmas)
+_track_in_use(engine, "sync")
+_track_in_use(async_engine.sync_engine, "async")
+REGISTRY.gauge("db_pool_overflow", "DB connections opened beyond pool_size", ("engine",), fn=_pool_overflow)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine, future=True)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
 Base = declarative_base()
 
 
@@ -18,9 +145,23 @@ def get_db() -> Session:
         db.close()
 
 
+async def get_async_db() -> AsyncIterator[AsyncSession]:
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
 def create_all() -> None:
-    from server.models.user import User, Role, UserRole  # noqa: F401
+    from server.models.user import User, Role, UserRole, Permission  # noqa: F401
+    from server.models.audit import AuditLog  # noqa: F401
+    from server.models.analytics import AnalyticsEvent, AnalyticsRollup  # noqa: F401
+    from server.models.token import RefreshToken  # noqa: F401
+    from server.models.user_import import UserImportJob  # noqa: F401
+    from server.models.payments import Invoice, Refund  # noqa: F401
+    from server.models.idempotency import IdempotencyKey  # noqa: F401
+    from server.models.item import Item  # noqa: F401
 
     Base.metadata.create_all(bind=engine)
 """データベース接続管理（SQLAlchemy）。
-Engine/Session/Base の生成とテーブル作成ヘルパーを提供する。"""
+Engine/Session/Base の生成（同期版と asyncio 版）とテーブル作成ヘルパーを提供する。
+接続プールは Settings で調整でき、SQLite では WAL/synchronous/busy_timeout を設定する。
+チェックアウト待ち時間・使用中接続数・オーバーフロー数を、同期/asyncio のエンジン別ラベル付きでメトリクスに出力する。"""
@@ -0,0 +1,310 @@
+"""JWT 署名鍵リング。
+kid をキーに複数の鍵（HS256 / ES256 / EdDSA）を保持し、署名は現用鍵、検証はヘッダの kid で O(1) に鍵を引く。
+公開鍵は読み込み時に一度だけデシリアライズして保持し、JWKS として公開できる。
+秘密を持たない検証専用ノードは公開鍵（または JWKS URL）だけで検証できる。"""
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import threading
+import time
+import urllib.request
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Tuple
+
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519
+from cryptography.hazmat.primitives.asymmetric.utils import decode_dss_signature, encode_dss_signature
+
+from server.common.utils.cache import TTLCache
+from server.core.config import DEFAULT_SECRET_KEY
+
+
+ALGORITHMS = ("HS256", "ES256", "EdDSA")
+
+logger = logging.getLogger(__name__)
+
+
+def b64url_encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def b64url_decode(segment: str) -> bytes:
+    return base64.urlsafe_b64decode(segment + "=" * (-len(segment) % 4))
+
+
+@dataclass(frozen=True)
+class SigningKey:
+    kid: str
+    alg: str
+    secret: Optional[bytes] = None  # HS256
+    private_key: Any = None  # ES256 / EdDSA; None for verify-only keys
+    public_key: Any = None
+
+    @property
+    def can_sign(self) -> bool:
+        return self.secret is not None or self.private_key is not None
+
+    def sign(self, signing_input: bytes) -> bytes:
+        if self.alg == "HS256":
+            return hmac.new(self.secret, signing_input, hashlib.sha256).digest()
+        if self.private_key is None:
+            raise ValueError(f"Key {self.kid!r} is verify-only")
+        if self.alg == "EdDSA":
+            return self.private_key.sign(signing_input)
+        # JWS wants the raw 64-byte r || s, not DER
+        r, s = decode_dss_signature(self.private_key.sign(signing_input, ec.ECDSA(hashes.SHA256())))
+        return r.to_bytes(32, "big") + s.to_bytes(32, "big")
+
+    def verify(self, signing_input: bytes, signature: bytes) -> bool:
+        if self.alg == "HS256":
+            return self.secret is not None and hmac.compare_digest(self.sign(signing_input), signature)
+        try:
+            if self.alg == "EdDSA":
+                self.public_key.verify(signature, signing_input)
+            else:
+                if len(signature) != 64:
+                    return False
+                der = encode_dss_signature(int.from_bytes(signature[:32], "big"), int.from_bytes(signature[32:], "big"))
+                self.public_key.verify(der, signing_input, ec.ECDSA(hashes.SHA256()))
+        except InvalidSignature:
+            return False
+        return True
+
+    def jwk(self) -> Optional[Dict[str, str]]:
+        """Public JWK (RFC 7517/8037); None for symmetric keys."""
+        if self.alg == "HS256":
+            return None
+        if self.alg == "EdDSA":
+            raw = self.public_key.public_bytes(serialization.Encoding.Raw, serialization.PublicFormat.Raw)
+            return {"kty": "OKP", "crv": "Ed25519", "x": b64url_encode(raw), "kid": self.kid, "alg": "EdDSA", "use": "sig"}
+        numbers = self.public_key.public_numbers()
+        return {
+            "kty": "EC",
+            "crv": "P-256",
+            "x": b64url_encode(numbers.x.to_bytes(32, "big")),
+            "y": b64url_encode(numbers.y.to_bytes(32, "big")),
+            "kid": self.kid,
+            "alg": "ES256",
+            "use": "sig",
+        }
+
+    @classmethod
+    def generate(cls, alg: str, kid: Optional[str] = None) -> "SigningKey":
+        if alg == "EdDSA":
+            private = ed25519.Ed25519PrivateKey.generate()
+        elif alg == "ES256":
+            private = ec.generate_private_key(ec.SECP256R1())
+        else:
+            raise ValueError(f"Cannot generate a key for {alg}")
+        key = cls(kid="", alg=alg, private_key=private, public_key=private.public_key())
+        return cls(kid=kid or _thumbprint(key), alg=alg, private_key=private, public_key=private.public_key())
+
+    @classmethod
+    def from_config(cls, entry: Mapping[str, str]) -> "SigningKey":
+        """Build from ``{"kid", "alg", "secret" | "private_key[_file]" | "public_key[_file]"}``."""
+        alg = entry.get("alg", "HS256")
+        if alg not in ALGORITHMS:
+            raise ValueError(f"Unsupported JWT algorithm: {alg}")
+        if alg == "HS256":
+            return cls(kid=entry["kid"], alg=alg, secret=entry["secret"].encode())
+        private_pem = _pem(entry, "private_key")
+        if private_pem:
+            private = serialization.load_pem_private_key(private_pem, password=None)
+            public = private.public_key()
+        else:
+            private = None
+            public = serialization.load_pem_public_key(_pem(entry, "public_key") or b"")
+        expected = ed25519.Ed25519PublicKey if alg == "EdDSA" else ec.EllipticCurvePublicKey
+        if not isinstance(public, expected) or (alg == "ES256" and public.curve.name != "secp256r1"):
+            raise ValueError(f"Key {entry.get('kid')!r} does not match {alg}")
+        key = cls(kid="", alg=alg, private_key=private, public_key=public)
+        return cls(kid=entry.get("kid") or _thumbprint(key), alg=alg, private_key=private, public_key=public)
+
+    @classmethod
+    def from_jwk(cls, jwk: Mapping[str, str]) -> "SigningKey":
+        if jwk.get("kty") == "OKP" and jwk.get("crv") == "Ed25519":
+            public = ed25519.Ed25519PublicKey.from_public_bytes(b64url_decode(jwk["x"]))
+            return cls(kid=jwk["kid"], alg="EdDSA", public_key=public)
+        if jwk.get("kty") == "EC" and jwk.get("crv") == "P-256":
+            numbers = ec.EllipticCurvePublicNumbers(
+                int.from_bytes(b64url_decode(jwk["x"]), "big"), int.from_bytes(b64url_decode(jwk["y"]), "big"), ec.SECP256R1()
+            )
+            return cls(kid=jwk["kid"], alg="ES256", public_key=numbers.public_key())
+        raise ValueError(f"Unsupported JWK: kty={jwk.get('kty')} crv={jwk.get('crv')}")
+
+
+def _pem(entry: Mapping[str, str], name: str) -> Optional[bytes]:
+    if entry.get(name):
+        return entry[name].encode()
+    path = entry.get(f"{name}_file")
+    if path:
+        with open(path, "rb") as f:
+            return f.read()
+    return None
+
+
+def _thumbprint(key: SigningKey) -> str:
+    """RFC 7638 JWK thumbprint, truncated; a stable kid for keys configured without one."""
+    jwk = key.jwk() or {}
+    members = {k: jwk[k] for k in ("crv", "kty", "x", "y") if k in jwk}
+    digest = hashlib.sha256(json.dumps(members, sort_keys=True, separators=(",", ":")).encode()).digest()
+    return b64url_encode(digest)[:16]
+
+
+def _accept_unkeyed(settings: Any) -> bool:
+    """Whether kid-less HS256 tokens verify against ``secret_key``; off by default for asymmetric setups."""
+    accept = settings.jwt_accept_unkeyed
+    if accept is None:
+        accept = settings.jwt_algorithm == "HS256"
+    if not accept:
+        return False
+    if settings.secret_key == DEFAULT_SECRET_KEY:
+        logger.warning("Not accepting tokens without a kid: APP_SECRET_KEY is the built-in default")
+        return False
+    logger.warning("Accepting HS256 tokens without a kid against APP_SECRET_KEY (APP_JWT_ACCEPT_UNKEYED)")
+    return True
+
+
+class Keyring:
+    """Keys indexed by ``kid``; signs with the active key and verifies by the token header's ``kid``.
+
+    Tokens without a ``kid`` (issued before keys had ids) are checked against
+    ``unkeyed``. When ``jwks_url`` is set, the JWKS is fetched in a background
+    thread (at construction, then on an unknown ``kid`` at most once per
+    ``jwks_min_refresh`` seconds) and the public keys found are kept. The
+    request path never waits for it: an unknown ``kid`` fails until the fetch
+    has added the key, and is remembered as unknown for ``jwks_min_refresh``.
+    """
+
+    def __init__(
+        self,
+        keys: Iterable[SigningKey],
+        active_kid: Optional[str] = None,
+        unkeyed: Optional[SigningKey] = None,
+        jwks_url: Optional[str] = None,
+        jwks_min_refresh: float = 30.0,
+    ) -> None:
+        self._keys: Dict[str, SigningKey] = {k.kid: k for k in keys}
+        if active_kid is not None and active_kid not in self._keys:
+            raise ValueError(f"Active kid {active_kid!r} is not in the keyring")
+        signers = [k for k in self._keys.values() if k.can_sign]
+        self.active: Optional[SigningKey] = self._keys[active_kid] if active_kid else (signers[0] if signers else None)
+        self.unkeyed = unkeyed
+        self.jwks_url = jwks_url
+        self.jwks_min_refresh = jwks_min_refresh
+        self._next_fetch = 0.0
+        self._lock = threading.Lock()
+        self._jwks: Optional[Tuple[bytes, str]] = None
+        self._unknown_kids: TTLCache[bool] = TTLCache(maxsize=10000, ttl=jwks_min_refresh)
+        self._refresh_thread: Optional[threading.Thread] = None
+        if jwks_url:
+            self._schedule_refresh()
+
+    def get(self, kid: Optional[str]) -> Optional[SigningKey]:
+        if kid is None:
+            return self.unkeyed
+        key = self._keys.get(kid)
+        if key is None and self.jwks_url and self._unknown_kids.get(kid) is None:
+            # Remember the miss so random kids cost one dict lookup, not a fetch each
+            self._unknown_kids.set(kid, True)
+            self._schedule_refresh()
+        return key
+
+    def add(self, key: SigningKey) -> None:
+        with self._lock:
+            self._keys = {**self._keys, key.kid: key}
+            self._jwks = None
+
+    def _schedule_refresh(self) -> None:
+        """Start a background JWKS fetch unless one is running or the last began < ``jwks_min_refresh`` ago."""
+        now = time.monotonic()
+        with self._lock:
+            if now < self._next_fetch or (self._refresh_thread is not None and self._refresh_thread.is_alive()):
+                return
+            self._next_fetch = now + self.jwks_min_refresh
+            self._refresh_thread = threading.Thread(target=self._refresh_from_jwks, name="jwks-refresh", daemon=True)
+            self._refresh_thread.start()
+
+    def _fetch_jwks(self) -> Dict[str, Any]:
+        with urllib.request.urlopen(self.jwks_url, timeout=2) as resp:
+            return json.load(resp)
+
+    def _refresh_from_jwks(self) -> None:
+        try:
+            document = self._fetch_jwks()
+            for jwk in document.get("keys", []):
+                if jwk.get("kid") and jwk["kid"] not in self._keys:
+                    self.add(SigningKey.from_jwk(jwk))
+                    self._unknown_kids.pop(jwk["kid"])
+        except Exception:
+            logger.exception("JWKS fetch from %s failed", self.jwks_url)
+
+    def sign(self, claims: Mapping[str, Any]) -> str:
+        key = self.active
+        if key is None:
+            raise ValueError("No signing key configured")
+        header = {"alg": key.alg, "typ": "JWT", "kid": key.kid}
+        signing_input = (
+            b64url_encode(json.dumps(header, separators=(",", ":")).encode())
+            + "."
+            + b64url_encode(json.dumps(claims, separators=(",", ":")).encode())
+        )
+        return signing_input + "." + b64url_encode(key.sign(signing_input.encode("ascii")))
+
+    def verify(self, token: str) -> Dict[str, Any]:
+        """Check the header and signature; returns the (unvalidated) claims. Raises ValueError."""
+        signing_input, _, signature = token.rpartition(".")
+        header_segment, _, payload_segment = signing_input.partition(".")
+        if not header_segment or not payload_segment or "." in payload_segment:
+            raise ValueError("Invalid token")
+        header = json.loads(b64url_decode(header_segment))
+        if not isinstance(header, dict):
+            raise ValueError("Invalid token")
+        key = self.get(header.get("kid"))
+        # The key decides the algorithm; a header cannot downgrade it (e.g. to "none" or HS256 with a public key)
+        if key is None or header.get("alg") != key.alg:
+            raise ValueError("Invalid token")
+        if not key.verify(signing_input.encode("ascii"), b64url_decode(signature)):
+            raise ValueError("Invalid token")
+        claims = json.loads(b64url_decode(payload_segment))
+        if not isinstance(claims, dict):
+            raise ValueError("Invalid token")
+        return claims
+
+    def jwks_document(self) -> Tuple[bytes, str]:
+        """Serialized JWKS of the public keys and its ETag (computed once per key set)."""
+        cached = self._jwks
+        if cached is None:
+            keys: List[Dict[str, str]] = [jwk for jwk in (k.jwk() for k in self._keys.values()) if jwk]
+            body = json.dumps({"keys": keys}, separators=(",", ":")).encode()
+            cached = self._jwks = (body, '"' + hashlib.sha256(body).hexdigest()[:32] + '"')
+        return cached
+
+    @classmethod
+    def from_settings(cls, settings: Any) -> "Keyring":
+        keys = [SigningKey.from_config(entry) for entry in settings.jwt_keys]
+        secret = SigningKey(kid="", alg="HS256", secret=settings.secret_key.encode())
+        if not keys:
+            if settings.jwt_algorithm == "HS256":
+                kid = "hs-" + hashlib.sha256(b"kid:" + secret.secret).hexdigest()[:12]
+                keys = [SigningKey(kid=kid, alg="HS256", secret=secret.secret)]
+            elif settings.jwt_jwks_url:
+                pass  # verify-only: keys come from the JWKS endpoint
+            elif settings.debug:
+                # Ephemeral keypair: fine for one process, other workers and restarts reject its tokens
+                logger.warning("No APP_JWT_KEYS configured; generated an ephemeral %s key", settings.jwt_algorithm)
+                keys = [SigningKey.generate(settings.jwt_algorithm)]
+            else:
+                raise ValueError(
+                    f"APP_JWT_ALGORITHM={settings.jwt_algorithm} needs APP_JWT_KEYS (or APP_JWT_JWKS_URL to verify only); "
+                    "an ephemeral key is only generated with APP_DEBUG"
+                )
+        return cls(
+            keys,
+            active_kid=settings.jwt_active_kid,
+            unkeyed=secret if _accept_unkeyed(settings) else None,
+            jwks_url=settings.jwt_jwks_url,
+        )
@@ -0,0 +1,120 @@
+"""リクエストパイプライン（純ASGIミドルウェア）。
+レート制限・メトリクス収集・アクセスログを1つのASGIミドルウェアに統合し、
+scope を1回だけ読み、レスポンスボディはラップせずにそのまま流す。"""
+import json
+import logging
+import time
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+from server.common.metrics import record_request, route_template
+from server.core.rate_limit import RateLimiter, rate_limit_headers
+
+
+STAGES = ("metrics", "rate_limit", "access_log")
+# Rejected requests never reach the router, so there is no route template to label them with
+REJECTED_ROUTE = "__rate_limited__"
+DEFAULT_ORDER: Tuple[str, ...] = ("metrics", "rate_limit")
+
+access_logger = logging.getLogger("server.access")
+
+_TOO_MANY_REQUESTS = json.dumps({"detail": "Rate limit exceeded"}).encode()
+
+
+def _encode_headers(headers: dict) -> List[Tuple[bytes, bytes]]:
+    return [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in headers.items()]
+
+
+class RequestPipelineMiddleware:
+    """Fused rate-limit / metrics / access-log middleware.
+
+    ``order`` lists stages from outermost to innermost. ``rate_limit`` is a
+    gate: observers (``metrics``, ``access_log``) listed before it also see
+    requests it rejects, observers after it only see admitted requests.
+    Only the ``http.response.start`` message is intercepted (to read the
+    status and add ``RateLimit-*`` headers); body chunks pass through.
+    """
+
+    def __init__(self, app, order: Sequence[str] = DEFAULT_ORDER, limiter: Optional[RateLimiter] = None) -> None:
+        unknown = set(order) - set(STAGES)
+        if unknown:
+            raise ValueError(f"Unknown middleware stage(s): {sorted(unknown)}")
+        if "rate_limit" in order and limiter is None:
+            raise ValueError("rate_limit stage requires a limiter")
+        self.app = app
+        self.limiter = limiter if "rate_limit" in order else None
+        gate = list(order).index("rate_limit") if self.limiter else len(order)
+        self.outer = tuple(order[:gate])
+        self.inner = tuple(order[gate + 1 :])
+        self.observe_all = bool(self.outer or self.inner)
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        extra_headers: Optional[List[Tuple[bytes, bytes]]] = None
+        limiter = self.limiter
+        if limiter is not None:
+            authorization = None
+            if limiter.needs_authorization:
+                for k, v in scope["headers"]:
+                    if k == b"authorization":
+                        authorization = v.decode("latin-1")
+                        break
+            client = scope.get("client")
+            decision = await limiter.check_async(client[0] if client else "unknown", scope["path"], authorization)
+            extra_headers = _encode_headers(rate_limit_headers(decision))
+            if not decision.allowed:
+                await send(
+                    {
+                        "type": "http.response.start",
+                        "status": 429,
+                        "headers": [
+                            (b"content-type", b"application/json"),
+                            (b"content-length", str(len(_TOO_MANY_REQUESTS)).encode()),
+                            *extra_headers,
+                        ],
+                    }
+                )
+                await send({"type": "http.response.body", "body": _TOO_MANY_REQUESTS})
+                self._observe(self.outer, scope, 429, start, REJECTED_ROUTE)
+                return
+
+        if not self.observe_all and extra_headers is None:
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_wrapper(message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if extra_headers:
+                    message["headers"] = [*message.get("headers", ()), *extra_headers]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            self._observe(self.outer + self.inner, scope, status, start)
+
+    @staticmethod
+    def _observe(stages: Iterable[str], scope, status: int, start: float, route: Optional[str] = None) -> None:
+        if not stages:
+            return
+        elapsed = time.perf_counter() - start
+        for stage in stages:
+            if stage == "metrics":
+                record_request(scope["method"], route or route_template(scope), status, elapsed)
+            elif stage == "access_log" and access_logger.isEnabledFor(logging.INFO):
+                client = scope.get("client")
+                access_logger.info(
+                    '%s - "%s %s" %d %.1fms',
+                    client[0] if client else "-",
+                    scope["method"],
+                    scope["path"],
+                    status,
+                    elapsed * 1000,
+                )
@@ -1,26 +1,374 @@
+"""レート制限（GCRA）ミドルウェア。
+キーごとに理論到着時刻（TAT）1つだけを保持する GCRA でリクエスト数を制限し、
+ルート別・プリンシパル別のポリシー、アイドルキーの削除、RateLimit-*/Retry-After ヘッダを提供する。
+状態はプロセス内メモリ、または複数ワーカーで共有する SQLite ファイルに保持できる。
+SQLite はイベントループを塞がないよう専用スレッドで更新し、時間内に答えなければ許可（フェイルオープン）する。
+ルート別とプリンシパル別の両方が許可したときだけ両方を消費する。"""
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+import math
+import sqlite3
+import threading
 import time
-from collections import defaultdict, deque
-from typing import Deque, Dict, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, Hashable, List, Mapping, NamedTuple, Optional, Sequence, Tuple
 
 from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 
+from server.common.metrics import inc_counter
+from server.core.security import decode_token
 
-def add_rate_limit_middleware(app: FastAPI, max_requests: int = 60, window_seconds: int = 60) -> None:
-    hits: Dict[Tuple[str, str], Deque[float]] = defaultdict(deque)
+
+@dataclass(frozen=True)
+class RateLimitPolicy:
+    limit: int
+    window: float
+
+    @property
+    def emission_interval(self) -> float:
+        return self.window / self.limit
+
+    @classmethod
+    def parse(cls, spec: str) -> "RateLimitPolicy":
+        """Parse ``"<limit>/<window seconds>"`` (e.g. ``"10/60"``)."""
+        limit, _, window = spec.partition("/")
+        return cls(limit=int(limit), window=float(window or 60))
+
+
+class RateLimitDecision(NamedTuple):
+    allowed: bool
+    limit: int
+    remaining: int
+    reset_after: float
+    retry_after: float
+
+
+class RateLimitBackend(ABC):
+    """Storage for GCRA state. ``hit`` records one request and returns the decision.
+
+    ``blocking`` backends do I/O; ``RateLimiter.check_async`` runs them off the event loop.
+    """
+
+    blocking = False
+
+    @abstractmethod
+    def hit(self, key: Hashable, policy: RateLimitPolicy, now: Optional[float] = None) -> RateLimitDecision:
+        ...
+
+    @abstractmethod
+    def hit_all(
+        self, hits: Sequence[Tuple[Hashable, RateLimitPolicy]], now: Optional[float] = None
+    ) -> List[RateLimitDecision]:
+        """Decide every (key, policy) together: all keys are charged only if all allow, else none."""
+
+
+def _decide(tat: Optional[float], policy: RateLimitPolicy, now: float) -> Tuple[RateLimitDecision, float]:
+    """GCRA step: the decision and the key's new TAT if it is charged."""
+    interval = policy.emission_interval
+    tat = now if tat is None or tat < now else tat
+    new_tat = tat + interval
+    allow_at = new_tat - policy.window
+    if now < allow_at:
+        return RateLimitDecision(False, policy.limit, 0, tat - now, allow_at - now), tat
+    remaining = int((policy.window - (new_tat - now)) / interval + 1e-9)
+    return RateLimitDecision(True, policy.limit, remaining, new_tat - now, 0.0), new_tat
+
+
+class MemoryRateLimitBackend(RateLimitBackend):
+    """Sharded in-memory GCRA limiter with constant memory per key.
+
+    Each key maps to a single float (its theoretical arrival time). A key whose
+    TAT is in the past carries no information, so idle keys are dropped by a
+    periodic per-shard sweep.
+    """
+
+    def __init__(self, shards: int = 64, sweep_interval: float = 30.0) -> None:
+        self._mask = (1 << max(shards - 1, 0).bit_length()) - 1
+        self._tats: List[Dict[Hashable, float]] = [{} for _ in range(self._mask + 1)]
+        self._locks = [threading.Lock() for _ in range(self._mask + 1)]
+        self._next_sweep = [0.0] * (self._mask + 1)
+        self.sweep_interval = sweep_interval
+
+    def hit(self, key: Hashable, policy: RateLimitPolicy, now: Optional[float] = None) -> RateLimitDecision:
+        now = time.monotonic() if now is None else now
+        idx = hash(key) & self._mask
+        tats = self._tats[idx]
+        interval = policy.emission_interval
+        with self._locks[idx]:
+            if now >= self._next_sweep[idx]:
+                self._sweep_shard(tats, now)
+                self._next_sweep[idx] = now + self.sweep_interval
+            tat = tats.get(key, now)
+            if tat < now:
+                tat = now
+            new_tat = tat + interval
+            allow_at = new_tat - policy.window
+            if now < allow_at:
+                return RateLimitDecision(False, policy.limit, 0, tat - now, allow_at - now)
+            tats[key] = new_tat
+        remaining = int((policy.window - (new_tat - now)) / interval + 1e-9)
+        return RateLimitDecision(True, policy.limit, remaining, new_tat - now, 0.0)
+
+    def hit_all(
+        self, hits: Sequence[Tuple[Hashable, RateLimitPolicy]], now: Optional[float] = None
+    ) -> List[RateLimitDecision]:
+        now = time.monotonic() if now is None else now
+        # Shard locks in index order, so concurrent multi-key hits cannot deadlock
+        shards = sorted({hash(key) & self._mask for key, _ in hits})
+        for idx in shards:
+            self._locks[idx].acquire()
+        try:
+            decided = [
+                (key, *_decide(self._tats[hash(key) & self._mask].get(key), policy, now)) for key, policy in hits
+            ]
+            if all(decision.allowed for _, decision, _ in decided):
+                for key, _, new_tat in decided:
+                    self._tats[hash(key) & self._mask][key] = new_tat
+        finally:
+            for idx in reversed(shards):
+                self._locks[idx].release()
+        return [decision for _, decision, _ in decided]
+
+    @staticmethod
+    def _sweep_shard(tats: Dict[Hashable, float], now: float) -> None:
+        idle = [k for k, tat in tats.items() if tat <= now]
+        for k in idle:
+            del tats[k]
+
+    def sweep(self, now: Optional[float] = None) -> None:
+        now = time.monotonic() if now is None else now
+        for idx, tats in enumerate(self._tats):
+            with self._locks[idx]:
+                self._sweep_shard(tats, now)
+
+    def __len__(self) -> int:
+        return sum(len(t) for t in self._tats)
+
+
+class SQLiteRateLimitBackend(RateLimitBackend):
+    """GCRA state shared through a SQLite file, for several workers on one host.
+
+    Each decision is a single ``INSERT .. ON CONFLICT DO UPDATE .. RETURNING``
+    statement on a per-thread WAL connection, so it is atomic across processes
+    without an explicit transaction (``hit_all`` uses one short write
+    transaction). Idle keys are deleted in one batched statement at most every
+    ``sweep_interval`` seconds. Calls block on the file lock for up to
+    ``busy_timeout_ms``, so the limiter runs them in worker threads; any error
+    fails open.
+    """
+
+    blocking = True
+
+    _UPSERT = (
+        "INSERT INTO rate_limits(key, tat) VALUES (:key, :now + :interval) "
+        "ON CONFLICT(key) DO UPDATE SET tat = max(tat, :now) + :interval "
+        "WHERE max(tat, :now) + :interval - :window <= :now "
+        "RETURNING tat"
+    )
+
+    def __init__(self, path: str, sweep_interval: float = 30.0, busy_timeout_ms: int = 1000) -> None:
+        self.path = path
+        self.sweep_interval = sweep_interval
+        self.busy_timeout_ms = busy_timeout_ms
+        self._local = threading.local()
+        self._next_sweep = 0.0
+        self._connect().execute(
+            "CREATE TABLE IF NOT EXISTS rate_limits (key TEXT PRIMARY KEY, tat REAL NOT NULL) WITHOUT ROWID"
+        )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")
+            conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout_ms)}")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _key(key: Hashable) -> str:
+        return "|".join(map(str, key)) if isinstance(key, tuple) else str(key)
+
+    def hit(self, key: Hashable, policy: RateLimitPolicy, now: Optional[float] = None) -> RateLimitDecision:
+        # Wall clock: the state is shared between processes.
+        now = time.time() if now is None else now
+        interval = policy.emission_interval
+        params = {"key": self._key(key), "now": now, "interval": interval, "window": policy.window}
+        try:
+            conn = self._connect()
+            if now >= self._next_sweep:
+                self._next_sweep = now + self.sweep_interval
+                conn.execute("DELETE FROM rate_limits WHERE tat <= ?", (now,))
+            row = conn.execute(self._UPSERT, params).fetchone()
+            if row is None:
+                current = conn.execute("SELECT tat FROM rate_limits WHERE key = ?", (params["key"],)).fetchone()
+                tat = current[0] if current else now
+                return RateLimitDecision(False, policy.limit, 0, tat - now, tat + interval - policy.window - now)
+        except sqlite3.Error:
+            # Fail open: a broken limiter store must not take the API down.
+            logging.getLogger(__name__).exception("rate limit backend error")
+            return RateLimitDecision(True, policy.limit, policy.limit, 0.0, 0.0)
+        new_tat = row[0]
+        remaining = int((policy.window - (new_tat - now)) / interval + 1e-9)
+        return RateLimitDecision(True, policy.limit, remaining, new_tat - now, 0.0)
+
+    def hit_all(
+        self, hits: Sequence[Tuple[Hashable, RateLimitPolicy]], now: Optional[float] = None
+    ) -> List[RateLimitDecision]:
+        now = time.time() if now is None else now
+        keys = [self._key(key) for key, _ in hits]
+        try:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                tats = dict(
+                    conn.execute(
+                        f"SELECT key, tat FROM rate_limits WHERE key IN ({','.join('?' * len(keys))})", keys
+                    ).fetchall()
+                )
+                decided = [_decide(tats.get(key), policy, now) for key, (_, policy) in zip(keys, hits)]
+                if all(decision.allowed for decision, _ in decided):
+                    conn.executemany(
+                        "INSERT INTO rate_limits(key, tat) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET tat = excluded.tat",
+                        [(key, new_tat) for key, (_, new_tat) in zip(keys, decided)],
+                    )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        except sqlite3.Error:
+            logging.getLogger(__name__).exception("rate limit backend error")
+            return [RateLimitDecision(True, policy.limit, policy.limit, 0.0, 0.0) for _, policy in hits]
+        return [decision for decision, _ in decided]
+
+
+def create_rate_limit_backend(
+    kind: str = "memory", sqlite_path: str = "./ratelimit.db", timeout: float = 0.05
+) -> RateLimitBackend:
+    if kind == "sqlite":
+        return SQLiteRateLimitBackend(sqlite_path, busy_timeout_ms=max(int(timeout * 1000), 1))
+    if kind == "memory":
+        return MemoryRateLimitBackend()
+    raise ValueError(f"Unknown rate limit backend: {kind}")
+
+
+def _bearer_subject(authorization: Optional[str]) -> Optional[str]:
+    if not authorization or not authorization.lower().startswith("bearer "):
+        return None
+    try:
+        sub = decode_token(authorization[7:]).get("sub")
+    except ValueError:
+        return None
+    return str(sub) if sub is not None else None
+
+
+def rate_limit_headers(decision: RateLimitDecision) -> Dict[str, str]:
+    headers = {
+        "RateLimit-Limit": str(decision.limit),
+        "RateLimit-Remaining": str(decision.remaining),
+        "RateLimit-Reset": str(math.ceil(decision.reset_after)),
+    }
+    if not decision.allowed:
+        headers["Retry-After"] = str(max(math.ceil(decision.retry_after), 1))
+    return headers
+
+
+class RateLimiter:
+    """Resolves the policy for a request and applies it through a backend."""
+
+    def __init__(
+        self,
+        max_requests: int = 60,
+        window_seconds: int = 60,
+        route_limits: Optional[Mapping[str, str]] = None,
+        principal_limit: Optional[str] = None,
+        backend: Optional[RateLimitBackend] = None,
+        backend_timeout: float = 0.05,
+        backend_threads: int = 4,
+    ) -> None:
+        self.backend = backend if backend is not None else MemoryRateLimitBackend()
+        self.backend_timeout = backend_timeout
+        # Blocking backends get their own threads, so a stalled store never takes the request threadpool
+        self._executor = (
+            ThreadPoolExecutor(max_workers=backend_threads, thread_name_prefix="rate-limit")
+            if self.backend.blocking
+            else None
+        )
+        self._max_pending = backend_threads * 8
+        self._pending = 0
+        self.default_policy = RateLimitPolicy(limit=max_requests, window=float(window_seconds))
+        # Longest prefix wins
+        self.routes: List[Tuple[str, RateLimitPolicy]] = sorted(
+            ((prefix, RateLimitPolicy.parse(spec)) for prefix, spec in (route_limits or {}).items()),
+            key=lambda item: len(item[0]),
+            reverse=True,
+        )
+        self.principal_policy = RateLimitPolicy.parse(principal_limit) if principal_limit else None
+
+    @property
+    def needs_authorization(self) -> bool:
+        return self.principal_policy is not None
+
+    def check(self, client: str, path: str, authorization: Optional[str] = None) -> RateLimitDecision:
+        policy = next((p for prefix, p in self.routes if path.startswith(prefix)), self.default_policy)
+        sub = _bearer_subject(authorization) if self.principal_policy is not None else None
+        if sub is None:
+            return self.backend.hit((client, path), policy)
+        # Both limits are checked before either is charged: a request the principal limit rejects costs nothing
+        by_route, by_principal = self.backend.hit_all([((client, path), policy), (("sub", sub), self.principal_policy)])
+        if not by_route.allowed:
+            return by_route
+        if not by_principal.allowed or by_principal.remaining < by_route.remaining:
+            return by_principal
+        return by_route
+
+    async def check_async(self, client: str, path: str, authorization: Optional[str] = None) -> RateLimitDecision:
+        """``check`` for the event loop: blocking backends run in the limiter's threads.
+
+        A store that does not answer within ``backend_timeout`` (or a full
+        queue) fails open, like a store error.
+        """
+        if self._executor is None:
+            return self.check(client, path, authorization)
+        if self._pending >= self._max_pending:
+            return self._fail_open()
+        self._pending += 1
+        try:
+            future = asyncio.get_running_loop().run_in_executor(self._executor, self.check, client, path, authorization)
+            return await asyncio.wait_for(future, self.backend_timeout)
+        except asyncio.TimeoutError:
+            return self._fail_open()
+        finally:
+            self._pending -= 1
+
+    def _fail_open(self) -> RateLimitDecision:
+        inc_counter("rate_limit_fail_open_total")
+        policy = self.default_policy
+        return RateLimitDecision(True, policy.limit, policy.limit, 0.0, 0.0)
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def add_rate_limit_middleware(app: FastAPI, limiter: RateLimiter) -> None:
+    """Standalone ``@app.middleware("http")`` form; ``create_app`` uses the fused pipeline instead."""
 
     @app.middleware("http")
     async def rate_limiter(request: Request, call_next):  # type: ignore[override]
-        key = (request.client.host if request.client else "unknown", request.url.path)
-        now = time.time()
-        dq = hits[key]
-        # purge
-        cutoff = now - window_seconds
-        while dq and dq[0] < cutoff:
-            dq.popleft()
-        if len(dq) >= max_requests:
-            from fastapi.responses import JSONResponse
-            return JSONResponse(status_code=429, content={"detail": "Rate limit exceeded"})
-        dq.append(now)
-        return await call_next(request)
-"""簡易レート制限ミドルウェア。
-メモリ上でパスごとのリクエスト数を制限し、429 を返す。"""
+        decision = await limiter.check_async(
+            request.client.host if request.client else "unknown",
+            request.url.path,
+            request.headers.get("authorization") if limiter.needs_authorization else None,
+        )
+        if not decision.allowed:
+            return JSONResponse(
+                status_code=429, content={"detail": "Rate limit exceeded"}, headers=rate_limit_headers(decision)
+            )
+        response = await call_next(request)
+        response.headers.update(rate_limit_headers(decision))
+        return response
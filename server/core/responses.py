@@ -0,0 +1,96 @@
+"""高速 JSON レスポンス。
+orjson（無ければ msgspec、どちらも無ければ標準 json）で直接バイト列にエンコードする JSONResponse。
+ハンドラが FastJSONResponse を返せば FastAPI の jsonable_encoder を通らないため、
+検証済みの大きな dict/list（メトリクス・ログ・監査イベント）を返すルートで使う。"""
+import dataclasses
+import datetime
+import decimal
+import enum
+import json
+import uuid
+from typing import Any, Callable, Dict
+
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+from server.core.config import settings
+
+
+def _default(obj: Any) -> Any:
+    """Types outside JSON, encoded the way jsonable_encoder would."""
+    if isinstance(obj, BaseModel):
+        return obj.model_dump(mode="json")
+    if isinstance(obj, (datetime.datetime, datetime.date, datetime.time)):
+        return obj.isoformat()
+    if isinstance(obj, uuid.UUID):
+        return str(obj)
+    if isinstance(obj, decimal.Decimal):
+        return int(obj) if obj.as_tuple().exponent >= 0 else float(obj)  # type: ignore[operator]
+    if isinstance(obj, enum.Enum):
+        return obj.value
+    if dataclasses.is_dataclass(obj) and not isinstance(obj, type):
+        return dataclasses.asdict(obj)
+    if isinstance(obj, (set, frozenset, tuple)):
+        return list(obj)
+    if isinstance(obj, bytes):
+        return obj.decode()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def _stdlib_dumps(content: Any) -> bytes:
+    # Same output as JSONResponse.render
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":"), default=_default).encode(
+        "utf-8"
+    )
+
+
+def _orjson_dumps() -> Callable[[Any], bytes] | None:
+    try:
+        import orjson
+    except ImportError:
+        return None
+
+    def dumps(content: Any) -> bytes:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+    return dumps
+
+
+def _msgspec_dumps() -> Callable[[Any], bytes] | None:
+    try:
+        import msgspec
+    except ImportError:
+        return None
+    encoder = msgspec.json.Encoder(enc_hook=_default)
+    return encoder.encode
+
+
+_ENCODERS: Dict[str, Callable[[], Callable[[Any], bytes] | None]] = {
+    "orjson": _orjson_dumps,
+    "msgspec": _msgspec_dumps,
+    "stdlib": lambda: _stdlib_dumps,
+}
+
+
+def select_encoder(name: str) -> tuple[str, Callable[[Any], bytes]]:
+    """``auto`` takes the first installed of orjson, msgspec and stdlib; an unavailable choice falls back to stdlib."""
+    for candidate in _ENCODERS if name == "auto" else (name, "stdlib"):
+        dumps = _ENCODERS[candidate]() if candidate in _ENCODERS else None
+        if dumps is not None:
+            return candidate, dumps
+    return "stdlib", _stdlib_dumps
+
+
+ENCODER_NAME, dumps = select_encoder(settings.json_encoder)
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered by the fastest available encoder.
+
+    Returned directly from a handler it also skips jsonable_encoder, so the
+    content must already be JSON-shaped (dicts, lists, scalars, plus the
+    types ``_default`` handles).
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -1,14 +1,26 @@
-from datetime import datetime, timedelta, timezone
-from typing import Any, Dict
+import asyncio
+import binascii
+import hashlib
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
 
-from jose import jwt, JWTError
 from passlib.context import CryptContext
 
+from server.common.metrics import inc_counter, observe, set_gauge
+from server.common.utils.cache import TTLCache
 from server.core.config import settings
+from server.core.jwt_keys import Keyring
 
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-ALGORITHM = "HS256"
+
+
+class PasswordPoolBusy(RuntimeError):
+    """Raised when the password worker pool queue is full."""
 
 
 def hash_password(password: str) -> str:
@@ -19,26 +31,151 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
 
-def create_token(subject: str, token_type: str, expires_minutes: int) -> str:
-    now = datetime.now(timezone.utc)
-    expire = now + timedelta(minutes=expires_minutes)
-    to_encode = {"sub": subject, "type": token_type, "iat": int(now.timestamp()), "exp": expire}
-    return jwt.encode(to_encode, settings.secret_key, algorithm=ALGORITHM)
+_pool: Optional[Executor] = None
+_pool_lock = threading.Lock()
+_pool_depth = 0
 
 
-def create_access_token(subject: str) -> str:
-    return create_token(subject, "access", settings.access_token_expires_minutes)
+def _pool_workers() -> int:
+    return settings.password_pool_workers or os.cpu_count() or 1
 
 
-def create_refresh_token(subject: str) -> str:
-    return create_token(subject, "refresh", settings.refresh_token_expires_minutes)
+def _get_pool() -> Executor:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                if settings.password_pool_kind == "thread":
+                    _pool = ThreadPoolExecutor(max_workers=_pool_workers(), thread_name_prefix="password")
+                else:
+                    # By now this process runs sweeper/writer/listener threads; a plain fork could copy a lock
+                    # one of them holds and hang the child. forkserver children start from a clean process.
+                    method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+                    _pool = ProcessPoolExecutor(max_workers=_pool_workers(), mp_context=multiprocessing.get_context(method))
+    return _pool
 
 
-def decode_token(token: str) -> Dict[str, Any]:
+def start_password_pool() -> None:
+    """Create the pool and bring its workers up at startup, so the first logins do not pay for it."""
+    pool = _get_pool()
+    if isinstance(pool, ProcessPoolExecutor):
+        for future in [pool.submit(_timed, len, "") for _ in range(_pool_workers())]:
+            future.result()
+
+
+def shutdown_password_pool() -> None:
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _timed(fn: Callable[..., Any], *args: Any) -> Tuple[Any, float, float]:
+    # Runs inside the worker; wall-clock timestamps are comparable across processes.
+    started = time.time()
+    result = fn(*args)
+    return result, started, time.time()
+
+
+async def _run_in_pool(fn: Callable[..., Any], *args: Any) -> Any:
+    global _pool_depth
+    with _pool_lock:
+        if _pool_depth >= settings.password_pool_max_queue:
+            inc_counter("password_pool_rejected_total")
+            raise PasswordPoolBusy("Password worker pool is saturated")
+        _pool_depth += 1
+        set_gauge("password_pool_depth", _pool_depth)
+    submitted = time.time()
     try:
-        payload = jwt.decode(token, settings.secret_key, algorithms=[ALGORITHM])
-        return payload
-    except JWTError as e:
+        loop = asyncio.get_running_loop()
+        result, started, finished = await loop.run_in_executor(_get_pool(), _timed, fn, *args)
+    finally:
+        with _pool_lock:
+            _pool_depth -= 1
+            set_gauge("password_pool_depth", _pool_depth)
+    observe("password_pool_wait_seconds", max(started - submitted, 0.0))
+    observe("password_pool_exec_seconds", finished - started)
+    return result
+
+
+async def hash_password_async(password: str) -> str:
+    return await _run_in_pool(hash_password, password)
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await _run_in_pool(verify_password, plain_password, hashed_password)
+
+
+def create_token(subject: str, token_type: str, expires_minutes: int, extra: Optional[Dict[str, Any]] = None) -> str:
+    now = int(time.time())
+    claims = {"sub": subject, "type": token_type, "iat": now, "exp": now + expires_minutes * 60, **(extra or {})}
+    return keyring.sign(claims)
+
+
+def create_access_token(subject: str, family: Optional[str] = None) -> str:
+    return create_token(subject, "access", settings.access_token_expires_minutes, {"fam": family} if family else None)
+
+
+def create_refresh_token(subject: str, jti: str, family: str) -> str:
+    return create_token(subject, "refresh", settings.refresh_token_expires_minutes, {"jti": jti, "fam": family})
+
+
+# Signing/verification keys by kid; the active key signs, any key in the ring verifies
+keyring = Keyring.from_settings(settings)
+
+
+def _verify_jwt(token: str) -> Dict[str, Any]:
+    """Verify a JWT against the keyring; same claim checks as ``jose.jwt.decode``."""
+    try:
+        claims = keyring.verify(token)
+        now = int(time.time())
+        if "exp" in claims and int(claims["exp"]) < now:
+            raise ValueError("Invalid token")
+        if "nbf" in claims and int(claims["nbf"]) > now:
+            raise ValueError("Invalid token")
+        if "iat" in claims:
+            int(claims["iat"])
+        # jose rejects these when no audience/subject/jti expectation is given and the type is wrong
+        if "aud" in claims:
+            raise ValueError("Invalid token")
+        if "sub" in claims and not isinstance(claims["sub"], str):
+            raise ValueError("Invalid token")
+        if "jti" in claims and not isinstance(claims["jti"], str):
+            raise ValueError("Invalid token")
+    except (binascii.Error, UnicodeError, TypeError, ValueError) as e:
         raise ValueError("Invalid token") from e
+    return claims
+
+
+# Verified claims keyed by the token's SHA-256, never kept past the token's own exp
+_token_cache: TTLCache[Dict[str, Any]] = TTLCache(
+    maxsize=settings.token_cache_max_entries, ttl=settings.token_cache_ttl_seconds
+)
+
+
+def decode_token(token: str) -> Dict[str, Any]:
+    key = hashlib.sha256(token.encode()).digest()
+    claims = _token_cache.get(key)
+    if claims is not None:
+        if "exp" not in claims or int(claims["exp"]) >= time.time():
+            inc_counter("token_cache_hits_total")
+            return dict(claims)
+        _token_cache.pop(key)
+    inc_counter("token_cache_misses_total")
+    claims = _verify_jwt(token)
+    ttl = float(settings.token_cache_ttl_seconds)
+    if "exp" in claims:
+        ttl = min(ttl, int(claims["exp"]) - time.time())
+    if ttl > 0:
+        _token_cache.set(key, claims, ttl=ttl)
+    return dict(claims)
+
+
+def clear_token_cache() -> None:
+    _token_cache.clear()
+
+
 """セキュリティ関連ユーティリティ。
-bcrypt によるパスワードハッシュ/検証と、JWT の発行/検証を提供する。"""
+bcrypt によるパスワードハッシュ/検証（専用ワーカープール経由の非同期版を含む）と、JWT の発行/検証を提供する。
+署名/検証は kid で引く鍵リング（HS256 / ES256 / EdDSA）で行い、検証済みトークンはダイジェストをキーに exp までキャッシュする。"""
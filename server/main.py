@@ -1,23 +1,43 @@
 """FastAPIアプリのエントリーポイント。
 共通（/common/*）とサービス固有ルータの組み立て、
 CORS/レート制限/メトリクス/ログなどのミドルウェア設定を行う。"""
-from fastapi import FastAPI
+from typing import Sequence
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 
 from server.core.config import settings
-from server.core.database import create_all
-from server.core.rate_limit import add_rate_limit_middleware
-from server.common.metrics import add_metrics_middleware
+from server.core.database import SessionLocal, create_all
+from server.core.security import PasswordPoolBusy, shutdown_password_pool, start_password_pool
+from server.core.middleware import RequestPipelineMiddleware
+from server.core.rate_limit import RateLimiter, create_rate_limit_backend
+from server.core.responses import FastJSONResponse
+from server.common.metrics import start_metrics_flusher
+from server.common.audit import shutdown_audit
+from server.common.analytics import shutdown_analytics
+from server.common.refresh_tokens import start_refresh_token_sweeper, stop_refresh_token_sweeper
+from server.common.user_import import purge_expired_spools, shutdown_user_import
+from server.common.permissions import compile_permissions
 from server.common.auth import router as auth_router
 from server.common.payments import router as payments_router
 from server.common.analytics import router as analytics_router
 from server.common.router import router as common_router
 from fastapi.middleware.cors import CORSMiddleware
-from server.common.utils.logging_utils import register_handler as register_logging_handler
+from server.common.utils.logging_utils import register_handler as register_logging_handler, shutdown_logging
 from server.service1.router import router as service1_router
 
 
-def create_app() -> FastAPI:
-    app = FastAPI(title="takachanman unified server", version="0.1.0")
+def create_app(middleware_order: Sequence[str] | None = None, fast_json: bool | None = None) -> FastAPI:
+    """Build the app. ``middleware_order`` lists request pipeline stages
+    (``metrics``, ``rate_limit``, ``access_log``) outermost first; defaults to
+    ``settings.middleware_order``. ``fast_json`` makes FastJSONResponse the
+    default response class; defaults to ``settings.fast_json_default``."""
+    fast_json = settings.fast_json_default if fast_json is None else fast_json
+    app = FastAPI(
+        title="takachanman unified server",
+        version="0.1.0",
+        default_response_class=FastJSONResponse if fast_json else JSONResponse,
+    )
 
     # CORS
     app.add_middleware(
@@ -28,28 +48,46 @@ def create_app() -> FastAPI:
         allow_headers=["*"],
     )
 
-    # Rate limit (simple, in-memory)
-    add_rate_limit_middleware(app, max_requests=settings.rate_limit_max, window_seconds=settings.rate_limit_window)
-    # Request metrics
-    add_metrics_middleware(app)
-    # Log collection handler (ring buffer)
+    # Rate limit + request metrics (+ access log) as one raw ASGI middleware
+    order = tuple(settings.middleware_order if middleware_order is None else middleware_order)
+    limiter = None
+    if "rate_limit" in order:
+        limiter = RateLimiter(
+            max_requests=settings.rate_limit_max,
+            window_seconds=settings.rate_limit_window,
+            route_limits=settings.rate_limit_routes,
+            principal_limit=settings.rate_limit_principal,
+            backend=create_rate_limit_backend(
+                settings.rate_limit_backend, settings.rate_limit_sqlite_path, settings.rate_limit_backend_timeout
+            ),
+            backend_timeout=settings.rate_limit_backend_timeout,
+        )
+    app.state.rate_limiter = limiter
+    if order:
+        app.add_middleware(RequestPipelineMiddleware, order=order, limiter=limiter)
+    start_metrics_flusher()
+    # Log collection handler (ring buffer, optionally behind a queue listener)
     register_logging_handler()
 
-    # Routers
+    # Routers carry their own prefix, so each route's path_format is its full template (metrics labels)
     # Centralized common features
-    app.include_router(common_router, prefix="/common", tags=["common"])
-    app.include_router(auth_router, prefix="/common/auth", tags=["auth"])
-    app.include_router(payments_router, prefix="/common/payments", tags=["payments"])
+    app.include_router(common_router)
+    app.include_router(auth_router)
+    app.include_router(payments_router)
 
     # Service-like common namespaces
-    app.include_router(analytics_router, prefix="/common/analytics", tags=["analytics"])
+    app.include_router(analytics_router)
     # Example service under /service1/*
-    app.include_router(service1_router, prefix="/service1", tags=["service1"])
+    app.include_router(service1_router)
 
     @app.get("/health")
     def health() -> dict:
         return {"status": "ok"}
 
+    @app.exception_handler(PasswordPoolBusy)
+    async def password_pool_busy(_: Request, exc: PasswordPoolBusy) -> JSONResponse:
+        return JSONResponse(status_code=503, content={"detail": str(exc)}, headers={"Retry-After": "1"})
+
     return app
 
 
@@ -59,6 +97,23 @@ app = create_app()
 @app.on_event("startup")
 def on_startup() -> None:
     create_all()
+    with SessionLocal() as db:
+        compile_permissions(db)
+    start_password_pool()
+    start_refresh_token_sweeper()
+    purge_expired_spools()
+
+
+@app.on_event("shutdown")
+def on_shutdown() -> None:
+    if app.state.rate_limiter is not None:
+        app.state.rate_limiter.shutdown()
+    shutdown_password_pool()
+    stop_refresh_token_sweeper()
+    shutdown_user_import()
+    shutdown_audit()
+    shutdown_analytics()
+    shutdown_logging()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,36 @@
+from datetime import datetime
+
+from sqlalchemy import JSON, BigInteger, DateTime, Index, Integer, LargeBinary, String
+from sqlalchemy.orm import Mapped, mapped_column
+
+from server.core.database import Base
+
+
+class AnalyticsEvent(Base):
+    __tablename__ = "analytics_events"
+    id: Mapped[int] = mapped_column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True)
+    ts: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+    name: Mapped[str] = mapped_column(String(128), nullable=False)
+    user_id: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    session_id: Mapped[str | None] = mapped_column(String(64), nullable=True)
+    properties: Mapped[dict | None] = mapped_column(JSON, nullable=True)
+
+    # Append-only; kept to the indexes time-range scans need so bulk inserts stay cheap
+    __table_args__ = (
+        Index("ix_analytics_events_ts", "ts"),
+        Index("ix_analytics_events_name_ts", "name", "ts"),
+    )
+
+
+class AnalyticsRollup(Base):
+    """Pre-aggregated counts per (granularity, event name, bucket start)."""
+
+    __tablename__ = "analytics_rollups"
+    granularity: Mapped[str] = mapped_column(String(8), primary_key=True)
+    name: Mapped[str] = mapped_column(String(128), primary_key=True)
+    bucket: Mapped[datetime] = mapped_column(DateTime, primary_key=True)
+    count: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
+    # Serialized HyperLogLog of distinct session/user ids
+    uniques: Mapped[bytes] = mapped_column(LargeBinary, nullable=False, default=b"")
+"""アナリティクスイベントのデータモデル定義（SQLAlchemy）。
+取り込んだ生イベントを保持する追記専用テーブルと、時間バケットごとの集計テーブル。"""
@@ -0,0 +1,26 @@
+from datetime import datetime
+
+from sqlalchemy import JSON, BigInteger, DateTime, Index, Integer, String
+from sqlalchemy.orm import Mapped, mapped_column
+
+from server.core.database import Base
+
+
+class AuditLog(Base):
+    __tablename__ = "audit_logs"
+    # BIGINT on real databases; SQLite only auto-increments INTEGER PRIMARY KEY
+    id: Mapped[int] = mapped_column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True)
+    ts: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+    actor: Mapped[str | None] = mapped_column(String(320), nullable=True)
+    action: Mapped[str] = mapped_column(String(64), nullable=False)
+    target: Mapped[str | None] = mapped_column(String(255), nullable=True)
+    meta: Mapped[dict | None] = mapped_column(JSON, nullable=True)
+
+    # Listing walks id DESC; the (column, id) pairs let a filtered page be a single index range scan
+    __table_args__ = (
+        Index("ix_audit_logs_ts", "ts"),
+        Index("ix_audit_logs_actor_id", "actor", "id"),
+        Index("ix_audit_logs_action_id", "action", "id"),
+    )
+"""監査ログのデータモデル定義（SQLAlchemy）。
+ts・actor・action にインデックスを持つ追記専用テーブル。"""
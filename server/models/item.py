@@ -0,0 +1,29 @@
+from datetime import datetime
+
+from sqlalchemy import BigInteger, DateTime, ForeignKey, Index, Integer, String, Text
+from sqlalchemy.orm import Mapped, mapped_column
+
+from server.core.database import Base
+
+
+class Item(Base):
+    __tablename__ = "items"
+    id: Mapped[int] = mapped_column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True)
+    owner_id: Mapped[int] = mapped_column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    name: Mapped[str] = mapped_column(String(200), nullable=False)
+    category: Mapped[str] = mapped_column(String(64), nullable=False)
+    price_cents: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    description: Mapped[str | None] = mapped_column(Text, nullable=True)
+    # Naive UTC
+    created_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+
+    # Each sort key is (column, id) so a keyset page is one range scan; the category/owner filters get the same suffix
+    __table_args__ = (
+        Index("ix_items_name", "name", "id"),
+        Index("ix_items_price", "price_cents", "id"),
+        Index("ix_items_category", "category", "id"),
+        Index("ix_items_category_price", "category", "price_cents", "id"),
+        Index("ix_items_owner", "owner_id", "id"),
+    )
+"""service1 のアイテムのデータモデル定義（SQLAlchemy）。
+並べ替えキーごとの (列, id) キーセットページングに合わせた複合インデックスを持つ。"""
@@ -0,0 +1,50 @@
+from datetime import datetime
+
+from sqlalchemy import BigInteger, DateTime, ForeignKey, Index, Integer, String, UniqueConstraint
+from sqlalchemy.orm import Mapped, mapped_column
+
+from server.core.database import Base
+
+
+class Invoice(Base):
+    __tablename__ = "invoices"
+    id: Mapped[int] = mapped_column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True)
+    tenant_id: Mapped[str] = mapped_column(String(64), nullable=False)
+    number: Mapped[str] = mapped_column(String(64), nullable=False)
+    customer_id: Mapped[str | None] = mapped_column(String(64), nullable=True)
+    # draft / open / paid / void / refunded
+    status: Mapped[str] = mapped_column(String(16), nullable=False)
+    currency: Mapped[str] = mapped_column(String(3), nullable=False)
+    amount_cents: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    refunded_cents: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
+    # Naive UTC
+    issued_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+
+    # Listing walks (issued_at, id) DESC within a tenant; each filter gets the same suffix so a page is one range scan
+    __table_args__ = (
+        UniqueConstraint("tenant_id", "number", name="uq_invoices_tenant_number"),
+        Index("ix_invoices_tenant_issued", "tenant_id", "issued_at", "id"),
+        Index("ix_invoices_tenant_status_issued", "tenant_id", "status", "issued_at", "id"),
+        Index("ix_invoices_tenant_customer_issued", "tenant_id", "customer_id", "issued_at", "id"),
+    )
+
+
+class Refund(Base):
+    __tablename__ = "refunds"
+    id: Mapped[int] = mapped_column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True)
+    invoice_id: Mapped[int] = mapped_column(
+        BigInteger().with_variant(Integer, "sqlite"), ForeignKey("invoices.id", ondelete="CASCADE"), nullable=False
+    )
+    tenant_id: Mapped[str] = mapped_column(String(64), nullable=False)
+    amount_cents: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    reason: Mapped[str | None] = mapped_column(String(255), nullable=True)
+    status: Mapped[str] = mapped_column(String(16), nullable=False)
+    # Naive UTC
+    created_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+
+    __table_args__ = (
+        Index("ix_refunds_invoice_id", "invoice_id", "id"),
+        Index("ix_refunds_tenant_created", "tenant_id", "created_at", "id"),
+    )
+"""請求書/返金のデータモデル定義（SQLAlchemy）。
+テナント内の (issued_at, id) 降順キーセットページングに合わせた複合インデックスを持つ。"""
@@ -0,0 +1,37 @@
+"""認証ホットパス用のクエリ（リポジトリ関数）。
+ユーザID・メール・ロール名を1文で取得する。文はモジュール読み込み時に一度だけ組み立て、
+SQLAlchemy のコンパイル済みキャッシュを毎回再利用する。"""
+from typing import FrozenSet, Iterable, NamedTuple, Optional
+
+from sqlalchemy import bindparam, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from server.models.user import Role, User, UserRole
+
+
+class PrincipalRow(NamedTuple):
+    id: int
+    email: str
+    roles: FrozenSet[str]
+
+
+# One round trip: users LEFT JOIN user_roles LEFT JOIN roles, only the columns the auth path needs.
+_principal_stmt = (
+    select(User.id, User.email, Role.name)
+    .select_from(User)
+    .outerjoin(UserRole, UserRole.c.user_id == User.id)
+    .outerjoin(Role, Role.id == UserRole.c.role_id)
+    .where(User.id == bindparam("user_id"))
+)
+
+
+def _fold(rows: Iterable) -> Optional[PrincipalRow]:
+    rows = list(rows)
+    if not rows:
+        return None
+    user_id, email, _ = rows[0]
+    return PrincipalRow(user_id, email, frozenset(name for _, _, name in rows if name is not None))
+
+
+async def load_principal_row_async(db: AsyncSession, user_id: int) -> Optional[PrincipalRow]:
+    return _fold(await db.execute(_principal_stmt, {"user_id": user_id}))
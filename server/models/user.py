@@ -11,6 +11,21 @@ UserRole = Table(
     Column("role_id", ForeignKey("roles.id", ondelete="CASCADE"), primary_key=True),
 )
 
+RolePermission = Table(
+    "role_permissions",
+    Base.metadata,
+    Column("role_id", ForeignKey("roles.id", ondelete="CASCADE"), primary_key=True),
+    Column("permission_id", ForeignKey("permissions.id", ondelete="CASCADE"), primary_key=True),
+)
+
+# A role inherits every permission of its parents (transitively)
+RoleInheritance = Table(
+    "role_inheritance",
+    Base.metadata,
+    Column("role_id", ForeignKey("roles.id", ondelete="CASCADE"), primary_key=True),
+    Column("parent_id", ForeignKey("roles.id", ondelete="CASCADE"), primary_key=True),
+)
+
 
 class User(Base):
     __tablename__ = "users"
@@ -27,7 +42,21 @@ class Role(Base):
     name: Mapped[str] = mapped_column(String(32), nullable=False, unique=True, index=True)
 
     users = relationship("User", secondary=UserRole, back_populates="roles")
+    permissions = relationship("Permission", secondary=RolePermission)
+    parents = relationship(
+        "Role",
+        secondary=RoleInheritance,
+        primaryjoin=lambda: Role.id == RoleInheritance.c.role_id,
+        secondaryjoin=lambda: Role.id == RoleInheritance.c.parent_id,
+    )
 
     __table_args__ = (UniqueConstraint("name", name="uq_roles_name"),)
-"""ユーザ/ロールのデータモデル定義（SQLAlchemy）。
-ユーザとロールの多対多関連を含む。"""
+
+
+class Permission(Base):
+    __tablename__ = "permissions"
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    # "<area>:<action>", e.g. "invoices:read"
+    name: Mapped[str] = mapped_column(String(64), nullable=False, unique=True, index=True)
+"""ユーザ/ロール/権限のデータモデル定義（SQLAlchemy）。
+ユーザとロール、ロールと権限の多対多関連と、ロールの継承（親ロールの権限を引き継ぐ）を含む。"""
@@ -0,0 +1,27 @@
+from datetime import datetime
+
+from sqlalchemy import JSON, DateTime, Integer, String
+from sqlalchemy.orm import Mapped, mapped_column
+
+from server.core.database import Base
+
+
+class UserImportJob(Base):
+    __tablename__ = "user_import_jobs"
+    id: Mapped[str] = mapped_column(String(32), primary_key=True)
+    # queued / running / completed / failed / interrupted (stopped at shutdown, resumable)
+    status: Mapped[str] = mapped_column(String(16), nullable=False)
+    format: Mapped[str] = mapped_column(String(8), nullable=False)
+    # Spooled upload; rows are re-read from here on resume
+    path: Mapped[str] = mapped_column(String(1024), nullable=False)
+    created_by: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    # Data rows whose outcome is committed (the resume point), and their tally
+    processed: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    created: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    failed: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    errors: Mapped[list | None] = mapped_column(JSON, nullable=True)
+    message: Mapped[str | None] = mapped_column(String(1024), nullable=True)
+"""ユーザ一括登録ジョブのデータモデル定義（SQLAlchemy）。
+アップロードの保存先、処理済み行数（再開位置）、件数と行ごとのエラーを保持する。"""
@@ -0,0 +1,20 @@
+from datetime import datetime
+from typing import Any, Dict, List
+
+from pydantic import BaseModel, Field, TypeAdapter
+
+
+class EventIn(BaseModel):
+    name: str = Field(min_length=1, max_length=128)
+    ts: datetime | None = None
+    session_id: str | None = Field(default=None, max_length=64)
+    properties: Dict[str, Any] | None = None
+
+
+EventBatch = TypeAdapter(List[EventIn])
+
+
+class IngestResult(BaseModel):
+    accepted: int
+"""アナリティクス関連のPydanticスキーマ。
+取り込みイベント（単体/バッチ）と取り込み結果を定義する。"""
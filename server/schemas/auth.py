@@ -1,5 +1,5 @@
-from pydantic import BaseModel, EmailStr
-from typing import List
+from pydantic import BaseModel, EmailStr, Field
+from typing import Any, Dict, List
 
 
 class UserCreate(BaseModel):
@@ -24,5 +24,40 @@ class TokenPair(BaseModel):
 
 class TokenRefresh(BaseModel):
     refresh_token: str
+
+
+class RolesUpdate(BaseModel):
+    roles: List[str]
+
+
+class RoleUpdate(BaseModel):
+    permissions: List[str] = []
+    inherits: List[str] = []
+
+
+class RoleOut(BaseModel):
+    name: str
+    permissions: List[str]
+    inherits: List[str]
+    effective_permissions: List[str]
+
+
+class UserImportRow(BaseModel):
+    email: EmailStr
+    password: str = Field(min_length=1)
+    roles: List[str] | None = None
+
+
+class UserImportJobOut(BaseModel):
+    id: str
+    status: str
+    processed: int
+    created: int
+    failed: int
+    errors: List[Dict[str, Any]] = []
+    message: str | None = None
+
+    class Config:
+        from_attributes = True
 """認証関連のPydanticスキーマ。
-ユーザ登録/出力、トークンペイロード等を定義する。"""
+ユーザ登録/出力、トークンペイロード、一括登録の行とジョブ状態等を定義する。"""
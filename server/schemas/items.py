@@ -0,0 +1,23 @@
+from typing import List
+
+from pydantic import BaseModel, Field
+
+
+class ItemIn(BaseModel):
+    name: str = Field(min_length=1, max_length=200)
+    category: str = Field(min_length=1, max_length=64)
+    price_cents: int = Field(ge=0)
+    description: str | None = Field(default=None, max_length=10000)
+
+
+class ItemBatchIn(BaseModel):
+    items: List[ItemIn] = Field(min_length=1, max_length=1000)
+
+
+class ItemUpdate(BaseModel):
+    name: str | None = Field(default=None, min_length=1, max_length=200)
+    category: str | None = Field(default=None, min_length=1, max_length=64)
+    price_cents: int | None = Field(default=None, ge=0)
+    description: str | None = Field(default=None, max_length=10000)
+"""service1 アイテムのPydanticスキーマ。
+作成（単体/一括）と部分更新の入力を定義する。"""
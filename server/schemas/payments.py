@@ -0,0 +1,25 @@
+from datetime import datetime
+from typing import Literal
+
+from pydantic import BaseModel, Field
+
+
+InvoiceStatus = Literal["draft", "open", "paid", "void", "refunded"]
+
+
+class InvoiceIn(BaseModel):
+    tenant_id: str = Field(min_length=1, max_length=64)
+    number: str = Field(min_length=1, max_length=64)
+    customer_id: str | None = Field(default=None, max_length=64)
+    status: InvoiceStatus = "open"
+    currency: str = Field(default="JPY", min_length=3, max_length=3)
+    amount_cents: int = Field(ge=0)
+    issued_at: datetime | None = None
+
+
+class RefundIn(BaseModel):
+    invoice_id: int
+    amount_cents: int = Field(gt=0)
+    reason: str | None = Field(default=None, max_length=255)
+"""決済関連のPydanticスキーマ。
+請求書の作成入力と返金リクエストを定義する。"""
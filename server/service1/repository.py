@@ -0,0 +1,171 @@
+"""service1 アイテムのリポジトリ。
+一括作成（INSERT .. RETURNING 1文）、(並べ替え列, id) の行値比較によるキーセットページング、
+要求された列だけを SELECT する射影、カテゴリ/所有者/価格帯での絞り込みを提供する。
+単体取得はプロセス内の読み取りスルーキャッシュ（TTL + LRU）を通し、更新時に該当エントリを破棄する。"""
+import base64
+import json
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple
+
+from sqlalchemy import insert, select, tuple_, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from server.common.metrics import inc_counter
+from server.common.utils.cache import TTLCache
+from server.core.config import settings
+from server.models.item import Item
+from server.schemas.items import ItemIn
+
+
+ITEM_COLUMNS = {
+    c.key: c
+    for c in (Item.id, Item.owner_id, Item.name, Item.category, Item.price_cents, Item.description, Item.created_at)
+}
+FIELDS = tuple(ITEM_COLUMNS)
+# Sort keys backed by an (column, id) index
+SORTS = {"id": Item.id, "name": Item.name, "price_cents": Item.price_cents}
+_SORT_TYPES = {"id": int, "name": str, "price_cents": int}
+
+_cache: TTLCache[Dict[str, Any]] = TTLCache(
+    maxsize=settings.item_cache_max_entries, ttl=settings.item_cache_ttl_seconds
+)
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def parse_fields(fields: Optional[str]) -> Tuple[str, ...]:
+    """``"id,name"`` -> ("id", "name"); None means every field."""
+    if not fields:
+        return FIELDS
+    names = tuple(dict.fromkeys(f.strip() for f in fields.split(",") if f.strip()))
+    unknown = [n for n in names if n not in ITEM_COLUMNS]
+    if unknown or not names:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return names
+
+
+def parse_sort(sort: str) -> Tuple[str, bool]:
+    """``"-price_cents"`` -> ("price_cents", descending)."""
+    key = sort.lstrip("-")
+    if key not in SORTS:
+        raise ValueError(f"Unknown sort: {sort}")
+    return key, sort.startswith("-")
+
+
+def encode_cursor(sort: str, value: Any, item_id: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps([sort, value, item_id]).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, sort: str) -> Tuple[Any, int]:
+    try:
+        decoded = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except ValueError as e:
+        raise ValueError("Invalid cursor") from e
+    if not isinstance(decoded, list) or len(decoded) != 3:
+        raise ValueError("Invalid cursor")
+    key, value, item_id = decoded
+    if key != sort or not isinstance(item_id, int) or not isinstance(value, _SORT_TYPES[sort.lstrip("-")]):
+        raise ValueError("Invalid cursor")
+    return value, item_id
+
+
+def _item(data: Mapping[str, Any]) -> Dict[str, Any]:
+    item = dict(data)
+    if "created_at" in item:
+        item["created_at"] = item["created_at"].replace(tzinfo=timezone.utc).isoformat()
+    return item
+
+
+def _project(item: Mapping[str, Any], fields: Sequence[str]) -> Dict[str, Any]:
+    return {f: item[f] for f in fields}
+
+
+async def create_items(db: AsyncSession, owner_id: int, items: Sequence[ItemIn]) -> List[Dict[str, Any]]:
+    """Insert every item in one statement and commit; returns them in input order."""
+    now = _utcnow()
+    rows = (
+        await db.execute(
+            insert(Item).returning(*ITEM_COLUMNS.values(), sort_by_parameter_order=True),
+            [{**item.model_dump(), "owner_id": owner_id, "created_at": now} for item in items],
+        )
+    ).all()
+    await db.commit()
+    inc_counter("service1_items_created_total", len(rows))
+    return [_item(r._mapping) for r in rows]
+
+
+async def get_item(db: AsyncSession, item_id: int, fields: Sequence[str] = FIELDS) -> Optional[Dict[str, Any]]:
+    """One item; read through the in-process cache unless ``item_cache_ttl_seconds`` is 0."""
+    if settings.item_cache_ttl_seconds <= 0:
+        row = (await db.execute(select(*(ITEM_COLUMNS[f] for f in fields)).where(Item.id == item_id))).first()
+        return _item(row._mapping) if row is not None else None
+    item = _cache.get(item_id)
+    if item is None:
+        inc_counter("service1_item_cache_misses_total")
+        row = (await db.execute(select(*ITEM_COLUMNS.values()).where(Item.id == item_id))).first()
+        if row is None:
+            return None
+        item = _item(row._mapping)
+        _cache.set(item_id, item)
+    else:
+        inc_counter("service1_item_cache_hits_total")
+    return _project(item, fields)
+
+
+async def list_items(
+    db: AsyncSession,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    sort: str = "id",
+    category: Optional[str] = None,
+    owner_id: Optional[int] = None,
+    min_price: Optional[int] = None,
+    max_price: Optional[int] = None,
+    fields: Sequence[str] = FIELDS,
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """One page ordered by ``sort`` (``-`` for descending) then id, and the next page's cursor, if any."""
+    key, descending = parse_sort(sort)
+    column = SORTS[key]
+    # The cursor needs the sort key and id even when they are not projected
+    selected = tuple(dict.fromkeys((*fields, key, "id")))
+    stmt = select(*(ITEM_COLUMNS[f] for f in selected))
+    if category is not None:
+        stmt = stmt.where(Item.category == category)
+    if owner_id is not None:
+        stmt = stmt.where(Item.owner_id == owner_id)
+    if min_price is not None:
+        stmt = stmt.where(Item.price_cents >= min_price)
+    if max_price is not None:
+        stmt = stmt.where(Item.price_cents <= max_price)
+    if cursor is not None:
+        value, after_id = decode_cursor(cursor, sort)
+        position = Item.id if key == "id" else tuple_(column, Item.id)
+        bound = after_id if key == "id" else tuple_(value, after_id)
+        stmt = stmt.where(position < bound if descending else position > bound)
+    if descending:
+        stmt = stmt.order_by(column.desc(), Item.id.desc()) if key != "id" else stmt.order_by(Item.id.desc())
+    else:
+        stmt = stmt.order_by(column, Item.id) if key != "id" else stmt.order_by(Item.id)
+    rows = (await db.execute(stmt.limit(limit + 1))).all()
+    next_cursor = None
+    if len(rows) > limit:
+        last = rows[limit - 1]._mapping
+        next_cursor = encode_cursor(sort, last[key], last["id"])
+    return [_project(_item(r._mapping), fields) for r in rows[:limit]], next_cursor
+
+
+async def update_item(
+    db: AsyncSession, item_id: int, changes: Mapping[str, Any], owner_id: Optional[int] = None
+) -> Optional[Dict[str, Any]]:
+    """Apply ``changes`` (only to ``owner_id``'s item if given) and commit; None if no such item matched."""
+    # The owner check is part of the statement, so there is no read-then-write race
+    match = [Item.id == item_id] if owner_id is None else [Item.id == item_id, Item.owner_id == owner_id]
+    if not changes:
+        row = (await db.execute(select(*ITEM_COLUMNS.values()).where(*match))).first()
+        return _item(row._mapping) if row is not None else None
+    row = (await db.execute(update(Item).where(*match).values(**changes).returning(*ITEM_COLUMNS.values()))).first()
+    await db.commit()
+    _cache.pop(item_id)
+    return _item(row._mapping) if row is not None else None
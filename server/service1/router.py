@@ -1,32 +1,116 @@
 """service1 サンプルサービスのAPIルータ。
-/service1/ 配下で、公開・認証任意・RBAC保護の例を提供する。"""
-from fastapi import APIRouter, Depends
+/service1/ 配下で、公開・認証任意・RBAC（ロール/権限）保護の例と、アイテムリソース
+（一括作成・キーセットページング・射影・絞り込み・読み取りスルーキャッシュ）を提供する。"""
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from server.common.deps import get_optional_user, require_roles
-from server.models.user import User
+from server.common.deps import get_optional_principal, require_permissions, require_roles
+from server.common.principal import Principal
+from server.common.response_cache import cached_response, invalidate
+from server.core.database import get_async_db
+from server.schemas.items import ItemBatchIn, ItemIn, ItemUpdate
+from server.service1 import repository
 
 
-router = APIRouter()
+router = APIRouter(prefix="/service1", tags=["service1"])
 
 
 @router.get("/hello")
-def hello(user: User | None = Depends(get_optional_user)) -> dict:
+def hello(user: Principal | None = Depends(get_optional_principal)) -> dict:
     if user:
         return {"message": f"hello, {user.email}"}
     return {"message": "hello, guest"}
 
 
 @router.get("/items")
-def list_items() -> dict:
-    return {"items": [{"id": 1, "name": "demo"}]}
+@cached_response("service1.items", ttl=5.0)
+async def list_items(
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: str | None = None,
+    sort: str = Query("id", description="id | name | price_cents, prefixed with - for descending"),
+    category: str | None = Query(None, max_length=64),
+    owner_id: int | None = None,
+    min_price: int | None = Query(None, ge=0),
+    max_price: int | None = Query(None, ge=0),
+    fields: str | None = Query(None, description="Comma-separated fields to return"),
+    db: AsyncSession = Depends(get_async_db),
+) -> dict:
+    try:
+        items, next_cursor = await repository.list_items(
+            db,
+            limit=limit,
+            cursor=cursor,
+            sort=sort,
+            category=category,
+            owner_id=owner_id,
+            min_price=min_price,
+            max_price=max_price,
+            fields=repository.parse_fields(fields),
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"items": items, "next_cursor": next_cursor}
 
 
-@router.post("/items")
-def create_item(_: User = Depends(require_roles(["user", "admin"]))) -> dict:
-    return {"created": {"id": 2, "name": "new"}}
+@router.get("/items/{item_id}")
+async def get_item(item_id: int, fields: str | None = None, db: AsyncSession = Depends(get_async_db)) -> dict:
+    try:
+        projection = repository.parse_fields(fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    item = await repository.get_item(db, item_id, projection)
+    if item is None:
+        raise HTTPException(status_code=404, detail="Item not found")
+    return item
+
+
+@router.post("/items", status_code=201)
+async def create_item(
+    payload: ItemIn,
+    db: AsyncSession = Depends(get_async_db),
+    user: Principal = Depends(require_roles(["user", "admin"])),
+) -> dict:
+    (created,) = await repository.create_items(db, user.id, [payload])
+    invalidate("service1.items")
+    return {"created": created}
+
+
+@router.post("/items/batch", status_code=201)
+async def create_items(
+    payload: ItemBatchIn,
+    db: AsyncSession = Depends(get_async_db),
+    user: Principal = Depends(require_roles(["user", "admin"])),
+) -> dict:
+    created = await repository.create_items(db, user.id, payload.items)
+    invalidate("service1.items")
+    return {"created": created}
+
+
+@router.patch("/items/{item_id}")
+async def update_item(
+    item_id: int,
+    payload: ItemUpdate,
+    db: AsyncSession = Depends(get_async_db),
+    user: Principal = Depends(require_roles(["user", "admin"])),
+) -> dict:
+    """Owners may update their items; admins any item."""
+    owner_id = None if "admin" in user.roles else user.id
+    # null clears the description; the other columns are required
+    changes = {k: v for k, v in payload.model_dump(exclude_unset=True).items() if v is not None or k == "description"}
+    item = await repository.update_item(db, item_id, changes, owner_id)
+    if item is None:
+        if owner_id is not None and await repository.get_item(db, item_id, ("id",)) is not None:
+            raise HTTPException(status_code=403, detail="Not the owner of this item")
+        raise HTTPException(status_code=404, detail="Item not found")
+    invalidate("service1.items")
+    return item
 
 
 @router.get("/admin")
-def admin_only(_: User = Depends(require_roles(["admin"]))) -> dict:
+def admin_only(_: Principal = Depends(require_roles(["admin"]))) -> dict:
     return {"ok": True}
 
+
+@router.get("/reports")
+def reports(_: Principal = Depends(require_permissions(["reports:read"]))) -> dict:
+    return {"reports": []}
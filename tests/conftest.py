@@ -0,0 +1,68 @@
+import os
+import tempfile
+
+# Point the app at a throwaway database before server.* is imported.
+_tmpdir = tempfile.mkdtemp(prefix="takachan-test-")
+os.environ.setdefault("APP_SQLITE_PATH", os.path.join(_tmpdir, "test.db"))
+os.environ.setdefault("APP_RATE_LIMIT_MAX", "10000")
+os.environ.setdefault("APP_SECRET_KEY", "test-secret-key")
+os.environ.setdefault("APP_USER_IMPORT_DIR", os.path.join(_tmpdir, "imports"))
+
+import pytest  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+
+from server.core.database import SessionLocal, create_all  # noqa: E402
+from server.main import app  # noqa: E402
+from server.models.user import Role, User  # noqa: E402
+
+create_all()
+
+client = TestClient(app)
+
+
+@pytest.fixture
+def login():
+    """``login(email, password)`` registers the user if needed and returns its auth headers."""
+
+    def _login(email: str, password: str = "secret123") -> dict:
+        client.post("/common/auth/register", json={"email": email, "password": password})
+        r = client.post("/common/auth/login", data={"username": email, "password": password})
+        assert r.status_code == 200, r.text
+        return {"Authorization": f"Bearer {r.json()['access_token']}"}
+
+    return _login
+
+
+@pytest.fixture
+def grant():
+    """``grant(email, role_name)`` adds the role (creating it if needed) straight in the database."""
+
+    def _grant(email: str, role_name: str) -> None:
+        with SessionLocal() as db:
+            user = db.query(User).filter(User.email == email).one()
+            role = db.query(Role).filter(Role.name == role_name).first() or Role(name=role_name)
+            user.roles.append(role)
+            db.commit()
+
+    return _grant
+
+
+@pytest.fixture
+def make_admin(login, grant):
+    def _make_admin(email: str) -> dict:
+        headers = login(email)
+        grant(email, "admin")
+        return headers
+
+    return _make_admin
+
+
+@pytest.fixture
+def make_billing(login, grant):
+    def _make_billing(email: str) -> dict:
+        headers = login(email)
+        grant(email, "billing")
+        return headers
+
+    return _make_billing
+"""pytest 共通設定。\nテスト用の一時DBを設定してテーブルを作成し、ログイン・ロール付与のフィクスチャを提供する。"""
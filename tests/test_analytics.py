@@ -0,0 +1,131 @@
+import io
+import json
+
+from fastapi.testclient import TestClient
+from sqlalchemy import func, select
+
+from server.common import analytics
+from server.core.database import SessionLocal
+from server.main import app
+from server.models.analytics import AnalyticsEvent
+
+
+client = TestClient(app)
+
+
+def _count(name: str) -> int:
+    with SessionLocal() as db:
+        return db.scalar(select(func.count()).select_from(AnalyticsEvent).where(AnalyticsEvent.name == name))
+
+
+def test_ingest_json_array_and_ndjson(login, grant):
+    headers = login("ingest@example.com")
+    grant("ingest@example.com", "analyst")
+
+    r = client.post("/common/analytics/events", json=[{"name": "ingest.click"}] * 3, headers=headers)
+    assert r.status_code == 202 and r.json() == {"accepted": 3}
+    lines = "\n".join(json.dumps({"name": "ingest.view", "properties": {"i": i}}) for i in range(4)) + "\n"
+    r = client.post(
+        "/common/analytics/events",
+        content=lines,
+        headers={**headers, "Content-Type": "application/x-ndjson"},
+    )
+    assert r.status_code == 202 and r.json() == {"accepted": 4}
+
+    analytics.flush_analytics()
+    assert _count("ingest.click") == 3
+    assert _count("ingest.view") == 4
+
+
+def test_ingest_rejects_invalid_lines_and_full_queue(login, grant, monkeypatch):
+    headers = login("ingest-bp@example.com")
+    grant("ingest-bp@example.com", "analyst")
+
+    r = client.post(
+        "/common/analytics/events",
+        content='{"name": "ok"}\n{"nom": "bad"}\n',
+        headers={**headers, "Content-Type": "application/x-ndjson"},
+    )
+    assert r.status_code == 422
+    assert r.json()["detail"][0]["loc"][:2] == ["line", 2]
+    bad_length = {**headers, "Content-Type": "application/json", "Content-Length": "lots"}
+    assert client.post("/common/analytics/events", content=b"[]", headers=bad_length).status_code == 400
+
+    monkeypatch.setattr(analytics._writer, "max_queue", 2)
+    r = client.post("/common/analytics/events", json=[{"name": "ingest.overflow"}] * 5, headers=headers)
+    assert r.status_code == 503 and r.headers["Retry-After"] == "1"
+    analytics.flush_analytics()
+    assert _count("ingest.overflow") == 0
+
+
+def test_rollups_count_and_uniques_per_bucket(login, grant):
+    headers = login("rollup@example.com")
+    grant("rollup@example.com", "analyst")
+    events = [
+        {"name": "rollup.view", "ts": "2026-01-01T10:00:05Z", "session_id": "a"},
+        {"name": "rollup.view", "ts": "2026-01-01T10:00:40Z", "session_id": "b"},
+        {"name": "rollup.view", "ts": "2026-01-01T10:01:10Z", "session_id": "a"},
+        {"name": "rollup.view", "ts": "2026-01-01T11:30:00+01:00", "session_id": "c"},
+        {"name": "rollup.other", "ts": "2026-01-01T10:00:00Z", "session_id": "a"},
+    ]
+    # Two batches so the second one merges into existing buckets
+    assert client.post("/common/analytics/events", json=events[:2], headers=headers).status_code == 202
+    analytics.flush_analytics()
+    assert client.post("/common/analytics/events", json=events[2:], headers=headers).status_code == 202
+    analytics.flush_analytics()
+
+    params = {"start": "2026-01-01T00:00:00Z", "end": "2026-01-02T00:00:00Z", "name": "rollup.view"}
+    minute = client.get("/common/analytics/rollups", params={**params, "granularity": "minute"}, headers=headers).json()
+    (series,) = minute["series"]
+    assert [(b["bucket"], b["count"], b["uniques"]) for b in series["buckets"]] == [
+        ("2026-01-01T10:00:00+00:00", 2, 2),
+        ("2026-01-01T10:01:00+00:00", 1, 1),
+        ("2026-01-01T10:30:00+00:00", 1, 1),
+    ]
+    assert (series["count"], series["uniques"]) == (4, 3)
+
+    day = client.get("/common/analytics/rollups", params={**params, "granularity": "day"}, headers=headers).json()
+    assert [(b["count"], b["uniques"]) for b in day["series"][0]["buckets"]] == [(4, 3)]
+
+    too_wide = {**params, "granularity": "minute", "start": "2000-01-01T00:00:00Z"}
+    assert client.get("/common/analytics/rollups", params=too_wide, headers=headers).status_code == 400
+
+
+def test_export_parquet_or_501_without_pyarrow(login, grant):
+    headers = login("export@example.com")
+    grant("export@example.com", "analyst")
+    client.post("/common/analytics/events", json=[{"name": "export.row", "properties": {"k": 1}}], headers=headers)
+    analytics.flush_analytics()
+
+    r = client.get("/common/analytics/export", params={"name": "export.row"}, headers=headers)
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        assert r.status_code == 501
+        return
+    assert r.status_code == 200 and r.content[:4] == b"PAR1"
+    table = pq.read_table(io.BytesIO(r.content))
+    assert table.column("name").to_pylist() == ["export.row"]
+    assert table.column("properties").to_pylist() == ['{"k": 1}']
+
+
+def test_hyperloglog_estimate_and_merge():
+    from server.common.utils.hll import HyperLogLog
+
+    a, b = HyperLogLog(), HyperLogLog()
+    a.update(range(0, 20000))
+    b.update(range(10000, 30000))
+    assert abs(a.count() - 20000) / 20000 < 0.05
+    restored = HyperLogLog.from_bytes(a.to_bytes())
+    assert abs(restored.merge(b).count() - 30000) / 30000 < 0.05
+
+    # Sketches stored under an older precision setting fold down instead of failing
+    fine, coarse = HyperLogLog(14), HyperLogLog(10)
+    fine.update(range(0, 20000))
+    coarse.update(range(10000, 30000))
+    direct = HyperLogLog(10)
+    direct.update(range(0, 20000))
+    assert fine.fold(10).registers == direct.registers
+    assert HyperLogLog.from_bytes(coarse.to_bytes()).merge(fine).p == 10
+    merged = fine.merge(coarse)
+    assert merged.p == 10 and abs(merged.count() - 30000) / 30000 < 0.1
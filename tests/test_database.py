@@ -0,0 +1,33 @@
+import asyncio
+
+from sqlalchemy import text
+
+from server.common.metrics import REGISTRY
+from server.core.database import AsyncSessionLocal, SessionLocal, engine
+
+
+def _series(name: str) -> dict:
+    return REGISTRY.snapshot()[name]["series"]
+
+
+def test_sqlite_pragmas_and_pool_metrics():
+    with SessionLocal() as db:
+        assert db.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+        assert db.execute(text("PRAGMA synchronous")).scalar() == 1  # NORMAL
+        assert db.execute(text("PRAGMA busy_timeout")).scalar() == 5000
+        assert _series("db_pool_in_use")[("sync",)] >= 1
+    assert _series("db_pool_checkout_seconds")[("sync",)][-1] >= 1
+    assert _series("db_pool_overflow") == {("sync",): 0, ("async",): 0}
+    assert engine.pool.size() == 5
+
+
+def test_async_engine_pool_is_reported_separately():
+    async def query():
+        async with AsyncSessionLocal() as db:
+            await db.execute(text("SELECT 1"))
+            return _series("db_pool_in_use")[("async",)]
+
+    before = _series("db_pool_checkout_seconds").get(("async",), [0])[-1]
+    assert asyncio.run(query()) >= 1
+    assert _series("db_pool_checkout_seconds")[("async",)][-1] == before + 1
+    assert _series("db_pool_in_use")[("async",)] == 0
@@ -0,0 +1,77 @@
+from fastapi.testclient import TestClient
+
+from server.common.metrics import get_metrics
+from server.main import app
+
+
+client = TestClient(app)
+
+
+def _items(**params) -> dict:
+    r = client.get("/service1/items", params=params)
+    assert r.status_code == 200, r.text
+    return r.json()
+
+
+def test_batch_create_and_keyset_pages(login):
+    owner = login("items-owner@example.com")
+    batch = [{"name": f"widget-{i:02d}", "category": "kp", "price_cents": (i * 7) % 10} for i in range(25)]
+    r = client.post("/service1/items/batch", json={"items": batch}, headers=owner)
+    assert r.status_code == 201
+    created = r.json()["created"]
+    assert [c["name"] for c in created] == [b["name"] for b in batch]
+    assert client.post("/service1/items/batch", json={"items": batch}).status_code == 401
+
+    # Every sort walks all rows exactly once, in order, with ties broken by id
+    for sort in ("id", "-id", "price_cents", "-price_cents", "name", "-name"):
+        seen, cursor = [], None
+        while True:
+            params = {"category": "kp", "sort": sort, "limit": 7, "fields": "id,price_cents,name"}
+            page = _items(**params, **({"cursor": cursor} if cursor else {}))
+            seen.extend(page["items"])
+            cursor = page["next_cursor"]
+            if cursor is None:
+                break
+        key = sort.lstrip("-")
+        expected = sorted(created, key=lambda c: (c[key], c["id"]), reverse=sort.startswith("-"))
+        assert [s["id"] for s in seen] == [e["id"] for e in expected], sort
+
+    page = _items(category="kp", min_price=3, max_price=4, fields="name")
+    assert set(page["items"][0]) == {"name"}
+    assert len(page["items"]) == sum(1 for b in batch if 3 <= b["price_cents"] <= 4)
+
+    cursor = _items(category="kp", limit=1)["next_cursor"]
+    assert client.get("/service1/items", params={"sort": "name", "cursor": cursor}).status_code == 400
+    # Valid base64 and JSON, but not a [sort, value, id] triple
+    for bad in ("NQ", "WzFd", "bnVsbA"):
+        assert client.get("/service1/items", params={"cursor": bad}).status_code == 400, bad
+    assert client.get("/service1/items", params={"fields": "id,password"}).status_code == 400
+    assert client.get("/service1/items", params={"sort": "owner_id"}).status_code == 400
+
+
+def test_get_update_and_read_through_cache(login, grant):
+    owner = login("items-editor@example.com")
+    other = login("items-other@example.com")
+    admin = login("items-admin@example.com")
+    grant("items-admin@example.com", "admin")
+    item = client.post(
+        "/service1/items", json={"name": "lamp", "category": "rt", "price_cents": 500, "description": "desk"}, headers=owner
+    ).json()["created"]
+
+    assert client.get(f"/service1/items/{item['id']}").json() == item
+    hits = get_metrics()["counters"].get("service1_item_cache_hits_total", 0)
+    assert client.get(f"/service1/items/{item['id']}", params={"fields": "name,price_cents"}).json() == {
+        "name": "lamp",
+        "price_cents": 500,
+    }
+    assert get_metrics()["counters"]["service1_item_cache_hits_total"] == hits + 1
+
+    assert client.patch(f"/service1/items/{item['id']}", json={"price_cents": 1}, headers=other).status_code == 403
+    r = client.patch(f"/service1/items/{item['id']}", json={"price_cents": 450, "description": None}, headers=owner)
+    assert r.status_code == 200 and r.json()["price_cents"] == 450 and r.json()["description"] is None
+    # The update dropped the cached copy
+    assert client.get(f"/service1/items/{item['id']}").json()["price_cents"] == 450
+    assert client.patch(f"/service1/items/{item['id']}", json={"name": "lamp2"}, headers=admin).json()["name"] == "lamp2"
+
+    assert client.get("/service1/items/999999").status_code == 404
+    assert client.patch("/service1/items/999999", json={"name": "x"}, headers=owner).status_code == 404
@@ -0,0 +1,144 @@
+import json
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+from cryptography.hazmat.primitives import serialization
+from fastapi.testclient import TestClient
+from jose import jwt
+
+from server.core import security
+from server.core.config import DEFAULT_SECRET_KEY
+from server.core.jwt_keys import Keyring, SigningKey, b64url_decode, b64url_encode
+from server.main import app
+
+
+client = TestClient(app)
+
+
+def _pem(key: SigningKey) -> str:
+    return key.public_key.public_bytes(
+        serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo
+    ).decode()
+
+
+@pytest.mark.parametrize("alg", ["ES256", "EdDSA"])
+def test_asymmetric_rotation_and_verify_only_ring(alg):
+    old, new = SigningKey.generate(alg, kid="old"), SigningKey.generate(alg, kid="new")
+    ring = Keyring([old, new], active_kid="old")
+    before = ring.sign({"sub": "1"})
+    ring.active = new
+    after = ring.sign({"sub": "2"})
+    assert json.loads(b64url_decode(after.split(".")[0]))["kid"] == "new"
+    # Both generations verify while the old key stays in the ring
+    assert ring.verify(before) == {"sub": "1"} and ring.verify(after) == {"sub": "2"}
+
+    # An edge node built from the published JWKS verifies without any private key
+    body, _ = ring.jwks_document()
+    edge = Keyring([SigningKey.from_jwk(k) for k in json.loads(body)["keys"]])
+    assert edge.active is None
+    assert edge.verify(after) == {"sub": "2"}
+    if alg == "ES256":
+        assert jwt.decode(after, _pem(new), algorithms=["ES256"]) == {"sub": "2"}
+
+    header, payload, signature = after.split(".")
+    forged_header = b64url_encode(json.dumps({"alg": "HS256", "kid": "new"}).encode())
+    for bad in (f"{header}.{payload}.{signature[:-4]}AAAA", f"{forged_header}.{payload}.{signature}"):
+        with pytest.raises(ValueError):
+            edge.verify(bad)
+    unknown = Keyring([SigningKey.generate(alg, kid="other")]).sign({"sub": "3"})
+    with pytest.raises(ValueError):
+        edge.verify(unknown)
+
+
+def test_jwks_endpoint_cache_headers(monkeypatch):
+    ring = Keyring([SigningKey.generate("EdDSA", kid="ed"), SigningKey.generate("ES256", kid="ec")], active_kid="ed")
+    monkeypatch.setattr(security, "keyring", ring)
+    r = client.get("/common/auth/.well-known/jwks.json")
+    assert r.status_code == 200
+    assert r.headers["cache-control"].startswith("public, max-age=")
+    assert sorted(k["kid"] for k in r.json()["keys"]) == ["ec", "ed"]
+    assert all("d" not in k for k in r.json()["keys"])
+    r2 = client.get("/common/auth/.well-known/jwks.json", headers={"If-None-Match": r.headers["etag"]})
+    assert r2.status_code == 304 and r2.headers["etag"] == r.headers["etag"]
+    etag = r.headers["etag"]
+    for header, status in (
+        (f'"other", W/{etag}', 304),
+        ("*", 304),
+        (f'"x{etag[1:]}', 200),  # contains the tag but is a different one
+        (f'"other{etag}"', 200),
+    ):
+        assert client.get("/common/auth/.well-known/jwks.json", headers={"If-None-Match": header}).status_code == status, header
+
+    # Tokens from the active asymmetric key pass the regular auth path
+    security.clear_token_cache()
+    token = security.create_access_token("5")
+    assert json.loads(b64url_decode(token.split(".")[0]))["alg"] == "EdDSA"
+    assert security.decode_token(token)["sub"] == "5"
+
+
+def test_unkeyed_tokens_only_with_hs256_and_a_real_secret():
+    def ring(**overrides):
+        base = dict(
+            jwt_keys=[], jwt_active_kid=None, jwt_jwks_url=None, jwt_algorithm="ES256",
+            jwt_accept_unkeyed=None, secret_key="a-real-secret", debug=True,
+        )
+        return Keyring.from_settings(SimpleNamespace(**{**base, **overrides}))
+
+    forged = jwt.encode({"sub": "1"}, DEFAULT_SECRET_KEY, algorithm="HS256")
+    assert ring().unkeyed is None
+    assert ring(jwt_algorithm="HS256").unkeyed is not None
+    # Explicitly enabled, but the built-in secret would let anyone mint tokens
+    edge = ring(jwt_accept_unkeyed=True, secret_key=DEFAULT_SECRET_KEY)
+    assert edge.unkeyed is None
+    with pytest.raises(ValueError):
+        edge.verify(forged)
+
+
+def test_jwks_fetch_never_blocks_verification(monkeypatch):
+    signer = Keyring([SigningKey.generate("ES256", kid="remote")])
+    document = json.loads(signer.jwks_document()[0])
+    release, fetches = threading.Event(), []
+
+    def slow_fetch(self):
+        fetches.append(1)
+        release.wait(5)
+        return document
+
+    monkeypatch.setattr(Keyring, "_fetch_jwks", slow_fetch)
+    edge = Keyring([], jwks_url="http://jwks.invalid/keys.json")
+    token = signer.sign({"sub": "9"})
+    start = time.monotonic()
+    for kid in ("remote", "random-1", "random-2"):
+        with pytest.raises(ValueError):
+            edge.verify(token if kid == "remote" else Keyring([SigningKey.generate("ES256", kid=kid)]).sign({}))
+    assert time.monotonic() - start < 1
+    assert len(fetches) == 1  # the fetch started at construction; lookups only read
+
+    release.set()
+    edge._refresh_thread.join(5)
+    assert edge.verify(token) == {"sub": "9"}
+    # A kid that stayed unknown is not fetched again while it is remembered, even once refreshes are allowed
+    edge._next_fetch = 0.0
+    with pytest.raises(ValueError):
+        edge.verify(Keyring([SigningKey.generate("ES256", kid="random-1")]).sign({}))
+    assert len(fetches) == 1
+
+
+def test_asymmetric_algorithm_needs_configured_keys_outside_debug():
+    base = dict(
+        jwt_keys=[], jwt_active_kid=None, jwt_jwks_url=None, jwt_algorithm="EdDSA",
+        jwt_accept_unkeyed=False, secret_key="a-real-secret", debug=False,
+    )
+    # Each worker would mint its own key and reject the others' tokens
+    with pytest.raises(ValueError, match="APP_JWT_KEYS"):
+        Keyring.from_settings(SimpleNamespace(**base))
+    assert Keyring.from_settings(SimpleNamespace(**{**base, "debug": True})).active.alg == "EdDSA"
+    pem = SigningKey.generate("EdDSA").private_key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    ).decode()
+    configured = {"kid": "configured", "alg": "EdDSA", "private_key": pem}
+    assert Keyring.from_settings(SimpleNamespace(**{**base, "jwt_keys": [configured]})).active.kid == "configured"
+    # Edge nodes verify with keys fetched from the signer's JWKS
+    assert Keyring.from_settings(SimpleNamespace(**{**base, "jwt_jwks_url": "http://jwks.invalid/keys.json"})).active is None
@@ -0,0 +1,100 @@
+import json
+import logging
+import time
+
+from fastapi.testclient import TestClient
+
+from server.common.utils.logging_utils import RingBufferHandler
+from server.main import app
+
+
+client = TestClient(app)
+
+
+def test_ring_buffer_seq_cursor_levels_and_overwrite():
+    ring = RingBufferHandler(capacity=4)
+    logger = logging.getLogger("ring.test")
+    logger.addHandler(ring)
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    try:
+        for i in range(6):
+            (logger.warning if i % 2 else logger.info)("m%d", i)
+        assert [r.message for r in ring.read()] == ["m2", "m3", "m4", "m5"]
+        assert [r.seq for r in ring.read(level="WARNING")] == [4, 6]
+        assert [r.message for r in ring.read(since=3, limit=2)] == ["m3", "m4"]
+        # A cursor that fell off the ring resumes at the oldest retained record
+        assert ring.read(since=0, limit=1)[0].seq == 3
+        assert ring.read(since=6) == []
+
+        # Slots keep plain strings: no args, exception or traceback frames stay referenced
+        payload = object()
+        try:
+            raise ValueError("boom")
+        except ValueError:
+            logger.exception("failed with %s", payload)
+        entry = ring._slots[ring.latest_seq % ring.capacity]
+        assert all(isinstance(v, (str, float)) for v in entry)
+        assert "ValueError: boom" in ring.read(limit=1)[0].message
+    finally:
+        logger.removeHandler(ring)
+
+
+def test_logs_endpoint_cursor_prefix_and_tail(login, grant):
+    admin = login("logs-admin@example.com")
+    grant("logs-admin@example.com", "admin")
+    start = client.get("/common/logs", params={"limit": 1}, headers=admin).json()["next_seq"]
+    logging.getLogger("logs.test.a").warning("first")
+    logging.getLogger("logs.test.b").warning("second")
+    logging.getLogger("other").warning("noise")
+
+    r = client.get("/common/logs", params={"since": start, "name": "logs.test."}, headers=admin).json()
+    assert [e["message"] for e in r["logs"]] == ["first", "second"]
+    assert r["next_seq"] == r["logs"][-1]["seq"]
+
+    r = client.get(
+        "/common/logs",
+        params={"since": start, "name": "logs.test.a", "follow": True, "timeout": 0.2},
+        headers=admin,
+    )
+    assert r.headers["content-type"].startswith("application/x-ndjson")
+    assert [json.loads(line)["message"] for line in r.text.splitlines()] == ["first"]
+
+    r = client.get(
+        "/common/logs",
+        params={"since": start, "name": "logs.test.", "follow": True, "format": "sse", "timeout": 0.2},
+        headers=admin,
+    )
+    assert r.headers["content-type"].startswith("text/event-stream")
+    events = [block for block in r.text.split("\n\n") if block]
+    assert events[0].startswith("id: ") and "event: log" in events[0]
+    assert json.loads(events[1].split("data: ", 1)[1])["message"] == "second"
+
+
+def test_queue_pipeline_fans_out_and_counts_drops(tmp_path):
+    import queue
+
+    from server.common.utils import logging_utils
+
+    full = logging_utils.DroppingQueueHandler(queue.SimpleQueue(), maxsize=1)
+    full.handle(logging.makeLogRecord({"msg": "kept"}))
+    full.handle(logging.makeLogRecord({"msg": "dropped"}))
+    assert full.dropped == 1
+
+    jsonl = tmp_path / "app.jsonl"
+    logging_utils.shutdown_logging()
+    try:
+        logging_utils.register_handler(pipeline="queue", jsonl_path=str(jsonl))
+        assert isinstance(logging.getLogger().handlers[-1], logging_utils.DroppingQueueHandler)
+        logging.getLogger("pipeline.test").warning("via %s", "queue")
+        for _ in range(100):
+            if logging_utils.get_logs(name="pipeline.test"):
+                break
+            time.sleep(0.01)
+        assert [e["message"] for e in logging_utils.get_logs(name="pipeline.test")] == ["via queue"]
+    finally:
+        # Stopping the listener drains the queue first
+        logging_utils.shutdown_logging()
+        logging_utils.register_handler()
+    (line,) = jsonl.read_text().splitlines()
+    assert json.loads(line)["message"] == "via queue" and json.loads(line)["level"] == "WARNING"
@@ -0,0 +1,117 @@
+import threading
+
+from fastapi import APIRouter, FastAPI, Request
+from fastapi.testclient import TestClient
+
+from server.common.metrics import (
+    OVERFLOW_LABEL, Exposition, MetricsRegistry, get_metrics, render_prometheus, route_template,
+)
+from server.main import app
+
+
+client = TestClient(app)
+
+
+def test_requests_are_labelled_by_route_template():
+    client.put("/common/auth/users/12345/roles", json={"roles": []})
+    client.get("/no/such/path/abc")
+    metrics = get_metrics()
+    assert "/common/auth/users/{user_id}/roles" in metrics["requests_by_path"]
+    assert not any("12345" in p for p in metrics["requests_by_path"])
+    assert "__unmatched__" in metrics["requests_by_path"]
+    text = render_prometheus()
+    assert 'takachan_http_request_duration_seconds_bucket{method="GET",path="__unmatched__",le="+Inf"}' in text
+
+
+def test_route_template_is_the_routes_own_path_format():
+    router = APIRouter(prefix="/v1/files")
+    seen = []
+
+    @router.get("/{owner}/{file_path:path}")
+    def read_file(request: Request, owner: str, file_path: str) -> dict:
+        seen.append(route_template(request.scope))
+        return {}
+
+    mini = FastAPI()
+    mini.include_router(router)
+    # Slashes inside the path parameter must not shift the prefix
+    assert TestClient(mini).get("/v1/files/alice/a/b/c.txt").status_code == 200
+    assert seen == ["/v1/files/{owner}/{file_path}"]
+
+
+def test_series_cap_and_thread_aggregation():
+    registry = MetricsRegistry(max_series=2)
+    counter = registry.counter("c", labelnames=("k",))
+
+    def work():
+        for i in range(1000):
+            counter.inc((str(i % 5),))
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    series = counter.collect()
+    assert len(series) == 3
+    assert series[(OVERFLOW_LABEL,)] == 4 * 600
+    assert sum(series.values()) == 4000
+
+
+def test_multiprocess_snapshots_are_merged(tmp_path, monkeypatch):
+    for pid in (101, 102):
+        monkeypatch.setattr("os.getpid", lambda pid=pid: pid)
+        worker = MetricsRegistry(multiproc_dir=str(tmp_path))
+        worker.counter("jobs_total").inc(amount=3)
+        worker.histogram("latency_seconds").observe(0.2)
+        worker.write_snapshot()
+    monkeypatch.setattr("os.getpid", lambda: 103)
+    merged = MetricsRegistry(multiproc_dir=str(tmp_path)).snapshot()
+    assert merged["jobs_total"]["series"][()] == 6
+    assert merged["latency_seconds"]["series"][()][-1] == 2
+
+
+def test_gauges_merge_per_mode_and_skip_dead_workers(tmp_path, monkeypatch):
+    for pid, depth in ((101, 2), (102, 5), (103, 7)):
+        monkeypatch.setattr("os.getpid", lambda pid=pid: pid)
+        worker = MetricsRegistry(multiproc_dir=str(tmp_path))
+        worker.counter("jobs_total").inc()
+        worker.gauge("queue_depth").set(depth)
+        worker.gauge("revoked", multiprocess_mode="max").set(depth)
+        worker.gauge("inflight", multiprocess_mode="liveall").set(depth)
+        worker.write_snapshot()
+    monkeypatch.setattr("server.common.metrics._pid_alive", lambda pid: pid != 103)
+    monkeypatch.setattr("os.getpid", lambda: 104)
+    merged = MetricsRegistry(multiproc_dir=str(tmp_path)).snapshot()
+    # The exited worker's counter total stays, its gauges do not
+    assert merged["jobs_total"]["series"][()] == 3
+    assert merged["queue_depth"]["series"][()] == 7
+    assert merged["revoked"]["series"][()] == 5
+    assert merged["inflight"]["labelnames"] == ["pid"]
+    assert merged["inflight"]["series"] == {("101",): 2, ("102",): 5}
+
+
+def test_exposition_rerenders_only_changed_series():
+    registry = MetricsRegistry()
+    counter = registry.counter("jobs_total", "Jobs", ("queue",))
+    for q in ("a", "b", "c"):
+        counter.inc((q,))
+    exposition = Exposition()
+    first = exposition.render(registry.snapshot())
+    assert exposition.rendered_series == 3
+    counter.inc(("b",))
+    second = exposition.render(registry.snapshot())
+    assert exposition.rendered_series == 4
+    assert b'takachan_jobs_total{queue="b"} 2\n' in second
+    assert first.replace(b'queue="b"} 1', b'queue="b"} 2').split(b"\n")[3:] == second.split(b"\n")[3:]
+
+
+def test_openmetrics_and_gzip_negotiation():
+    r = client.get(
+        "/common/metrics/prometheus",
+        headers={"Accept": "application/openmetrics-text; version=1.0.0", "Accept-Encoding": "gzip"},
+    )
+    assert r.headers["content-type"].startswith("application/openmetrics-text")
+    assert r.headers["content-encoding"] == "gzip"
+    assert "# TYPE takachan_http_requests counter" in r.text
+    assert r.text.endswith("# EOF\n")
@@ -0,0 +1,48 @@
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+
+from server.common.metrics import http_requests_path_total
+from server.core.middleware import RequestPipelineMiddleware
+from server.core.rate_limit import RateLimiter
+
+
+def _app(order):
+    app = FastAPI()
+    app.add_middleware(RequestPipelineMiddleware, order=order, limiter=RateLimiter(max_requests=1, window_seconds=60))
+
+    @app.get("/pipeline/{name}")
+    def stream(name: str):
+        return StreamingResponse(iter([b"a", b"b", name.encode()]), media_type="text/plain")
+
+    return TestClient(app)
+
+
+def _count() -> float:
+    series = http_requests_path_total.collect()
+    return series.get(("/pipeline/{name}",), 0) + series.get(("__rate_limited__",), 0)
+
+
+def test_rate_limit_headers_on_streamed_response_and_429():
+    client = _app(("metrics", "rate_limit"))
+    r = client.get("/pipeline/x")
+    assert r.text == "abx"
+    assert r.headers["ratelimit-remaining"] == "0"
+    r = client.get("/pipeline/x")
+    assert r.status_code == 429
+    assert r.json() == {"detail": "Rate limit exceeded"}
+    assert "retry-after" in r.headers
+
+
+def test_order_decides_whether_rejections_are_counted():
+    before = _count()
+    outer = _app(("metrics", "rate_limit"))
+    outer.get("/pipeline/y")
+    outer.get("/pipeline/y")
+    assert _count() - before == 2
+
+    before = _count()
+    inner = _app(("rate_limit", "metrics"))
+    inner.get("/pipeline/y")
+    inner.get("/pipeline/y")
+    assert _count() - before == 1
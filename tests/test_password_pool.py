@@ -0,0 +1,41 @@
+import asyncio
+
+from fastapi.testclient import TestClient
+
+from server.core import security
+from server.core.config import settings
+from server.core.security import hash_password_async, verify_password_async
+from server.main import app
+
+
+client = TestClient(app)
+
+
+def test_hash_and_verify_roundtrip_through_pool():
+    async def roundtrip():
+        hashed = await hash_password_async("s3cret")
+        return await verify_password_async("s3cret", hashed), await verify_password_async("wrong", hashed)
+
+    assert asyncio.run(roundtrip()) == (True, False)
+
+
+def test_saturated_pool_returns_503(monkeypatch):
+    client.post("/common/auth/register", json={"email": "pool@example.com", "password": "secret123"})
+    monkeypatch.setattr(settings, "password_pool_max_queue", 0)
+    r = client.post("/common/auth/login", data={"username": "pool@example.com", "password": "secret123"})
+    assert r.status_code == 503
+    assert r.headers["Retry-After"] == "1"
+    assert "takachan_password_pool_rejected_total" in client.get("/common/metrics/prometheus").text
+
+
+def test_process_pool_starts_workers_without_fork(monkeypatch):
+    monkeypatch.setattr(settings, "password_pool_kind", "process")
+    monkeypatch.setattr(settings, "password_pool_workers", 1)
+    security.shutdown_password_pool()
+    try:
+        security.start_password_pool()
+        pool = security._get_pool()
+        assert pool._mp_context.get_start_method() in ("forkserver", "spawn")
+        assert asyncio.run(verify_password_async("s3cret", security.hash_password("s3cret"))) is True
+    finally:
+        security.shutdown_password_pool()
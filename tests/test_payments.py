@@ -0,0 +1,115 @@
+import csv
+import io
+import json
+from datetime import datetime, timedelta, timezone
+
+from fastapi.testclient import TestClient
+
+from server.common import idempotency
+from server.common.metrics import get_metrics
+from server.core.database import SessionLocal
+from server.main import app
+from server.models.idempotency import IdempotencyKey
+from server.schemas.payments import RefundIn
+
+
+client = TestClient(app)
+
+
+def _user_id(headers: dict) -> int:
+    return client.get("/common/auth/me", headers=headers).json()["id"]
+
+
+def test_invoice_keyset_pages_filters_and_exports(make_billing):
+    headers = make_billing("billing@example.com")
+    base = datetime(2024, 5, 1, tzinfo=timezone.utc)
+    for i in range(7):
+        # Two invoices share each timestamp, so the id tiebreak matters
+        issued = base + timedelta(hours=i // 2)
+        body = {"tenant_id": "acme", "number": f"INV-{i}", "amount_cents": 1000 + i, "issued_at": issued.isoformat()}
+        if i % 3 == 0:
+            body["status"] = "paid"
+        r = client.post("/common/payments/invoices", json=body, headers=headers)
+        assert r.status_code == 201, r.text
+    client.post("/common/payments/invoices", json={"tenant_id": "other", "number": "X-1", "amount_cents": 1}, headers=headers)
+    dup = client.post("/common/payments/invoices", json={"tenant_id": "acme", "number": "INV-0", "amount_cents": 1}, headers=headers)
+    assert dup.status_code == 409
+
+    seen, cursor = [], None
+    while True:
+        params = {"tenant": "acme", "limit": 3, **({"cursor": cursor} if cursor else {})}
+        page = client.get("/common/payments/invoices", params=params, headers=headers).json()
+        seen += [inv["number"] for inv in page["invoices"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert seen == ["INV-6", "INV-5", "INV-4", "INV-3", "INV-2", "INV-1", "INV-0"]
+
+    paid = client.get("/common/payments/invoices", params={"tenant": "acme", "status": "paid"}, headers=headers).json()
+    assert [inv["number"] for inv in paid["invoices"]] == ["INV-6", "INV-3", "INV-0"]
+    bad = client.get("/common/payments/invoices", params={"tenant": "acme", "cursor": "!!"}, headers=headers)
+    assert bad.status_code == 400
+
+    r = client.get("/common/payments/invoices", params={"tenant": "acme", "format": "ndjson"}, headers=headers)
+    assert r.headers["content-type"].startswith("application/x-ndjson")
+    assert [json.loads(line)["number"] for line in r.text.splitlines()] == seen
+    r = client.get("/common/payments/invoices", params={"tenant": "acme", "format": "csv"}, headers=headers)
+    rows = list(csv.DictReader(io.StringIO(r.text)))
+    assert [row["number"] for row in rows] == seen and rows[0]["amount_cents"] == "1006"
+
+
+def test_refund_idempotency_replay_and_limits(make_billing):
+    headers = make_billing("refunds@example.com")
+    r = client.post(
+        "/common/payments/invoices",
+        json={"tenant_id": "refunds", "number": "R-1", "amount_cents": 1000, "status": "paid"},
+        headers=headers,
+    )
+    invoice_id = r.json()["id"]
+    body = {"invoice_id": invoice_id, "amount_cents": 600}
+    keyed = {**headers, "Idempotency-Key": "refund-1"}
+
+    first = client.post("/common/payments/refund", json=body, headers=keyed)
+    assert first.status_code == 201, first.text
+    replays = get_metrics()["counters"].get("idempotency_replays_total", 0)
+    again = client.post("/common/payments/refund", json=body, headers=keyed)
+    assert (again.status_code, again.json()) == (201, first.json())
+    assert again.headers["Idempotent-Replayed"] == "true"
+    # Also replayed from the database once the in-memory entry is gone
+    idempotency.clear_idempotency_cache()
+    assert client.post("/common/payments/refund", json=body, headers=keyed).json() == first.json()
+    assert get_metrics()["counters"]["idempotency_replays_total"] == replays + 2
+
+    other = client.post("/common/payments/refund", json={**body, "amount_cents": 1}, headers=keyed)
+    assert other.status_code == 422
+    # Only 400 left: a second 600 refund is refused, and its key is released for a corrected retry
+    over = client.post("/common/payments/refund", json=body, headers={**headers, "Idempotency-Key": "refund-2"})
+    assert over.status_code == 422
+    fixed = client.post(
+        "/common/payments/refund", json={**body, "amount_cents": 400}, headers={**headers, "Idempotency-Key": "refund-2"}
+    )
+    assert fixed.status_code == 201
+    invoices = client.get("/common/payments/invoices", params={"tenant": "refunds"}, headers=headers).json()["invoices"]
+    assert invoices[0]["refunded_cents"] == 1000
+    # Fully refunded: no longer listed as paid, and nothing more can be refunded
+    assert invoices[0]["status"] == "refunded"
+    paid = client.get("/common/payments/invoices", params={"tenant": "refunds", "status": "paid"}, headers=headers)
+    assert paid.json()["invoices"] == []
+    assert client.post("/common/payments/refund", json={**body, "amount_cents": 1}, headers=headers).status_code == 422
+
+    # A duplicate arriving while the first is still executing is turned away, not executed
+    with SessionLocal() as db:
+        now = datetime.utcnow()
+        db.add(
+            IdempotencyKey(
+                scope=f"refund:{_user_id(headers)}",
+                key="in-flight",
+                request_hash=idempotency.request_hash(RefundIn(**body).model_dump()),
+                status="pending",
+                created_at=now,
+                expires_at=now + timedelta(hours=1),
+            )
+        )
+        db.commit()
+    busy = client.post("/common/payments/refund", json=body, headers={**headers, "Idempotency-Key": "in-flight"})
+    assert busy.status_code == 409 and busy.headers["Retry-After"] == "1"
@@ -0,0 +1,47 @@
+from fastapi.testclient import TestClient
+
+from server.common.permissions import ALL_PERMISSIONS, compile_graph, permission_mask
+from server.main import app
+
+
+client = TestClient(app)
+
+
+def test_compile_expands_inheritance_and_survives_cycles():
+    table = compile_graph(
+        {"viewer": ["docs:read"], "editor": ["docs:write"], "loop-a": ["a"], "loop-b": ["b"]},
+        {"editor": ["viewer"], "owner": ["editor"], "loop-a": ["loop-b"], "loop-b": ["loop-a"]},
+    )
+    assert table.role_masks["owner"] == permission_mask(["docs:read", "docs:write"])
+    assert table.role_masks["viewer"] == permission_mask(["docs:read"])
+    assert table.role_masks["loop-a"] == table.role_masks["loop-b"] == permission_mask(["a", "b"])
+    assert table.role_masks["admin"] == ALL_PERMISSIONS
+    assert table.mask_for(frozenset({"viewer", "loop-a"})) == permission_mask(["docs:read", "a", "b"])
+
+
+def test_require_permissions_follows_role_graph_changes(login, grant):
+    admin = login("perm-admin@example.com")
+    grant("perm-admin@example.com", "admin")
+    client.post("/common/auth/register", json={"email": "perm-editor@example.com", "password": "secret123"})
+    editor = login("perm-editor@example.com")
+    user_id = client.get("/common/auth/me", headers=editor).json()["id"]
+
+    r = client.put("/common/auth/roles/reader", json={"permissions": ["reports:read"]}, headers=admin)
+    assert r.status_code == 200, r.text
+    r = client.put(
+        "/common/auth/roles/report-editor", json={"permissions": ["reports:write"], "inherits": ["reader"]}, headers=admin
+    )
+    assert r.json()["effective_permissions"] == ["reports:read", "reports:write"]
+
+    assert client.get("/service1/reports", headers=editor).status_code == 403
+    client.put(f"/common/auth/users/{user_id}/roles", json={"roles": ["report-editor"]}, headers=admin)
+    assert client.get("/service1/reports", headers=editor).status_code == 200
+    # Superusers pass without any grant
+    assert client.get("/service1/reports", headers=admin).status_code == 200
+
+    # Dropping the inherited grant recompiles the graph and reaches cached principals
+    client.put("/common/auth/roles/reader", json={"permissions": []}, headers=admin)
+    assert client.get("/service1/reports", headers=editor).status_code == 403
+    roles = {r["name"]: r for r in client.get("/common/auth/roles", headers=admin).json()}
+    assert roles["report-editor"]["inherits"] == ["reader"]
+    assert roles["report-editor"]["effective_permissions"] == ["reports:write"]
@@ -0,0 +1,55 @@
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+from server.common.metrics import get_metrics
+from server.common.principal import clear_principal_cache
+from server.core.database import async_engine
+from server.main import app
+
+
+client = TestClient(app)
+
+
+def test_cache_hit_and_invalidation_on_role_change(login, grant):
+    admin = login("cache-admin@example.com")
+    grant("cache-admin@example.com", "admin")
+    member = login("cache-member@example.com")
+
+    # First request populates the cache, second one is served from memory.
+    before = get_metrics()["counters"].get("principal_cache_hits_total", 0)
+    assert client.get("/common/auth/me", headers=member).status_code == 200
+    assert client.get("/common/auth/me", headers=member).status_code == 200
+    assert get_metrics()["counters"]["principal_cache_hits_total"] > before
+
+    # Cached principal has no analyst role yet
+    assert client.post("/common/analytics/events", json=[], headers=member).status_code == 403
+
+    user_id = client.get("/common/auth/me", headers=member).json()["id"]
+    r = client.put(f"/common/auth/users/{user_id}/roles", json={"roles": ["user", "analyst"]}, headers=admin)
+    assert r.status_code == 200, r.text
+    assert sorted(r.json()["roles"]) == ["analyst", "user"]
+
+    # Role change is visible immediately
+    assert client.post("/common/analytics/events", json=[], headers=member).status_code == 202
+
+
+def test_protected_request_costs_one_query(login, grant):
+    headers = login("one-query@example.com")
+    grant("one-query@example.com", "analyst")
+    statements = []
+
+    def count(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    clear_principal_cache()
+    event.listen(async_engine.sync_engine, "before_cursor_execute", count)
+    try:
+        r = client.get("/common/auth/me", headers=headers)
+        assert r.status_code == 200
+        assert sorted(r.json()["roles"]) == ["analyst", "user"]
+        assert len(statements) == 1, statements
+        # Cached afterwards: no query at all
+        client.get("/common/auth/me", headers=headers)
+        assert len(statements) == 1
+    finally:
+        event.remove(async_engine.sync_engine, "before_cursor_execute", count)
@@ -0,0 +1,105 @@
+import asyncio
+import time
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from server.common.metrics import get_metrics
+from server.core.rate_limit import (
+    MemoryRateLimitBackend,
+    RateLimitBackend,
+    RateLimitPolicy,
+    SQLiteRateLimitBackend,
+    RateLimiter,
+    add_rate_limit_middleware,
+)
+
+
+def test_gcra_allows_burst_then_denies_until_emission_interval():
+    limiter = MemoryRateLimitBackend()
+    policy = RateLimitPolicy(limit=3, window=3.0)
+    decisions = [limiter.hit("k", policy, now=100.0) for _ in range(4)]
+    assert [d.allowed for d in decisions] == [True, True, True, False]
+    assert [d.remaining for d in decisions[:3]] == [2, 1, 0]
+    assert decisions[3].retry_after == 1.0
+    assert limiter.hit("k", policy, now=101.0).allowed
+
+
+def test_idle_keys_are_evicted():
+    limiter = MemoryRateLimitBackend(sweep_interval=0)
+    policy = RateLimitPolicy.parse("5/10")
+    for i in range(100):
+        limiter.hit(i, policy, now=0.0)
+    assert len(limiter) == 100
+    limiter.sweep(now=10.0)
+    assert len(limiter) == 0
+
+
+def test_sqlite_backend_shares_limit_between_workers(tmp_path):
+    path = str(tmp_path / "ratelimit.db")
+    worker_a, worker_b = SQLiteRateLimitBackend(path), SQLiteRateLimitBackend(path)
+    policy = RateLimitPolicy(limit=2, window=2.0)
+    assert worker_a.hit(("10.0.0.1", "/x"), policy, now=1000.0).allowed
+    assert worker_b.hit(("10.0.0.1", "/x"), policy, now=1000.0).allowed
+    denied = worker_a.hit(("10.0.0.1", "/x"), policy, now=1000.0)
+    assert not denied.allowed and denied.retry_after == 1.0
+    assert worker_b.hit(("10.0.0.1", "/x"), policy, now=1001.0).allowed
+
+
+def test_middleware_sets_headers_and_route_policy():
+    app = FastAPI()
+    add_rate_limit_middleware(app, RateLimiter(max_requests=100, window_seconds=60, route_limits={"/strict": "1/60"}))
+
+    @app.get("/strict")
+    def strict() -> dict:
+        return {"ok": True}
+
+    client = TestClient(app)
+    r = client.get("/strict")
+    assert r.status_code == 200
+    assert r.headers["RateLimit-Limit"] == "1"
+    assert r.headers["RateLimit-Remaining"] == "0"
+    r = client.get("/strict")
+    assert r.status_code == 429
+    assert int(r.headers["Retry-After"]) >= 1
+
+
+def test_backend_interface_is_abstract():
+    with pytest.raises(TypeError):
+        RateLimitBackend()
+
+
+@pytest.mark.parametrize("shared", [False, True])
+def test_principal_rejection_does_not_charge_route_bucket(tmp_path, shared):
+    backend = SQLiteRateLimitBackend(str(tmp_path / "rl.db")) if shared else MemoryRateLimitBackend()
+    route, principal = RateLimitPolicy(limit=2, window=60.0), RateLimitPolicy(limit=1, window=60.0)
+    first = backend.hit_all([(("c", "/x"), route), (("sub", "1"), principal)], now=1000.0)
+    assert all(d.allowed for d in first)
+    denied = backend.hit_all([(("c", "/x"), route), (("sub", "1"), principal)], now=1000.0)
+    assert denied[0].allowed and not denied[1].allowed
+    # The rejected request left the route bucket with its one remaining slot
+    assert backend.hit(("c", "/x"), route, now=1000.0).remaining == 0
+    assert not backend.hit(("c", "/x"), route, now=1000.0).allowed
+
+
+def test_blocking_backend_runs_off_loop_and_fails_open(tmp_path):
+    class StalledBackend(MemoryRateLimitBackend):
+        blocking = True
+
+        def hit(self, key, policy, now=None):
+            time.sleep(0.5)
+            return super().hit(key, policy, now)
+
+    limiter = RateLimiter(max_requests=1, window_seconds=60, backend=StalledBackend(), backend_timeout=0.02)
+
+    async def run():
+        start = time.perf_counter()
+        decisions = await asyncio.gather(*(limiter.check_async("c", "/x") for _ in range(3)))
+        return decisions, time.perf_counter() - start
+
+    fails = get_metrics()["counters"].get("rate_limit_fail_open_total", 0)
+    decisions, elapsed = asyncio.run(run())
+    assert all(d.allowed for d in decisions) and elapsed < 0.4
+    assert get_metrics()["counters"]["rate_limit_fail_open_total"] == fails + 3
+    limiter.shutdown()
@@ -0,0 +1,62 @@
+from datetime import datetime, timedelta
+
+from fastapi.testclient import TestClient
+
+from server.common import refresh_tokens
+from server.common.metrics import get_metrics
+from server.core.database import SessionLocal
+from server.core.security import decode_token
+from server.main import app
+from server.models.token import RefreshToken
+
+
+client = TestClient(app)
+
+
+def _tokens(email: str, password: str = "secret123") -> dict:
+    client.post("/common/auth/register", json={"email": email, "password": password})
+    r = client.post("/common/auth/login", data={"username": email, "password": password})
+    assert r.status_code == 200, r.text
+    return r.json()
+
+
+def _me(tokens: dict) -> int:
+    return client.get("/common/auth/me", headers={"Authorization": f"Bearer {tokens['access_token']}"}).status_code
+
+
+def test_rotation_and_reuse_revokes_family():
+    first = _tokens("rotate@example.com")
+    second = client.post("/common/auth/refresh", json={"refresh_token": first["refresh_token"]}).json()
+    assert second["refresh_token"] != first["refresh_token"]
+    assert _me(second) == 200
+
+    # Replaying the spent token is treated as theft: the whole family goes, access tokens included
+    reuse = get_metrics()["counters"].get("refresh_token_reuse_total", 0)
+    assert client.post("/common/auth/refresh", json={"refresh_token": first["refresh_token"]}).status_code == 401
+    assert get_metrics()["counters"]["refresh_token_reuse_total"] == reuse + 1
+    assert client.post("/common/auth/refresh", json={"refresh_token": second["refresh_token"]}).status_code == 401
+    assert _me(second) == 401
+
+    # Other logins of the same user are separate families
+    other = _tokens("rotate@example.com")
+    assert _me(other) == 200
+    assert client.post("/common/auth/logout", json={"refresh_token": other["refresh_token"]}).status_code == 204
+    assert _me(other) == 401
+    assert client.post("/common/auth/refresh", json={"refresh_token": other["refresh_token"]}).status_code == 401
+
+
+def test_sync_picks_up_other_workers_and_deletes_expired():
+    tokens = _tokens("sweep@example.com")
+    family = decode_token(tokens["refresh_token"])["fam"]
+    with SessionLocal() as db:
+        row = db.query(RefreshToken).filter(RefreshToken.family_id == family).one()
+        # Revoked by another worker: only the database knows
+        row.revoked_at = datetime.utcnow()
+        expired = datetime.utcnow() - timedelta(days=1)
+        db.add(RefreshToken(jti="expired-jti", family_id="old", user_id=row.user_id, expires_at=expired))
+        db.commit()
+    assert _me(tokens) == 200
+    assert refresh_tokens.sync_revocations() >= 1
+    assert _me(tokens) == 401
+    with SessionLocal() as db:
+        assert db.get(RefreshToken, "expired-jti") is None
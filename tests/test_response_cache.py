@@ -0,0 +1,59 @@
+from fastapi.testclient import TestClient
+
+from server.common.metrics import get_metrics
+from server.common.response_cache import invalidate_all
+from server.main import app
+
+
+client = TestClient(app)
+
+
+def test_etag_and_not_modified():
+    invalidate_all()
+    r = client.get("/common/version")
+    assert r.status_code == 200
+    assert r.json()["name"] == "takachanman unified server"
+    etag = r.headers["etag"]
+    assert etag.startswith('"') and r.headers["cache-control"] == "no-cache"
+
+    again = client.get("/common/version")
+    assert again.content == r.content and again.headers["etag"] == etag
+
+    hits = get_metrics()["counters"].get("response_cache_not_modified_total", 0)
+    r = client.get("/common/version", headers={"If-None-Match": f'"other", {etag}'})
+    assert r.status_code == 304 and r.content == b""
+    assert r.headers["etag"] == etag
+    assert get_metrics()["counters"]["response_cache_not_modified_total"] == hits + 1
+    assert client.get("/common/version", headers={"If-None-Match": '"other"'}).status_code == 200
+
+
+def test_vary_by_principal_keeps_auth(login, grant):
+    first = login("rcache-admin1@example.com")
+    grant("rcache-admin1@example.com", "admin")
+    second = login("rcache-admin2@example.com")
+    grant("rcache-admin2@example.com", "admin")
+    member = login("rcache-member@example.com")
+
+    r = client.get("/common/config", headers=first)
+    assert r.status_code == 200 and r.headers["cache-control"] == "private, no-cache"
+    misses = get_metrics()["counters"]["response_cache_misses_total"]
+    # Another principal gets its own entry; auth still runs on cached routes
+    assert client.get("/common/config", headers=second).status_code == 200
+    assert get_metrics()["counters"]["response_cache_misses_total"] == misses + 1
+    assert client.get("/common/config", headers=member).status_code == 403
+    assert client.get("/common/config", headers={"If-None-Match": r.headers["etag"]}).status_code == 401
+    assert client.get("/common/config", headers={**first, "If-None-Match": r.headers["etag"]}).status_code == 304
+
+
+def test_writer_invalidates(login):
+    user = login("rcache-writer@example.com")
+    etag = client.get("/service1/items").headers["etag"]
+    assert client.get("/service1/items", headers={"If-None-Match": etag}).status_code == 304
+
+    misses = get_metrics()["counters"]["response_cache_misses_total"]
+    item = {"name": "cached", "category": "rcache", "price_cents": 1}
+    assert client.post("/service1/items", json=item, headers=user).status_code == 201
+    r = client.get("/service1/items", headers={"If-None-Match": etag})
+    assert get_metrics()["counters"]["response_cache_misses_total"] == misses + 1
+    # The new item changed the body, so the old ETag no longer matches
+    assert r.status_code == 200 and r.headers["etag"] != etag
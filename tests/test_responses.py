@@ -0,0 +1,56 @@
+import importlib.util
+import json
+from datetime import datetime, timezone
+from uuid import UUID
+
+import pytest
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from fastapi.testclient import TestClient
+
+from server.core import responses
+from server.core.responses import FastJSONResponse, _stdlib_dumps, select_encoder
+from server.main import app, create_app
+
+
+client = TestClient(app)
+
+PAYLOAD = {
+    "events": [
+        {"id": 1, "ts": datetime(2024, 5, 1, 12, 30, 0, 1500), "actor": "テスト", "meta": {"ok": True, "n": None}},
+        {"id": 2, "ts": datetime(2024, 5, 1, tzinfo=timezone.utc), "uuid": UUID(int=7), "ratio": 0.25},
+    ],
+    "next_cursor": None,
+}
+
+
+@pytest.mark.parametrize("name", ["orjson", "msgspec", "stdlib"])
+def test_encoder_matches_default_json_response(name):
+    if name != "stdlib":
+        pytest.importorskip(name)
+    chosen, dumps = select_encoder(name)
+    assert chosen == name
+    assert json.loads(dumps(PAYLOAD)) == json.loads(JSONResponse(jsonable_encoder(PAYLOAD)).body)
+
+
+def test_auto_picks_first_installed_and_falls_back(monkeypatch):
+    installed = [n for n in ("orjson", "msgspec") if importlib.util.find_spec(n) is not None]
+    assert select_encoder("auto")[0] == (installed[0] if installed else "stdlib")
+    assert json.loads(_stdlib_dumps(PAYLOAD)) == json.loads(JSONResponse(jsonable_encoder(PAYLOAD)).body)
+
+    # An encoder whose package is missing falls back to stdlib
+    monkeypatch.setitem(responses._ENCODERS, "orjson", lambda: None)
+    assert select_encoder("orjson")[0] == "stdlib"
+    assert select_encoder("unknown")[0] == "stdlib"
+
+
+def test_large_endpoints_and_app_default(login, grant):
+    admin = login("fastjson-admin@example.com")
+    grant("fastjson-admin@example.com", "admin")
+    r = client.get("/common/audit/events?limit=5", headers=admin)
+    assert r.status_code == 200 and r.headers["content-type"] == "application/json"
+    assert set(r.json()) == {"events", "next_cursor"}
+    assert set(client.get("/common/logs?limit=5", headers=admin).json()) == {"logs", "next_seq"}
+
+    assert create_app(middleware_order=(), fast_json=True).router.default_response_class is FastJSONResponse
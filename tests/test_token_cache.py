@@ -0,0 +1,44 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+from jose import jwt
+
+from server.common.metrics import get_metrics
+from server.core import security
+from server.core.config import settings
+
+
+def test_lean_verify_matches_jose_and_rejects_bad_tokens():
+    token = security.create_access_token("42")
+    assert security._verify_jwt(token) == jwt.decode(token, settings.secret_key, algorithms=["HS256"])
+
+    header, payload, signature = token.split(".")
+    bad = [
+        f"{header}.{payload}.{signature[:-2]}AA",
+        jwt.encode({"sub": "42"}, "other-secret", algorithm="HS256"),
+        jwt.encode({"sub": "42"}, settings.secret_key, algorithm="HS512"),
+        security.create_token("42", "access", expires_minutes=-1),
+        jwt.encode({"sub": 42}, settings.secret_key, algorithm="HS256"),
+        f"{header}.{payload}",
+        "not-a-token",
+    ]
+    for t in bad:
+        with pytest.raises(ValueError):
+            security.decode_token(t)
+
+
+def test_cache_hit_and_exp_respected(monkeypatch):
+    security.clear_token_cache()
+    token = jwt.encode({"sub": "7", "exp": int(time.time()) + 60}, settings.secret_key, algorithm="HS256")
+    hits = get_metrics()["counters"].get("token_cache_hits_total", 0)
+    claims = security.decode_token(token)
+    claims["sub"] = "mutated"  # callers get a copy
+    assert security.decode_token(token)["sub"] == "7"
+    assert get_metrics()["counters"]["token_cache_hits_total"] == hits + 1
+
+    # Past exp the cached entry is not served
+    later = time.time() + 120
+    monkeypatch.setattr(security, "time", SimpleNamespace(time=lambda: later))
+    with pytest.raises(ValueError):
+        security.decode_token(token)
@@ -0,0 +1,119 @@
+import json
+import os
+import stat
+
+from fastapi.testclient import TestClient
+
+from server.common import user_import
+from server.core import security
+from server.core.config import settings
+from server.main import app
+
+
+client = TestClient(app)
+
+
+def _status(job_id: str, headers: dict) -> dict:
+    user_import.wait_idle(timeout=60)
+    r = client.get(f"/common/auth/users/import/{job_id}", headers=headers)
+    assert r.status_code == 200, r.text
+    return r.json()
+
+
+def test_ndjson_import_reports_row_errors(login, make_admin, monkeypatch):
+    monkeypatch.setattr(settings, "user_import_batch_size", 2)
+    admin = make_admin("import-admin@example.com")
+    lines = [
+        {"email": "bulk1@example.com", "password": "pw-one", "roles": ["analyst", "user"]},
+        {"email": "bulk1@example.com", "password": "again"},
+        {"email": "not-an-email", "password": "pw"},
+        {"email": "bulk2@example.com", "password": "pw-two"},
+        {"email": "import-admin@example.com", "password": "taken"},
+    ]
+    body = "\n".join(json.dumps(line) for line in lines) + "\n\n{broken\n"
+    r = client.post(
+        "/common/auth/users/import", content=body, headers={**admin, "Content-Type": "application/x-ndjson"}
+    )
+    assert r.status_code == 202, r.text
+    job = _status(r.json()["id"], admin)
+    assert (job["status"], job["processed"], job["created"], job["failed"]) == ("completed", 6, 2, 4)
+    assert [(e["row"], e["error"].split(":")[0]) for e in job["errors"]] == [
+        (2, "Duplicate email in upload"),
+        (3, "email"),
+        (5, "Email already registered"),
+        (6, "Invalid JSON object"),
+    ]
+
+    # Imported users log in with their own password and roles
+    headers = login("bulk1@example.com", "pw-one")
+    assert sorted(client.get("/common/auth/me", headers=headers).json()["roles"]) == ["analyst", "user"]
+    headers = login("bulk2@example.com", "pw-two")
+    assert client.get("/common/auth/me", headers=headers).json()["roles"] == settings.default_roles
+
+    member = login("import-member@example.com")
+    assert client.post("/common/auth/users/import?format=csv", content="", headers=member).status_code == 403
+
+
+def test_csv_import_resumes_after_failure(login, make_admin, monkeypatch):
+    monkeypatch.setattr(settings, "user_import_batch_size", 2)
+    admin = make_admin("resume-admin@example.com")
+    body = "email,password,roles\n" + "".join(f"csv{i}@example.com,pw{i},billing;user\n" for i in range(5))
+    real = user_import.hash_passwords
+    calls = []
+
+    def flaky(passwords):
+        calls.append(len(passwords))
+        if len(calls) == 2:
+            raise RuntimeError("pool went away")
+        return real(passwords)
+
+    monkeypatch.setattr(user_import, "hash_passwords", flaky)
+    r = client.post("/common/auth/users/import?format=csv", content=body, headers=admin)
+    job_id = r.json()["id"]
+    job = _status(job_id, admin)
+    assert (job["status"], job["processed"], job["created"]) == ("failed", 2, 2)
+    assert "pool went away" in job["message"]
+
+    # Resuming starts at the first uncommitted batch; nothing is inserted twice
+    r = client.post(f"/common/auth/users/import/{job_id}/resume", headers=admin)
+    assert r.status_code == 202
+    job = _status(job_id, admin)
+    assert (job["status"], job["processed"], job["created"], job["failed"]) == ("completed", 5, 5, 0)
+    assert client.post(f"/common/auth/users/import/{job_id}/resume", headers=admin).status_code == 409
+    headers = login("csv4@example.com", "pw4")
+    assert sorted(client.get("/common/auth/me", headers=headers).json()["roles"]) == ["billing", "user"]
+
+
+def test_import_hashes_off_the_login_pool(make_admin, monkeypatch):
+    def no_login_pool():
+        raise AssertionError("imports must not queue on the login password pool")
+
+    admin = make_admin("pool-admin@example.com")
+    monkeypatch.setattr(security, "_get_pool", no_login_pool)
+    body = "".join(json.dumps({"email": f"pool{i}@example.com", "password": f"pw{i}"}) + "\n" for i in range(3))
+    r = client.post("/common/auth/users/import?format=ndjson", content=body, headers=admin)
+    job = _status(r.json()["id"], admin)
+    assert (job["status"], job["created"]) == ("completed", 3)
+
+
+def test_spool_is_private_and_expires(make_admin, monkeypatch):
+    admin = make_admin("spool-admin@example.com")
+    before = set(os.listdir(settings.user_import_dir))
+    monkeypatch.setattr(settings, "user_import_max_bytes", 64)
+    r = client.post("/common/auth/users/import?format=csv", content="x" * 100, headers=admin)
+    assert r.status_code == 413
+    assert set(os.listdir(settings.user_import_dir)) == before
+
+    monkeypatch.setattr(settings, "user_import_max_bytes", 1 << 20)
+    monkeypatch.setattr(user_import, "hash_passwords", lambda passwords: 1 / 0)
+    r = client.post("/common/auth/users/import?format=csv", content="email,password\nspool@example.com,pw\n", headers=admin)
+    job_id = r.json()["id"]
+    assert _status(job_id, admin)["status"] == "failed"
+    path = user_import.spool_path(job_id, "csv")
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+
+    # Kept for /resume until the TTL, then removed and the job can no longer resume
+    assert user_import.purge_expired_spools() == 0 and os.path.exists(path)
+    monkeypatch.setattr(settings, "user_import_spool_ttl_seconds", -1)
+    assert user_import.purge_expired_spools() >= 1 and not os.path.exists(path)
+    assert client.post(f"/common/auth/users/import/{job_id}/resume", headers=admin).status_code == 410